@@ -43,14 +43,12 @@ def task(ctx, config):
                 return prefix + ('a'*fillerlen) + numstr
             objects += [(ns, object_name(i)) for i in  range(num_objects)]
 
-    for ns, name in objects:
-        err = manager.do_put(
-            pool,
-            name,
-            '/etc/resolv.conf',
-            namespace=ns)
-        log.info("err is " + str(err))
-        assert err == 0
+    errors = manager.do_populate(
+        pool,
+        [{'name': name, 'namespace': ns, 'file': '/etc/resolv.conf'}
+         for ns, name in objects])
+    log.info("errors are " + str(errors))
+    assert errors == []
 
     try:
         yield
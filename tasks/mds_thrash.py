@@ -12,6 +12,8 @@ from gevent.event import Event
 from teuthology import misc as teuthology
 
 from tasks.zbkcfs.filesystem import MDSCluster, Filesystem
+from tasks.util.bench import LatencyHistogram
+from tasks.util.wait import Backoff
 
 log = logging.getLogger(__name__)
 
@@ -61,6 +63,18 @@ class MDSThrasher(Greenlet):
       thrasher chooses whether to thrash during that iteration based on a
       random value [0-1] not exceeding the weight of that MDS.
 
+    watch_cluster: [default: false] follow the cluster with "zbkc -w" so
+      that MDS map changes are noticed as they happen rather than on the
+      next poll of the MDS map.
+
+    Every failover is timed, from the kill of the active MDS to the mons
+    marking it laggy or failed (kill_to_laggy), and to its replacement
+    going up:active (kill_to_active); and from the revival of the killed
+    MDS to it becoming a standby again (revive_to_standby).  The MDS map
+    is polled every half second at most, so the timings are accurate to
+    about that, or better with watch_cluster.  Their distributions over
+    the run are recorded in the job summary under 'mds_thrash'.
+
     Examples::
 
 
@@ -92,6 +106,11 @@ class MDSThrasher(Greenlet):
 
     """
 
+    EVENTS = ['kill_to_laggy', 'kill_to_active', 'revive_to_standby']
+
+    # Longest time between two looks at the MDS map while timing a failover
+    POLL_INTERVAL = 0.5
+
     def __init__(self, ctx, manager, config, logger, fs, max_mds):
         super(MDSThrasher, self).__init__()
 
@@ -115,6 +134,9 @@ class MDSThrasher(Greenlet):
         self.max_replay_thrash_delay = float(self.config.get('max_replay_thrash_delay', 4.0))
         self.max_revive_delay = float(self.config.get('max_revive_delay', 10.0))
 
+        self.timings = dict(
+            (event, LatencyHistogram(unit=1e-3)) for event in self.EVENTS)
+
     def _run(self):
         try:
             self.do_thrash()
@@ -166,18 +188,43 @@ class MDSThrasher(Greenlet):
             args.extend(['--hot-standby', standby_for_rank])
         self.ctx.daemons.get_daemon('mds', mds).restart(*args)
 
-    def wait_for_stable(self, rank = None, gid = None):
-        self.log('waiting for mds cluster to stabilize...')
-        status = self.fs.status()
+    def wait_for_map(self, condition, waiting):
+        """
+        Poll the MDS map until condition(status) returns something other
+        than None.
+
+        The map is looked at every POLL_INTERVAL seconds at most, and as
+        soon as it changes if the cluster is being watched.
+
+        :param waiting: what is being waited for, for the log
+        :return: (status, what condition returned)
+        """
+        backoff = Backoff(None, max_interval=self.POLL_INTERVAL)
+        epoch = None
         itercount = 0
         while True:
+            status = self.fs.status(epoch)
+            result = condition(status)
+            if result is not None:
+                return status, result
+            if itercount == 0:
+                self.log('waiting till {waiting}'.format(waiting=waiting))
+            itercount = itercount + 1
+            if itercount % 20 == 0:
+                self.log('mds map: {status}'.format(status=status))
+            epoch = self.fs._wait_for_fsmap_change(backoff.next_interval())
+
+    def wait_for_stable(self, rank = None, gid = None):
+        self.log('waiting for mds cluster to stabilize...')
+
+        def stable(status):
             max_mds = status.get_fsmap(self.fs.id)['mdsmap']['max_mds']
             if rank is not None:
                 try:
                     info = status.get_rank(self.fs.id, rank)
                     if info['gid'] != gid:
                         self.log('mds.{name} has gained rank={rank}, replacing gid={gid}'.format(name = info['name'], rank = rank, gid = gid))
-                        return status, info['name']
+                        return info['name']
                 except:
                     pass # no rank present
             else:
@@ -185,12 +232,16 @@ class MDSThrasher(Greenlet):
                 count = len(ranks)
                 if count >= max_mds:
                     self.log('mds cluster has {count} alive and active, now stable!'.format(count = count))
-                    return status, None
-            itercount = itercount + 1
-            if itercount > 10:
-                self.log('mds map: {status}'.format(status=self.fs.status()))
-            time.sleep(2)
-            status = self.fs.status()
+                    return True
+            return None
+
+        status, result = self.wait_for_map(stable, 'mds cluster is stable')
+        return status, (result if rank is not None else None)
+
+    def record(self, event, started_at):
+        elapsed = time.time() - started_at
+        self.timings[event].record(elapsed)
+        self.log('{event}: {elapsed:.3f}s'.format(event=event, elapsed=elapsed))
 
     def do_thrash(self):
         """
@@ -256,29 +307,27 @@ class MDSThrasher(Greenlet):
                     continue
 
                 self.log('kill {label} (rank={rank})'.format(label=label, rank=rank))
+                killed_at = time.time()
                 self.kill_mds(name)
                 stats['kill'] += 1
 
                 # wait for mon to report killed mds as crashed
-                last_laggy_since = None
-                itercount = 0
-                while True:
-                    status = self.fs.status()
+                def crashed(status):
                     info = status.get_mds(name)
                     if not info:
-                        break
+                        return {}
                     if 'laggy_since' in info:
-                        last_laggy_since = info['laggy_since']
-                        break
+                        return info
                     if any([(f == name) for f in status.get_fsmap(self.fs.id)['mdsmap']['failed']]):
-                        break
-                    self.log(
-                        'waiting till mds map indicates {label} is laggy/crashed, in failed state, or {label} is removed from mdsmap'.format(
-                            label=label))
-                    itercount = itercount + 1
-                    if itercount > 10:
-                        self.log('mds map: {status}'.format(status=status))
-                    time.sleep(2)
+                        return info
+                    return None
+
+                status, info = self.wait_for_map(
+                    crashed,
+                    'mds map indicates {label} is laggy/crashed, in failed state, or {label} is removed from mdsmap'.format(
+                        label=label))
+                self.record('kill_to_laggy', killed_at)
+                last_laggy_since = info.get('laggy_since')
 
                 if last_laggy_since:
                     self.log(
@@ -288,6 +337,19 @@ class MDSThrasher(Greenlet):
 
                 # wait for a standby mds to takeover and become active
                 status, takeover_mds = self.wait_for_stable(rank, gid)
+
+                def active(status):
+                    try:
+                        info = status.get_rank(self.fs.id, rank)
+                    except:
+                        return None # no rank present
+                    if info['gid'] != gid and info['state'] == 'up:active':
+                        return info
+                    return None
+
+                status = self.wait_for_map(
+                    active, 'mds.{_id} is up:active'.format(_id=takeover_mds))[0]
+                self.record('kill_to_active', killed_at)
                 self.log('New active mds is mds.{_id}'.format(_id=takeover_mds))
 
                 # wait for a while before restarting old active to become new
@@ -301,20 +363,26 @@ class MDSThrasher(Greenlet):
                 time.sleep(delay)
 
                 self.log('reviving {label}'.format(label=label))
+                revived_at = time.time()
                 self.revive_mds(name)
 
-                while True:
-                    status = self.fs.status()
+                def standby(status):
                     info = status.get_mds(name)
                     if info and info['state'] in ('up:standby', 'up:standby-replay'):
-                        self.log('{label} reported in {state} state'.format(label=label, state=info['state']))
-                        break
-                    self.log(
-                        'waiting till mds map indicates {label} is in standby or standby-replay'.format(label=label))
-                    time.sleep(2)
+                        return info
+                    return None
+
+                status, info = self.wait_for_map(
+                    standby,
+                    'mds map indicates {label} is in standby or standby-replay'.format(label=label))
+                self.record('revive_to_standby', revived_at)
+                self.log('{label} reported in {state} state'.format(label=label, state=info['state']))
 
         for stat in stats:
             self.log("stat['{key}'] = {value}".format(key = stat, value = stats[stat]))
+        for event in self.EVENTS:
+            self.log("timings['{key}'] = {value}".format(
+                key = event, value = self.timings[event].summary()))
 
              # don't do replay thrashing right now
 #            for info in status.get_replays(self.fs.id):
@@ -398,6 +466,8 @@ def task(ctx, config):
             log.getChild('fs.[{f}]'.format(f = name)),
             Filesystem(ctx, fs['id']), fs['mdsmap']['max_mds']
             )
+        if config.get('watch_cluster', False):
+            thrasher.fs.mon_manager.start_watching()
         thrasher.start()
         thrashers[name] = thrasher
 
@@ -409,6 +479,18 @@ def task(ctx, config):
         for name in thrashers:
             log.info('join thrasher mds_thrasher.fs.[{f}]'.format(f=name))
             thrashers[name].stop()
-            thrashers[name].get()  # Raise any exception from _run()
-            thrashers[name].join()
+            try:
+                thrashers[name].get()  # Raise any exception from _run()
+                thrashers[name].join()
+            finally:
+                if config.get('watch_cluster', False):
+                    thrashers[name].fs.mon_manager.stop_watching()
         log.info('done joining')
+
+        timings = {}
+        for name in thrashers:
+            for event, histogram in thrashers[name].timings.iteritems():
+                timings.setdefault(event, LatencyHistogram(unit=1e-3)).merge(histogram)
+        ctx.summary['mds_thrash'] = dict(
+            (event, histogram.summary()) for event, histogram in timings.iteritems())
+        log.info('mds failover timings: {t}'.format(t=ctx.summary['mds_thrash']))
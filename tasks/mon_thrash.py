@@ -9,7 +9,10 @@ import time
 import gevent
 import json
 import math
+import os
 from teuthology import misc as teuthology
+from util.bench import LatencyHistogram
+from util.wait import Backoff
 
 log = logging.getLogger(__name__)
 
@@ -59,6 +62,21 @@ class MonitorThrasher:
                         in % (default: 0)
     freeze_mon_duration: how many seconds to freeze the mon (default: 15)
     scrub               Scrub after each iteration (default: True)
+    time_elections      Time the elections caused by the thrashing
+                        (default: False)
+
+    With time_elections, every kill, freeze and revive is timed as seen
+    by a monitor that is left alone: how long until it calls an election
+    (quorum_loss), and how long until it is back in a quorum of the
+    expected size (quorum_reform); for a freeze the latter is counted
+    from the thaw.  The monitor is polled every half second at most.  The
+    distributions are recorded in the job summary under 'mon_thrash', and
+    they and every event in the archive as mon_thrash.json.
+
+    So that each election is timed on its own, kills, freezes and revives
+    then happen one after the other, each waiting for the quorum to
+    settle before the next.  Without time_elections freezes overlap the
+    election that follows the kills, as they always have.
 
     Note: if 'store-thrash' is set to True, then 'maintain-quorum' must also
           be set to True.
@@ -81,6 +99,12 @@ class MonitorThrasher:
           all:
             - mon/workloadgen.sh
     """
+    EVENTS = ['kill', 'freeze', 'revive']
+    METRICS = ['quorum_loss', 'quorum_reform']
+
+    # Longest time between two looks at a monitor while timing an election
+    POLL_INTERVAL = 0.5
+
     def __init__(self, ctx, manager, config, logger):
         self.ctx = ctx
         self.manager = manager
@@ -127,6 +151,14 @@ class MonitorThrasher:
             assert self.maintain_quorum, \
                 'store_thrash = true must imply maintain_quorum = true'
 
+        """ Election timings """
+        self.time_elections = self.config.get('time_elections', False)
+        self.events = []
+        self.timings = dict(
+            (event, dict((metric, LatencyHistogram(unit=1e-3))
+                         for metric in self.METRICS))
+            for event in self.EVENTS)
+
         self.thread = gevent.spawn(self.do_thrash)
 
     def log(self, x):
@@ -200,6 +232,121 @@ class MonitorThrasher:
         self.log('reviving mon.{id}'.format(id=mon))
         self.manager.revive_mon(mon)
 
+    def mon_status(self, mon):
+        """
+        Get the status of the monitor specified from its admin socket,
+        which unlike the mon_status command answers during elections.
+        """
+        proc = self.manager.admin_socket('mon', mon, ['mon_status'])
+        return json.loads(proc.stdout.getvalue())
+
+    def election_epoch(self, mon):
+        """
+        Return the last election epoch the monitor specified knows of
+        """
+        return self.mon_status(mon)['election_epoch']
+
+    def wait_for_election(self, mon, epoch, size=None, timeout=300):
+        """
+        Poll the monitor specified until it has called an election since
+        election epoch `epoch` or, if size is given, until it is in a
+        quorum of that size formed since then.
+
+        :return: when that was seen, or None if it was not seen within
+                 timeout seconds
+        """
+        backoff = Backoff(timeout, max_interval=self.POLL_INTERVAL)
+        while True:
+            s = self.mon_status(mon)
+            if s['election_epoch'] > epoch and (size is None or (
+                    s['state'] in ('leader', 'peon') and
+                    len(s['quorum']) == size)):
+                return time.time()
+            if backoff.expired():
+                return None
+            backoff.sleep()
+
+    def record_event(self, event, mons, started_at, lost_at, reformed_at,
+                     reform_from=None):
+        """
+        Record the quorum loss and reformation times of an event
+
+        :param reform_from: when the quorum could start to reform, if not
+                            at started_at
+        """
+        record = {'event': event, 'mons': mons, 'time': started_at}
+        for metric, at, since in [
+                ('quorum_loss', lost_at, started_at),
+                ('quorum_reform', reformed_at, reform_from or started_at)]:
+            if at is None:
+                record[metric] = None
+                continue
+            record[metric] = at - since
+            self.timings[event][metric].record(at - since)
+        self.events.append(record)
+        self.log('{e} of {m}: quorum loss {l}, reformation {r}'.format(
+            e=event, m=mons, l=record['quorum_loss'],
+            r=record['quorum_reform']))
+
+    def thrash_mons(self, event, mons, watch, epoch, size):
+        """
+        Kill or revive monitors and, unless `watch` is None, time the
+        election that follows as seen by that monitor.
+
+        :param epoch: the election epoch before the monitors were touched
+        :param size: the size of the quorum to wait for, or None not to
+        """
+        started_at = None
+        for mon in mons:
+            if event == 'kill':
+                self.log('thrashing mon.{m}'.format(m=mon))
+
+                """ we only thrash stores if we are maintaining quorum """
+                if self.should_thrash_store() and self.maintain_quorum:
+                    self.thrash_store(mon)
+
+            if started_at is None:
+                started_at = time.time()
+            if event == 'kill':
+                self.kill_mon(mon)
+            else:
+                self.revive_mon(mon)
+        if watch is None:
+            return
+        lost_at = self.wait_for_election(watch, epoch)
+        reformed_at = None
+        if lost_at is not None and size is not None:
+            reformed_at = self.wait_for_election(watch, epoch, size)
+        self.record_event(event, mons, started_at, lost_at, reformed_at)
+
+    def freeze_mons(self, mons, watch, size):
+        """
+        Freeze monitors for freeze_mon_duration seconds, timing how long
+        the monitor `watch` takes to call an election and, after the
+        thaw, to be back in a quorum of the given size (unless None).
+        """
+        epoch = watch and self.election_epoch(watch)
+        started_at = time.time()
+        for mon in mons:
+            self.freeze_mon(mon)
+        self.log('waiting for {delay} secs to unfreeze mons'.format(
+            delay=self.freeze_mon_duration))
+        lost_at = None
+        if watch is not None:
+            lost_at = self.wait_for_election(watch, epoch,
+                                             timeout=self.freeze_mon_duration)
+        time.sleep(max(0, started_at + self.freeze_mon_duration - time.time()))
+        thawed_at = time.time()
+        for mon in mons:
+            self.unfreeze_mon(mon)
+        if watch is None:
+            return
+        reformed_at = None
+        if lost_at is not None and size is not None:
+            reformed_at = self.wait_for_election(watch, epoch, size)
+        self.record_event('freeze', mons, started_at, lost_at, reformed_at,
+                          reform_from=thawed_at)
+
     def max_killable(self):
         """
         Return the maximum number of monitors we can kill.
@@ -246,23 +393,22 @@ class MonitorThrasher:
                     mons_to_freeze.append(mon)
             self.log('monitors to freeze: {m}'.format(m=mons_to_freeze))
 
-            for mon in mons_to_kill:
-                self.log('thrashing mon.{m}'.format(m=mon))
-
-                """ we only thrash stores if we are maintaining quorum """
-                if self.should_thrash_store() and self.maintain_quorum:
-                    self.thrash_store(mon)
+            # a monitor left alone to time the elections from
+            untouched = [m for m in mons
+                         if m not in mons_to_kill and m not in mons_to_freeze]
+            watch = None
+            if self.time_elections and untouched:
+                watch = untouched[0]
+            epoch = watch and self.election_epoch(watch)
 
-                self.kill_mon(mon)
+            self.thrash_mons('kill', mons_to_kill, watch, epoch,
+                             len(mons)-len(mons_to_kill)
+                             if self.maintain_quorum else None)
 
             if mons_to_freeze:
-                for mon in mons_to_freeze:
-                    self.freeze_mon(mon)
-                self.log('waiting for {delay} secs to unfreeze mons'.format(
-                    delay=self.freeze_mon_duration))
-                time.sleep(self.freeze_mon_duration)
-                for mon in mons_to_freeze:
-                    self.unfreeze_mon(mon)
+                self.freeze_mons(mons_to_freeze, watch,
+                                 len(mons)-len(mons_to_kill)
+                                 if self.maintain_quorum else None)
 
             if self.maintain_quorum:
                 self.manager.wait_for_mon_quorum_size(len(mons)-len(mons_to_kill))
@@ -277,17 +423,11 @@ class MonitorThrasher:
                 delay=self.revive_delay))
             time.sleep(self.revive_delay)
 
-            for mon in mons_to_kill:
-                self.revive_mon(mon)
+            epoch = watch and self.election_epoch(watch)
+            self.thrash_mons('revive', mons_to_kill, watch, epoch, len(mons))
             # do more freezes
             if mons_to_freeze:
-                for mon in mons_to_freeze:
-                    self.freeze_mon(mon)
-                self.log('waiting for {delay} secs to unfreeze mons'.format(
-                    delay=self.freeze_mon_duration))
-                time.sleep(self.freeze_mon_duration)
-                for mon in mons_to_freeze:
-                    self.unfreeze_mon(mon)
+                self.freeze_mons(mons_to_freeze, watch, len(mons))
 
             self.manager.wait_for_mon_quorum_size(len(mons))
             for m in mons:
@@ -341,3 +481,23 @@ def task(ctx, config):
         thrash_proc.do_join()
         mons = _get_mons(ctx)
         manager.wait_for_mon_quorum_size(len(mons))
+        if thrash_proc.time_elections:
+            save_timings(ctx, thrash_proc)
+
+
+def save_timings(ctx, thrasher):
+    """
+    Record the distributions of the election timings in the job summary,
+    and them and every event in the archive as mon_thrash.json.
+    """
+    timings = dict(
+        (event, dict((metric, histogram.summary())
+                     for metric, histogram in metrics.iteritems()))
+        for event, metrics in thrasher.timings.iteritems())
+    ctx.summary['mon_thrash'] = timings
+    log.info('mon election timings: {t}'.format(t=json.dumps(timings)))
+
+    if ctx.archive is not None:
+        with open(os.path.join(ctx.archive, 'mon_thrash.json'), 'w') as f:
+            json.dump({'timings': timings, 'events': thrasher.events}, f,
+                      indent=2, sort_keys=True)
@@ -8,6 +8,8 @@ import time
 import copy
 import gevent
 
+from util import bench
+
 log = logging.getLogger(__name__)
 
 @contextlib.contextmanager
@@ -22,6 +24,10 @@ def task(ctx, config):
         segments: <number of concurrent benches>
         radosbench: <config for radosbench>
 
+    The results of every radosbench run, across all clients, segments and
+    iterations, are aggregated and recorded as one 'multibench' benchmark
+    (see radosbench).
+
     example:
 
     tasks:
@@ -34,6 +40,7 @@ def task(ctx, config):
     log.info('Beginning multibench...')
     assert isinstance(config, dict), \
         "please list clients to run on"
+    results = {}
 
     def run_one(num):
         """Run test spawn from gevent"""
@@ -42,12 +49,13 @@ def task(ctx, config):
             benchcontext = {}
         else:
             benchcontext = copy.copy(config.get('radosbench'))
+        benchcontext['results'] = results
         iterations = 0
         while time.time() - start < int(config.get('time', 600)):
             log.info("Starting iteration %s of segment %s"%(iterations, num))
             benchcontext['pool'] = str(num) + "-" + str(iterations)
             with radosbench.task(ctx, benchcontext):
-                time.sleep()
+                pass
             iterations += 1
     log.info("Starting %s threads"%(str(config.get('segments', 3)),))
     segments = [
@@ -58,3 +66,6 @@ def task(ctx, config):
         yield
     finally:
         [i.get() for i in segments]
+        bench.save_results(ctx, 'multibench',
+                           bench.aggregate_radosbench(results.values()),
+                           results)
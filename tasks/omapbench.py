@@ -6,6 +6,7 @@ import logging
 
 from teuthology.orchestra import run
 from teuthology import misc as teuthology
+from util import bench
 
 log = logging.getLogger(__name__)
 
@@ -26,6 +27,10 @@ def task(ctx, config):
 		      increment: <interval to show in histogram (in ms)>
 		      omaptype: <how the omaps should be generated>
 
+    The latencies reported by each client, and the overall rate of object
+    map writes, are recorded in the job summary under 'benchmarks' and in
+    the archive under bench/.
+
     example::
 
 		  tasks:
@@ -71,6 +76,7 @@ def task(ctx, config):
                           ]).format(tdir=testdir),
                 ],
             logger=log.getChild('omapbench.{id}'.format(id=id_)),
+            stdout=bench.BenchOutput(log.getChild('omapbench.{id}'.format(id=id_))),
             stdin=run.PIPE,
             wait=False
             )
@@ -81,3 +87,9 @@ def task(ctx, config):
     finally:
         log.info('joining omapbench')
         run.wait(omapbench.itervalues())
+
+        results = dict((id_, bench.parse_omapbench(proc.stdout.getvalue()))
+                       for id_, proc in omapbench.iteritems())
+        bench.save_results(ctx, 'omapbench',
+                           bench.aggregate_omapbench(results.values()),
+                           results)
@@ -1,12 +1,19 @@
 """
 Remotely run peering tests.
 """
+import calendar
+import datetime
 import logging
+import re
 import time
 
+import gevent
+from gevent.event import Event
+
 log = logging.getLogger(__name__)
 
 from args import argify
+from util.bench import LatencyHistogram
 
 POOLNAME = "POOLNAME"
 ARGS = [
@@ -16,9 +23,108 @@ ARGS = [
     ('num_objects', 'objects to create', 256 * 1024, int),
     ('object_size', 'size in bytes for objects', 64, int),
     ('creation_time_limit', 'time limit for pool population', 60*60, int),
-    ('create_threads', 'concurrent writes for create', 256, int)
+    ('create_threads', 'concurrent writes for create', 256, int),
+    ('stats_interval', 'seconds between pg stats polls while peering', 1, int)
     ]
 
+# For each transition timed, the pg stats stamps it can be read from, the
+# most accurate first.  last_peered and last_active are refreshed for as
+# long as the pg stays peered or active, so they are only good as of the
+# first time they are seen after the start; when they are needed, the pg
+# stats are polled while the pgs peer.
+TRANSITIONS = [
+    ('peered', ['last_became_peered', 'last_peered']),
+    ('active', ['last_became_active', 'last_active']),
+    ('clean', []),
+]
+
+
+def parse_stamp(stamp):
+    """
+    Seconds since the epoch of a stamp from a json dump, e.g.
+    "2016-06-01 10:00:00.123456".  Stamps are only ever subtracted from
+    each other, so their timezone does not matter.
+    """
+    when = datetime.datetime.strptime(stamp[:19].replace('T', ' '),
+                                      '%Y-%m-%d %H:%M:%S')
+    fraction = re.match(r'\.(\d+)', stamp[19:])
+    return (calendar.timegm(when.timetuple()) +
+            (float('0' + fraction.group(0)) if fraction else 0))
+
+
+def stamp_is_set(stamp):
+    """
+    Whether a stamp from a json dump was ever set; unset ones are dumped
+    as seconds since the epoch, e.g. "0.000000".
+    """
+    return bool(stamp) and not stamp.startswith('0.')
+
+
+class PGTransitionTimes(object):
+    """
+    How long after the start each pg of a pool that maps to an osd took
+    to become peered, active and clean, from the stamps in its pg stats.
+
+    Only stats reported at or after the osdmap epoch of the start are
+    used, so that stamps left over from the previous interval are not
+    taken for transitions.
+    """
+    def __init__(self, pool_num, osd, start, epoch):
+        self.prefix = '{0}.'.format(pool_num)
+        self.osd = osd
+        self.start = start
+        self.epoch = epoch
+        self.times = {}
+        # whether the pg stats lack the last_became_* stamps, so that the
+        # fallbacks are used and the stats need polling
+        self.uses_fallbacks = False
+
+    def update(self, pg_stats):
+        """
+        Take the times of any transitions not yet seen from pg_stats.
+        """
+        for pg in pg_stats:
+            if not pg['pgid'].startswith(self.prefix):
+                continue
+            if any(fields and fields[0] not in pg
+                   for _, fields in TRANSITIONS):
+                self.uses_fallbacks = True
+            if (self.osd not in pg.get('up', []) or
+                    int(pg.get('reported_epoch', 0)) < self.epoch):
+                continue
+            times = self.times.setdefault(pg['pgid'], {})
+            for name, fields in TRANSITIONS:
+                if name in times:
+                    continue
+                if name == 'clean':
+                    # last_clean keeps being refreshed too, but the last
+                    # change of state of a clean pg is it becoming clean
+                    stamp = None
+                    if 'active' in pg['state'] and 'clean' in pg['state']:
+                        stamp = pg.get('last_change')
+                else:
+                    stamp = next((pg[f] for f in fields
+                                  if stamp_is_set(pg.get(f))), None)
+                if not stamp_is_set(stamp):
+                    continue
+                elapsed = parse_stamp(stamp) - self.start
+                if elapsed >= 0:
+                    times[name] = elapsed
+
+    def histograms(self):
+        """
+        :return: dict of transition name to LatencyHistogram of the pgs
+        """
+        result = {}
+        for name, _ in TRANSITIONS:
+            hist = LatencyHistogram()
+            for times in self.times.itervalues():
+                if name in times:
+                    hist.record(times[name])
+            result[name] = hist
+        return result
+
+
 def setup(ctx, config):
     """
     Setup peering test on remotes.
@@ -35,37 +141,82 @@ def setup(ctx, config):
         config.create_threads)
     log.info("done populating pool")
 
+def poll_pg_stats(manager, pg_times, interval, stopping):
+    """
+    Update pg_times from the pg stats every interval seconds until
+    stopping is set.
+    """
+    while not stopping.wait(interval):
+        pg_times.update(manager.get_pg_stats())
+
 def do_run(ctx, config):
     """
     Perform the test.
+
+    Besides the wall clock times to active (writes to every pg succeed)
+    and to clean, the time each pg took to become peered, active and
+    clean is taken from its pg stats, relative to the 'modified' stamp of
+    the osdmap that marked the osd in.  The pg stamps come from the clock
+    of each pg's primary and the osdmap one from the clock of the leader
+    mon, so the pg times are off by the clock skew between their hosts;
+    they are only exact when the cluster runs on a single host.
+
+    If the pg stats lack the last_became_* stamps, they are polled every
+    stats_interval seconds until the pgs are clean, and the peered and
+    active times are then only good to within that interval.
+
+    :return: the times, and histograms of the pg times
     """
     start = time.time()
     # mark in osd
     manager = ctx.managers['zbkc']
     manager.mark_in_osd(0)
-    log.info("writing out objects")
-    manager.rados_write_objects(
-        POOLNAME,
-        config.num_pgs, # write 1 object per pg or so
-        1,
-        config.creation_time_limit,
-        config.num_pgs, # lots of concurrency
-        cleanup = True)
-    peering_end = time.time()
+    osd_dump = manager.get_osd_dump_json()
+    pg_times = PGTransitionTimes(manager.get_pool_num(POOLNAME), 0,
+                                 parse_stamp(osd_dump['modified']),
+                                 osd_dump['epoch'])
+    pg_times.update(manager.get_pg_stats())
+    stopping = Event()
+    poller = None
+    if pg_times.uses_fallbacks:
+        poller = gevent.spawn(poll_pg_stats, manager, pg_times,
+                              config.stats_interval, stopping)
+    try:
+        log.info("writing out objects")
+        manager.rados_write_objects(
+            POOLNAME,
+            config.num_pgs, # write 1 object per pg or so
+            1,
+            config.creation_time_limit,
+            config.num_pgs, # lots of concurrency
+            cleanup = True)
+        peering_end = time.time()
 
-    log.info("peering done, waiting on recovery")
-    manager.wait_for_clean()
+        log.info("peering done, waiting on recovery")
+        manager.wait_for_clean()
 
-    log.info("recovery done")
-    recovery_end = time.time()
+        log.info("recovery done")
+        recovery_end = time.time()
+    finally:
+        stopping.set()
+        if poller is not None:
+            poller.get()
+    pg_times.update(manager.get_pg_stats())
     if config.max_time:
         assert(peering_end - start < config.max_time)
     manager.mark_out_osd(0)
     manager.wait_for_clean()
-    return {
+
+    histograms = pg_times.histograms()
+    result = {
         'time_to_active': peering_end - start,
-        'time_to_clean': recovery_end - start
+        'time_to_clean': recovery_end - start,
+        'num_pgs': len(pg_times.times),
         }
+    for name, hist in histograms.iteritems():
+        result['pg_time_to_' + name] = hist.summary()
+        log.info("pg time to {0}: {1}".format(name, result['pg_time_to_' + name]))
+    return result, histograms
 
 @argify("peering_speed_test", ARGS)
 def task(ctx, config):
@@ -77,11 +228,18 @@ def task(ctx, config):
     manager.mark_out_osd(0)
     manager.wait_for_clean()
     ret = []
+    histograms = {}
     for i in range(config.runs):
         log.info("Run {i}".format(i = i))
-        ret.append(do_run(ctx, config))
+        result, run_histograms = do_run(ctx, config)
+        ret.append(result)
+        for name, hist in run_histograms.iteritems():
+            histograms.setdefault(name, LatencyHistogram()).merge(hist)
 
     manager.mark_in_osd(0)
-    ctx.summary['recovery_times'] = {
+    summary = {
         'runs': ret
         }
+    for name, hist in histograms.iteritems():
+        summary['pg_time_to_' + name] = hist.summary()
+    ctx.summary['recovery_times'] = summary
@@ -3,9 +3,11 @@ Rados benchmarking
 """
 import contextlib
 import logging
+import time
 
 from teuthology.orchestra import run
 from teuthology import misc as teuthology
+from util import bench
 
 log = logging.getLogger(__name__)
 
@@ -30,6 +32,11 @@ def task(ctx, config):
           m: 1
           ruleset-failure-domain: osd
         cleanup: false (defaults to true)
+
+    The per-second bandwidth, IOPS and latency reported by each client
+    are aggregated and recorded in the job summary under 'benchmarks',
+    and with every client's samples in the archive under bench/.
+
     example:
 
     tasks:
@@ -43,6 +50,7 @@ def task(ctx, config):
     assert isinstance(config, dict), \
         "please list clients to run on"
     radosbench = {}
+    started_at = {}
 
     testdir = teuthology.get_testdir(ctx)
     manager = ctx.managers['zbkc']
@@ -73,6 +81,7 @@ def task(ctx, config):
             else:
                 pool = manager.create_pool_with_unique_name(erasure_code_profile_name=profile_name)
 
+        started_at[id_] = time.time()
         proc = remote.run(
             args=[
                 "/bin/sh", "-c",
@@ -88,6 +97,7 @@ def task(ctx, config):
                           ] + cleanup).format(tdir=testdir),
                 ],
             logger=log.getChild('radosbench.{id}'.format(id=id_)),
+            stdout=bench.BenchOutput(log.getChild('radosbench.{id}'.format(id=id_))),
             stdin=run.PIPE,
             wait=False
             )
@@ -100,5 +110,19 @@ def task(ctx, config):
         log.info('joining radosbench (timing out after %ss)', timeout)
         run.wait(radosbench.itervalues(), timeout=timeout)
 
+        results = dict(
+            (id_, bench.parse_radosbench(proc.stdout.getvalue(), started_at[id_]))
+            for id_, proc in radosbench.iteritems())
+        collect = config.get('results')
+        if collect is not None:
+            # multibench combines the results of all its benches
+            collect.update(
+                ('{0}.{1}'.format(pool, id_), result)
+                for id_, result in results.iteritems())
+        else:
+            bench.save_results(ctx, 'radosbench',
+                               bench.aggregate_radosbench(results.values()),
+                               results)
+
         if pool is not 'data' and create_pool:
             manager.remove_pool(pool)
@@ -3,16 +3,19 @@ Rados benchmarking sweep
 """
 import contextlib
 import logging
-import re
+import math
+import time
 
-from cStringIO import StringIO
 from itertools import product
 
 from teuthology.orchestra import run
 from teuthology import misc as teuthology
+from util import bench
 
 log = logging.getLogger(__name__)
 
+MODES = ['write', 'seq', 'rand']
+
 
 @contextlib.contextmanager
 def task(ctx, config):
@@ -23,12 +26,22 @@ def task(ctx, config):
     iteration. If given, the min and max values below create a range, e.g.
     min_replicas=1 and max_replicas=3 implies executing with 1-3 replicas.
 
+    All clients run rados bench at the same time at every point of the
+    sweep, and their throughput is summed.  Read modes (seq, rand) read
+    back what was written to the pool by the write mode; if write is not
+    among the modes, the pool is filled by a write bench that is not
+    recorded.  The same pool is used for every mode and concurrency with
+    a given size, number of replicas and number of pgs.
+
     Parameters:
 
-        clients: [client list]
+        clients: [client list] (default=[client.0])
         time: seconds to run (default=120)
         sizes: [list of object sizes] (default=[4M])
-        mode: <write|read|seq> (default=write)
+        modes: [list of write, seq (or read), rand] (default=[write])
+        concurrency: [list of concurrent ops per client, rados bench -t]
+                     (default=[16])
+        pg_nums: [list of number of pgs of the pool] (default=[16])
         repetitions: execute the same configuration multiple times (default=1)
         min_num_replicas: minimum number of replicas to use (default = 3)
         max_num_replicas: maximum number of replicas to use (default = 3)
@@ -39,14 +52,27 @@ def task(ctx, config):
           - rep: execution number (takes values from 'repetitions')
           - num_osd: number of osds for pool
           - num_replica: number of replicas
-          - avg_throughput: throughput
+          - num_pg: number of pgs of the pool
+          - num_client: number of clients
+          - mode: write, seq or rand
+          - size: object size
+          - concurrency: concurrent ops per client
+          - avg_throughput: throughput (MB/s) summed over the clients
+          - avg_iops: iops summed over the clients
           - avg_latency: latency
+          - p99_latency: 99th percentile of the per-second latencies
           - stdev_throughput:
           - stdev_latency:
 
+    Every point is also recorded in the job summary under 'benchmarks'
+    and in the archive under bench/ (see radosbench).
+
     Example:
     - radsobenchsweep:
-        columns: [rep, num_osd, num_replica, avg_throughput, stdev_throughput]
+        clients: [client.0, client.1]
+        modes: [write, seq, rand]
+        concurrency: [1, 16, 64]
+        columns: [mode, concurrency, num_replica, avg_throughput, stdev_throughput]
     """
     log.info('Beginning radosbenchsweep...')
     assert isinstance(config, dict), 'expecting dictionary for configuration'
@@ -54,13 +80,20 @@ def task(ctx, config):
     # get and validate config values
     # {
 
-    # only one client supported for now
-    if len(config.get('clients', [])) != 1:
-        raise Exception("Only one client can be specified")
-
-    # only write mode
-    if config.get('mode', 'write') != 'write':
-        raise Exception("Only 'write' mode supported for now.")
+    clients = config.get('clients', ['client.0'])
+    if len(clients) == 0:
+        raise Exception("At least one client must be specified")
+
+    # 'mode' was the only choice of mode before 'modes'
+    modes = config.get('modes', [config.get('mode', 'write')])
+    # rados bench calls a sequential read 'seq'
+    modes = list(set('seq' if mode == 'read' else mode for mode in modes))
+    for mode in modes:
+        if mode not in MODES:
+            raise Exception("Unknown mode {0}, expected one of {1}".format(
+                mode, MODES))
+    # writes go first so that reads have something to read
+    modes = sorted(modes, key=MODES.index)
 
     # OSDs
     total_osds_in_cluster = teuthology.num_instances_of_type(ctx.cluster, 'osd')
@@ -87,8 +120,11 @@ def task(ctx, config):
         raise Exception('max_num_replicas cannot be greater than max_num_osds')
     replicas = range(min_num_replicas, (max_num_replicas + 1))
 
-    # object size
-    sizes = config.get('size', [4 << 20])
+    # object size ('size' is what this used to be called)
+    sizes = config.get('sizes', config.get('size', [4 << 20]))
+
+    concurrencies = config.get('concurrency', [16])
+    pg_nums = config.get('pg_nums', [16])
 
     # repetitions
     reps = range(config.get('repetitions', 1))
@@ -107,30 +143,39 @@ def task(ctx, config):
     current_osds_out = 0
 
     # sweep through all parameters
-    for osds_out, size, replica, rep in product(osds, sizes, replicas, reps):
+    for osds_out in osds:
 
         osds_in = total_osds_in_cluster - osds_out
 
-        if osds_in == 0:
+        if osds_in == 0 or osds_in < min_num_osds:
             # we're done
             break
 
         if current_osds_out != osds_out:
-            # take an osd out
+            # take an osd out; the data only needs to have moved, not the
+            # whole cluster to be healthy
             ctx.manager.raw_cluster_cmd(
                 'osd', 'reweight', str(osds_out-1), '0.0')
-            wait_until_healthy(ctx, config)
+            ctx.manager.wait_for_clean()
             current_osds_out = osds_out
 
         if osds_in not in range(min_num_osds, (max_num_osds + 1)):
             # no need to execute with a number of osds that wasn't requested
             continue
 
-        if osds_in < replica:
-            # cannot execute with more replicas than available osds
-            continue
+        for size, replica, pg_num in product(sizes, replicas, pg_nums):
+            if osds_in < replica:
+                # cannot execute with more replicas than available osds
+                continue
 
-        run_radosbench(ctx, config, f, osds_in, size, replica, rep)
+            params = {
+                'num_osd': osds_in,
+                'size': size,
+                'num_replica': replica,
+                'num_pg': pg_num,
+                'num_client': len(clients),
+            }
+            sweep_pool(ctx, config, f, params, modes, concurrencies, reps)
 
     f.close()
 
@@ -140,7 +185,9 @@ def task(ctx, config):
 def get_csv_header(conf):
     all_columns = [
         'rep', 'num_osd', 'num_replica', 'avg_throughput',
-        'avg_latency', 'stdev_throughput', 'stdev_latency'
+        'avg_latency', 'stdev_throughput', 'stdev_latency',
+        'num_pg', 'num_client', 'mode', 'size', 'concurrency',
+        'avg_iops', 'p99_latency',
     ]
     given_columns = conf.get('columns', None)
     if given_columns and len(given_columns) != 0:
@@ -153,19 +200,71 @@ def get_csv_header(conf):
         return ','.join(all_columns)
 
 
-def run_radosbench(ctx, config, f, num_osds, size, replica, rep):
-    pool = ctx.manager.create_pool_with_unique_name()
+def sweep_pool(ctx, config, f, params, modes, concurrencies, reps):
+    """
+    Run every mode, concurrency and repetition against one pool.
+    """
+    pool = ctx.manager.create_pool_with_unique_name(pg_num=params['num_pg'])
+
+    ctx.manager.set_pool_property(pool, 'size', params['num_replica'])
+
+    ctx.manager.wait_for_clean()
+
+    if 'write' not in modes:
+        log.info('Filling pool {0} for reads'.format(pool))
+        run_radosbench(ctx, config, pool, 'write', params['size'],
+                       max(concurrencies))
+
+    for mode, concurrency, rep in product(modes, concurrencies, reps):
+        log.info('Executing with parameters: ')
+        for key, value in sorted(params.items()):
+            log.info('  {0} = {1}'.format(key, value))
+        log.info('  mode = {0}'.format(mode))
+        log.info('  concurrency = {0}'.format(concurrency))
+        log.info('  repetition = {0}'.format(rep))
+
+        results = run_radosbench(ctx, config, pool, mode, params['size'],
+                                 concurrency)
+        aggregate = bench.aggregate_radosbench(results.values())
+        point = dict(params, mode=mode, concurrency=concurrency, rep=rep)
+        bench.save_results(ctx, 'radosbenchsweep',
+                           dict(aggregate, **point), results)
+
+        # The clients ran at the same time, so their throughputs add up.
+        # The stdev of the latency is pooled over all their ops.
+        summaries = [r['summary'] for r in results.values()]
+        total_ops = sum(s.get('total_ops', 0) for s in summaries)
+        all_values = dict(
+            (key, str(value)) for key, value in point.items())
+        all_values.update({
+            'avg_throughput': str(sum(s.get('bandwidth', 0) for s in summaries)),
+            'stdev_throughput': str(aggregate['bandwidth'].get('stdev', 0)),
+            'avg_iops': str(sum(s.get('average_iops', 0) for s in summaries)),
+            'avg_latency': str(aggregate['latency'].get('mean', 0)),
+            'p99_latency': str(aggregate['latency'].get('p99', 0)),
+            'stdev_latency': str(math.sqrt(
+                sum(s.get('stddev_latency', 0) ** 2 * s.get('total_ops', 0)
+                    for s in summaries) / total_ops) if total_ops else 0),
+        })
+        values_to_write = []
+        for column in config['columns']:
+            values_to_write.extend([all_values[column]])
+        f.write(','.join(values_to_write) + '\n')
+
+    ctx.manager.remove_pool(pool)
 
-    ctx.manager.set_pool_property(pool, 'size', replica)
 
-    wait_until_healthy(ctx, config)
+def run_radosbench(ctx, config, pool, mode, size, concurrency):
+    """
+    Run rados bench on all the clients at once.
 
-    log.info('Executing with parameters: ')
-    log.info('  num_osd =' + str(num_osds))
-    log.info('  size =' + str(size))
-    log.info('  num_replicas =' + str(replica))
-    log.info('  repetition =' + str(rep))
+    Each client has its own run name, so that in the read modes it reads
+    back the objects it wrote itself.
 
+    :return: dict of client id to parsed results (see util.bench)
+    """
+    procs = {}
+    started_at = {}
     for role in config.get('clients', ['client.0']):
         assert isinstance(role, basestring)
         PREFIX = 'client.'
@@ -173,49 +272,32 @@ def run_radosbench(ctx, config, f, num_osds, size, replica, rep):
         id_ = role[len(PREFIX):]
         (remote,) = ctx.cluster.only(role).remotes.iterkeys()
 
-        proc = remote.run(
-            args=[
-                'adjust-ulimits',
-                'zbkc-coverage',
-                '{}/archive/coverage'.format(teuthology.get_testdir(ctx)),
-                'rados',
-                '--no-log-to-stderr',
-                '--name', role,
-                '-b', str(size),
-                '-p', pool,
-                'bench', str(config.get('time', 120)), 'write',
-            ],
+        args = [
+            'adjust-ulimits',
+            'zbkc-coverage',
+            '{}/archive/coverage'.format(teuthology.get_testdir(ctx)),
+            'rados',
+            '--no-log-to-stderr',
+            '--name', role,
+            '--run-name', role,
+            '-t', str(concurrency),
+            '-p', pool,
+        ]
+        if mode == 'write':
+            args.extend(['-b', str(size), '--no-cleanup'])
+        args.extend(['bench', str(config.get('time', 120)), mode])
+
+        started_at[id_] = time.time()
+        procs[id_] = remote.run(
+            args=args,
             logger=log.getChild('radosbench.{id}'.format(id=id_)),
             stdin=run.PIPE,
-            stdout=StringIO(),
+            stdout=bench.BenchOutput(log.getChild('radosbench.{id}'.format(id=id_))),
             wait=False
         )
 
-        # parse output to get summary and format it as CSV
-        proc.wait()
-        out = proc.stdout.getvalue()
-        all_values = {
-            'stdev_throughput': re.sub(r'Stddev Bandwidth: ', '', re.search(
-                r'Stddev Bandwidth:.*', out).group(0)),
-            'stdev_latency': re.sub(r'Stddev Latency: ', '', re.search(
-                r'Stddev Latency:.*', out).group(0)),
-            'avg_throughput': re.sub(r'Bandwidth \(MB/sec\): ', '', re.search(
-                r'Bandwidth \(MB/sec\):.*', out).group(0)),
-            'avg_latency': re.sub(r'Average Latency: ', '', re.search(
-                r'Average Latency:.*', out).group(0)),
-            'rep': str(rep),
-            'num_osd': str(num_osds),
-            'num_replica': str(replica)
-        }
-        values_to_write = []
-        for column in config['columns']:
-            values_to_write.extend([all_values[column]])
-        f.write(','.join(values_to_write) + '\n')
-
-    ctx.manager.remove_pool(pool)
-
+    run.wait(procs.itervalues())
 
-def wait_until_healthy(ctx, config):
-    first_mon = teuthology.get_first_mon(ctx, config)
-    (mon_remote,) = ctx.cluster.only(first_mon).remotes.iterkeys()
-    teuthology.wait_until_healthy(ctx, mon_remote)
+    return dict(
+        (id_, bench.parse_radosbench(proc.stdout.getvalue(), started_at[id_]))
+        for id_, proc in procs.iteritems())
@@ -173,8 +173,11 @@ def task(ctx, config):
         # post-sync, validate that user1 exists on the sync destination host
         for agent_client, c_config in ctx.radosgw_agent.config.iteritems():
             dest_client = c_config['dest']
-            (err, out) = rgwadmin(ctx, dest_client, ['metadata', 'list', 'user'])
-            (err, out) = rgwadmin(ctx, dest_client, ['user', 'info', '--uid', user1], check_status=True)
+            (_, (err, out)) = rgw_utils.rgwadmin_batch(ctx, dest_client, [
+                ['metadata', 'list', 'user'],
+                ['user', 'info', '--uid', user1],
+                ])
+            assert not err
             assert out['user_id'] == user1
             assert out['email'] == email
             assert out['display_name'] == display_name1
@@ -188,10 +191,9 @@ def task(ctx, config):
         for agent_client, c_config in ctx.radosgw_agent.config.iteritems():
             source_client = c_config['src']
             dest_client = c_config['dest']
-            (err1, out1) = rgwadmin(ctx, source_client,
-                ['metadata', 'get', 'user:{uid}'.format(uid=user1)], check_status=True)
-            (err2, out2) = rgwadmin(ctx, dest_client,
-                ['metadata', 'get', 'user:{uid}'.format(uid=user1)], check_status=True)
+            cmd = ['metadata', 'get', 'user:{uid}'.format(uid=user1)]
+            ((err1, out1), (err2, out2)) = rgw_utils.rgwadmin_many(ctx,
+                [(source_client, cmd), (dest_client, cmd)], check_status=True)
             assert out1 == out2
 
         # suspend a user on the master, then check the status on the destination
@@ -211,10 +213,10 @@ def task(ctx, config):
             dest_client = c_config['dest']
             (err, out) = rgwadmin(ctx, source_client, ['user', 'rm', '--uid', user1], check_status=True)
             rgw_utils.radosgw_agent_sync_all(ctx)
-            (err, out) = rgwadmin(ctx, source_client, ['user', 'info', '--uid', user1])
-            assert out is None
-            (err, out) = rgwadmin(ctx, dest_client, ['user', 'info', '--uid', user1])
-            assert out is None
+            cmd = ['user', 'info', '--uid', user1]
+            for (err, out) in rgw_utils.rgwadmin_many(ctx,
+                    [(source_client, cmd), (dest_client, cmd)]):
+                assert out is None
 
             # then recreate it so later tests pass
             (err, out) = rgwadmin(ctx, client, [
@@ -256,12 +258,9 @@ def task(ctx, config):
         for agent_client, c_config in ctx.radosgw_agent.config.iteritems():
             source_client = c_config['src']
             dest_client = c_config['dest']
-            (err1, out1) = rgwadmin(ctx, source_client,
-                ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)],
-                check_status=True)
-            (err2, out2) = rgwadmin(ctx, dest_client,
-                ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)],
-                check_status=True)
+            cmd = ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)]
+            ((err1, out1), (err2, out2)) = rgw_utils.rgwadmin_many(ctx,
+                [(source_client, cmd), (dest_client, cmd)], check_status=True)
             log.debug('metadata 1 %r', out1)
             log.debug('metadata 2 %r', out2)
             assert out1 == out2
@@ -269,14 +268,14 @@ def task(ctx, config):
             # get the bucket.instance info and compare that
             src_bucket_id = out1['data']['bucket']['bucket_id']
             dest_bucket_id = out2['data']['bucket']['bucket_id']
-            (err1, out1) = rgwadmin(ctx, source_client, ['metadata', 'get',
-                'bucket.instance:{bucket_name}:{bucket_instance}'.format(
-                bucket_name=bucket_name2,bucket_instance=src_bucket_id)],
-                check_status=True)
-            (err2, out2) = rgwadmin(ctx, dest_client, ['metadata', 'get',
-                'bucket.instance:{bucket_name}:{bucket_instance}'.format(
-                bucket_name=bucket_name2,bucket_instance=dest_bucket_id)],
-                check_status=True)
+            ((err1, out1), (err2, out2)) = rgw_utils.rgwadmin_many(ctx, [
+                (source_client, ['metadata', 'get',
+                    'bucket.instance:{bucket_name}:{bucket_instance}'.format(
+                    bucket_name=bucket_name2,bucket_instance=src_bucket_id)]),
+                (dest_client, ['metadata', 'get',
+                    'bucket.instance:{bucket_name}:{bucket_instance}'.format(
+                    bucket_name=bucket_name2,bucket_instance=dest_bucket_id)]),
+                ], check_status=True)
             del out1['data']['bucket_info']['bucket']['pool']
             del out1['data']['bucket_info']['bucket']['index_pool']
             del out1['data']['bucket_info']['bucket']['data_extra_pool']
@@ -331,10 +330,9 @@ def task(ctx, config):
         for agent_client, c_config in ctx.radosgw_agent.config.iteritems():
             source_client = c_config['src']
             dest_client = c_config['dest']
-            (err1, out1) = rgwadmin(ctx, source_client, ['metadata', 'get',
-                'bucket:{bucket_name}'.format(bucket_name=bucket_name2)])
-            (err2, out2) = rgwadmin(ctx, dest_client, ['metadata', 'get',
-                'bucket:{bucket_name}'.format(bucket_name=bucket_name2)])
+            cmd = ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)]
+            ((err1, out1), (err2, out2)) = rgw_utils.rgwadmin_many(ctx,
+                [(source_client, cmd), (dest_client, cmd)])
             # Both of the previous calls should have errors due to requesting
             # metadata for non-existent buckets
             assert err1
@@ -350,12 +348,9 @@ def task(ctx, config):
         for agent_client, c_config in ctx.radosgw_agent.config.iteritems():
             source_client = c_config['src']
             dest_client = c_config['dest']
-            (err1, out1) = rgwadmin(ctx, source_client,
-                ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)],
-                check_status=True)
-            (err2, out2) = rgwadmin(ctx, dest_client,
-                ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)],
-                check_status=True)
+            cmd = ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)]
+            ((err1, out1), (err2, out2)) = rgw_utils.rgwadmin_many(ctx,
+                [(source_client, cmd), (dest_client, cmd)], check_status=True)
             assert out1 == out2
 
         # Now delete the bucket and recreate it with a different user
@@ -371,12 +366,9 @@ def task(ctx, config):
         for agent_client, c_config in ctx.radosgw_agent.config.iteritems():
             source_client = c_config['src']
             dest_client = c_config['dest']
-            (err1, out1) = rgwadmin(ctx, source_client,
-                ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)],
-                check_status=True)
-            (err2, out2) = rgwadmin(ctx, dest_client,
-                ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)],
-                check_status=True)
+            cmd = ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)]
+            ((err1, out1), (err2, out2)) = rgw_utils.rgwadmin_many(ctx,
+                [(source_client, cmd), (dest_client, cmd)], check_status=True)
             assert out1 == out2
             assert out1['data']['owner'] == user2
             assert out1['data']['owner'] != user1
@@ -419,12 +411,9 @@ def task(ctx, config):
             # get the metadata from the dest and compare it to what we just set
             log.debug('get the metadata from the dest and compare it to what we just set')
             # and what the source region has.
-            (err1, out1) = rgwadmin(ctx, source_client,
-                ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)],
-                check_status=True)
-            (err2, out2) = rgwadmin(ctx, dest_client,
-                ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)],
-                check_status=True)
+            cmd = ['metadata', 'get', 'bucket:{bucket_name}'.format(bucket_name=bucket_name2)]
+            ((err1, out1), (err2, out2)) = rgw_utils.rgwadmin_many(ctx,
+                [(source_client, cmd), (dest_client, cmd)], check_status=True)
             # yeah for the transitive property
             assert out1 == out2
             assert out1 == new_data
@@ -446,10 +435,10 @@ def task(ctx, config):
             rgw_utils.radosgw_agent_sync_all(ctx)
             # The two 'user info' calls should fail and not return any data
             # since we just deleted this user.
-            (err, out) = rgwadmin(ctx, source_client, ['user', 'info', '--uid', user2])
-            assert out is None
-            (err, out) = rgwadmin(ctx, dest_client, ['user', 'info', '--uid', user2])
-            assert out is None
+            cmd = ['user', 'info', '--uid', user2]
+            for (err, out) in rgw_utils.rgwadmin_many(ctx,
+                    [(source_client, cmd), (dest_client, cmd)]):
+                assert out is None
 
         # Test data sync
 
@@ -12,6 +12,7 @@ import time
 
 import zbkc_manager
 from teuthology import misc as teuthology
+from util.bench import LatencyHistogram
 
 log = logging.getLogger(__name__)
 
@@ -31,6 +32,9 @@ def task(ctx, config):
         num_objects: <number of objects>
         io_size: <io size in bytes>
 
+    The latency percentiles of each kind of op, at baseline and during
+    recovery, are recorded in the job summary under 'recovery_bench'.
+
     example:
 
     tasks:
@@ -134,7 +138,8 @@ class RecoveryBencher:
 
         # baseline bench
         log.info('non-recovery (baseline)')
-        p = osd_remote.run(
+        baseline = LatencySamples()
+        osd_remote.run(
             args=[
                 'adjust-ulimits',
                 'zbkc-coverage',
@@ -146,17 +151,18 @@ class RecoveryBencher:
                 '--io-size', str(io_size),
                 ],
             stdout=StringIO(),
-            stderr=StringIO(),
+            stderr=baseline,
             wait=True,
         )
-        self.process_samples(p.stderr.getvalue())
+        self.process_samples(baseline)
 
         self.zbkc_manager.raw_cluster_cmd('osd', 'out', osd)
         time.sleep(5)
 
         # recovery bench
         log.info('recovery active')
-        p = osd_remote.run(
+        recovery = LatencySamples()
+        osd_remote.run(
             args=[
                 'adjust-ulimits',
                 'zbkc-coverage',
@@ -168,41 +174,64 @@ class RecoveryBencher:
                 '--io-size', str(io_size),
                 ],
             stdout=StringIO(),
-            stderr=StringIO(),
+            stderr=recovery,
             wait=True,
         )
-        self.process_samples(p.stderr.getvalue())
+        self.process_samples(recovery)
 
         self.zbkc_manager.raw_cluster_cmd('osd', 'in', osd)
 
-    def process_samples(self, input):
+        summary = {}
+        for type in set(baseline.histograms) | set(recovery.histograms):
+            summary[type] = {
+                'baseline': baseline.summary(type),
+                'recovery': recovery.summary(type),
+            }
+        self.zbkc_manager.ctx.summary['recovery_bench'] = summary
+
+    def process_samples(self, samples):
         """
-        Extract samples from the input and process the results
+        Log the latency percentiles of a bench run
 
-        :param input: input lines in JSON format
+        :param samples: LatencySamples of the run
         """
-        lat = {}
-        for line in input.split('\n'):
+        for type in sorted(samples.histograms):
+            summary = samples.summary(type)
+            log.info("%s: %d samples, %s, max %f" % (
+                type, summary['count'],
+                ", ".join("%s %f" % (name, summary[name])
+                          for name, _ in LatencyHistogram.LADDER),
+                summary['max']))
+
+
+class LatencySamples(object):
+    """
+    The stderr of smalliobench, which reports the latency of each op as a
+    line of JSON.  Samples are counted in a LatencyHistogram per type of
+    op as they arrive, so memory use does not grow with the duration.
+    """
+    def __init__(self):
+        self.histograms = {}
+        self._partial = ''
+
+    def write(self, data):
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
             try:
                 sample = json.loads(line)
-                samples = lat.setdefault(sample['type'], [])
-                samples.append(float(sample['latency']))
+                latency = float(sample['latency'])
+                type = sample['type']
             except Exception:
-                pass
-
-        for type in lat:
-            samples = lat[type]
-            samples.sort()
-
-            num = len(samples)
-
-            # median
-            if num & 1 == 1: # odd number of samples
-                median = samples[num / 2]
-            else:
-                median = (samples[num / 2] + samples[num / 2 - 1]) / 2
-
-            # 99%
-            ninety_nine = samples[int(num * 0.99)]
-
-            log.info("%s: median %f, 99%% %f" % (type, median, ninety_nine))
+                continue
+            if type not in self.histograms:
+                self.histograms[type] = LatencyHistogram()
+            self.histograms[type].record(latency)
+
+    def flush(self):
+        pass
+
+    def summary(self, type):
+        if type in self.histograms:
+            return self.histograms[type].summary()
+        return {'count': 0}
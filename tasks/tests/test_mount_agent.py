@@ -0,0 +1,73 @@
+import base64
+import ctypes
+import errno
+import os
+import sys
+
+import pytest
+
+from ..zbkcfs.mount import AGENT_SCRIPT, MountAgent
+from ..util.test.local_remote import LocalRemote
+
+
+def user_xattrs_supported(path):
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.setxattr(path, 'user.probe', 'x', 1, 0) == 0:
+        return True
+    if ctypes.get_errno() in (errno.EOPNOTSUPP, errno.ENOTSUP):
+        return False
+    raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+
+class TestMountAgent(object):
+
+    def setup(self):
+        self.agent = MountAgent(LocalRemote().run(
+            args=[sys.executable, '-u', '-c', AGENT_SCRIPT], wait=False))
+
+    def teardown(self):
+        self.agent.close()
+
+    def test_stat(self, tmpdir):
+        path = str(tmpdir.join('file'))
+        open(path, 'w').close()
+        reply = self.agent.request(dict(op='stat', path=path))
+        assert reply['result']['st_ino'] == os.stat(path).st_ino
+        reply = self.agent.request(dict(op='stat', path=path + '.missing'))
+        assert reply == {'errno': errno.ENOENT}
+
+    def test_xattr_roundtrip(self, tmpdir):
+        path = str(tmpdir.join('file'))
+        open(path, 'w').close()
+        if not user_xattrs_supported(path):
+            pytest.skip("no user xattrs on {0}".format(tmpdir))
+        value = '\x00binary\xffvalue'
+        reply = self.agent.request(dict(op='setxattr', path=path,
+                                        name='user.test',
+                                        value=base64.b64encode(value)))
+        assert 'errno' not in reply
+        reply = self.agent.request(dict(op='getxattr', path=path,
+                                        name='user.test'))
+        assert base64.b64decode(reply['result']) == value
+
+    def test_batch(self, tmpdir):
+        path = str(tmpdir)
+        reply = self.agent.request({'batch': [
+            dict(op='create_n_files', path=os.path.join(path, 'f'), count=2),
+            dict(op='listdir', path=path),
+        ]})
+        assert reply['batch'][1]['result'] == ['f_0', 'f_1']
+
+    def test_timeout(self, tmpdir):
+        fifo = str(tmpdir.join('fifo'))
+        os.mkfifo(fifo)
+        # opening a fifo for reading blocks until it has a writer
+        reply = self.agent.request(dict(op='open', path=fifo, timeout=0.5))
+        assert reply == {'errno': errno.ETIMEDOUT}
+        reply = self.agent.request({'batch': [
+            dict(op='open', path=fifo),
+            dict(op='stat', path=fifo),
+        ], 'timeout': 0.5})
+        assert reply == {'batch': [{'errno': errno.ETIMEDOUT}] * 2}
+        reply = self.agent.request(dict(op='listdir', path=str(tmpdir)))
+        assert reply == {'result': ['fifo']}
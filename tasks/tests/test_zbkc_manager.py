@@ -0,0 +1,294 @@
+import json
+import re
+import sys
+import time
+from textwrap import dedent
+
+from mock import Mock
+
+from .. import zbkc_manager
+from ..util.test.local_remote import LocalRemote
+
+
+def make_dump(*states):
+    return {
+        'version': 10,
+        'last_osdmap_epoch': 5,
+        'pg_stats': [
+            {'pgid': '1.%x' % i, 'state': state}
+            for i, state in enumerate(states)
+        ],
+    }
+
+
+class TestPGMapSnapshot(object):
+
+    def test_counters(self):
+        snap = zbkc_manager.PGMapSnapshot(make_dump(
+            'active+clean',
+            'active+recovering+degraded',
+            'stale+active+clean',
+            'down+peering',
+            'creating',
+        ))
+        assert snap.num_pgs() == 5
+        assert snap.num_active_clean() == 1
+        assert snap.num_active_recovered() == 1
+        assert snap.num_active() == 2
+        assert snap.num_down() == 1
+        assert snap.num_active_down() == 3
+        assert snap.num_creating() == 1
+        assert not snap.is_clean()
+        assert snap.osdmap_epoch == 5
+
+    def test_state_histogram(self):
+        snap = zbkc_manager.PGMapSnapshot(make_dump(
+            'active+clean', 'active+clean', 'active+degraded'))
+        assert snap.state_histogram() == {
+            'active': 3, 'clean': 2, 'degraded': 1}
+
+    def test_is_clean(self):
+        snap = zbkc_manager.PGMapSnapshot(make_dump(
+            'active+clean', 'active+clean+scrubbing'))
+        assert snap.is_clean()
+        assert snap.is_active()
+
+
+class TestPGStatsIndex(object):
+
+    def test_update_reports_changes(self):
+        index = zbkc_manager.PGStatsIndex()
+        pgs = [
+            {'pgid': '1.0', 'state': 'active+clean',
+             'reported_epoch': 5, 'reported_seq': 10},
+            {'pgid': '1.1', 'state': 'active+clean',
+             'reported_epoch': 5, 'reported_seq': 11},
+        ]
+        assert index.update(pgs) == set(['1.0', '1.1'])
+        pgs = [
+            {'pgid': '1.0', 'state': 'active+clean',
+             'reported_epoch': 5, 'reported_seq': 10},
+            {'pgid': '1.1', 'state': 'active+clean+scrubbing',
+             'reported_epoch': 5, 'reported_seq': 12},
+        ]
+        assert index.update(pgs) == set(['1.1'])
+        assert index.get('1.1')['state'] == 'active+clean+scrubbing'
+        assert index.update(pgs[:1]) == set(['1.1'])
+        assert index.get('1.1') is None
+
+    def test_update_brief_keeps_full_stats(self):
+        index = zbkc_manager.PGStatsIndex()
+        index.update([{'pgid': '1.0', 'state': 'active+clean',
+                       'acting': [0, 1], 'last_scrub_stamp': 'then'}])
+        changed = index.update_brief([{'pgid': '1.0', 'state': 'active',
+                                       'acting': [1, 2]}])
+        assert changed == set(['1.0'])
+        pg = index.get('1.0')
+        assert pg['acting'] == [1, 2]
+        assert pg['last_scrub_stamp'] == 'then'
+        assert index.update_brief([{'pgid': '1.0', 'state': 'active',
+                                    'acting': [1, 2]}]) == set()
+
+
+class TestClusterWatcher(object):
+
+    def test_parses_maps(self):
+        watcher = zbkc_manager.ClusterWatcher(None)
+        watcher.write('2016-06-01 10:00:00.000000 mon.0 [INF] osdmap e15: '
+                      '3 osds: 2 up, 3 in\n2016-06-01 10:00:01.000000 '
+                      'mon.0 [INF] pgmap v12: 24 pgs: 8 peer')
+        assert watcher.osdmap_epoch == 15
+        assert watcher.num_up_osds == 2
+        assert watcher.pgmap is None
+        watcher.write('ing, 16 active+clean; 0 bytes data, 1 GB used\n')
+        assert watcher.pgmap.version == 12
+        assert watcher.pgmap.num_pgs() == 24
+        assert watcher.pgmap.num_active_clean() == 16
+        assert not watcher.pgmap.is_clean()
+        watcher.write('mon.0 [INF] mon.a@0 won leader election with '
+                      'quorum 0,2\n')
+        assert watcher.quorum == [0, 2]
+        assert watcher.fsmap_epoch is None
+        watcher.write('mon.0 [INF] fsmap e7: 1/1/1 up {0=a=up:active}\n')
+        assert watcher.fsmap_epoch == 7
+
+    def test_wait_without_process(self):
+        watcher = zbkc_manager.ClusterWatcher(None)
+        assert not watcher.wait(lambda w: w.pgmap is not None, 10)
+
+    def test_wait_on_exited_process(self):
+        watcher = zbkc_manager.ClusterWatcher(None)
+        watcher.proc = Mock(finished=True)
+        assert not watcher.running()
+        start = time.time()
+        assert not watcher.wait(lambda w: w.pgmap is not None, 10)
+        assert time.time() - start < 1
+
+    def test_log_matchers(self):
+        watcher = zbkc_manager.ClusterWatcher(None)
+        watcher.write('mon.0 [INF] before\n')
+        substring = watcher.subscribe(zbkc_manager.LogMatcher('before'))
+        regex = watcher.subscribe(
+            zbkc_manager.LogMatcher(re.compile(r'scrub \d+ ok')))
+        predicate = watcher.subscribe(
+            zbkc_manager.LogMatcher(lambda line: '[WRN]' in line))
+        watcher.write('mon.0 [INF] scrub 3 ok\nmon.0 [INF] scrub 4 ok\n')
+        assert not substring.matched
+        assert regex.line == 'mon.0 [INF] scrub 3 ok'
+        assert not predicate.matched
+        watcher.unsubscribe(predicate)
+        watcher.write('mon.0 [WRN] before\n')
+        assert substring.matched
+        assert not predicate.matched
+        assert list(watcher.recent)[-1] == 'mon.0 [WRN] before'
+        assert watcher.recent.maxlen == watcher.RECENT_LINES
+
+
+class TestManagerWithoutInit(object):
+
+    def test_pg_snapshot(self):
+        # Like vstart_runner's LocalZbkcManager, which skips the parent
+        # __init__
+        class Manager(zbkc_manager.ZbkcManager):
+            def __init__(self):
+                self._init_cluster_state(pg_snapshot_ttl=1.0)
+
+            def raw_cluster_cmd(self, *args):
+                return '\n' + json.dumps(make_dump('active+clean', 'peering'))
+
+        manager = Manager()
+        snaps = []
+        manager.subscribe_pg_snapshots(snaps.append)
+        assert manager.get_pg_snapshot().num_active_clean() == 1
+        assert len(snaps) == 1
+        assert manager.pg_index.get('1.1')['state'] == 'peering'
+
+
+class TestThrashEventLog(object):
+
+    def snapshot(self, stamp, *states):
+        return zbkc_manager.PGMapSnapshot(make_dump(*states), stamp=stamp)
+
+    def test_recovery_times(self):
+        events = zbkc_manager.ThrashEventLog()
+        events.annotate(3)
+        events.begin('kill_osd')
+        events.annotate(3)
+        events.annotate(3)
+        kill = events.end()
+        events.begin('inject_pause')
+        events.annotate(1, action='inject_pause_short')
+        pause = events.end()
+        assert kill['osds'] == [3]
+        assert pause['action'] == 'inject_pause_short'
+        assert events.recovering()
+
+        events.observe(self.snapshot(kill['time'] - 1, 'active+clean'))
+        assert kill['time_to_active'] is None
+        start = pause['time'] + pause['duration']
+        events.observe(self.snapshot(start + 1, 'active+degraded',
+                                     'peering'))
+        events.observe(self.snapshot(start + 2, 'active+degraded',
+                                     'active+recovering+degraded'))
+        assert pause['time_to_active'] == start + 2 - pause['time']
+        assert pause['time_to_recovered'] is None
+        events.observe(self.snapshot(start + 3, 'active+degraded',
+                                     'active+degraded'))
+        assert not events.recovering()
+        assert kill['time_to_recovered'] == start + 3 - kill['time']
+        events.settle()
+        events.observe(self.snapshot(start + 4, 'active+clean'))
+        assert kill['time_to_clean'] is None
+
+        summary = events.summary()
+        assert summary['kill_osd']['count'] == 1
+        assert summary['inject_pause_short']['time_to_active']['count'] == 1
+        assert 'time_to_clean' not in summary['kill_osd']
+
+
+STAND_IN_HELPER = dedent("""
+    import json
+    import sys
+
+    for line in iter(sys.stdin.readline, ''):
+        args = json.loads(line)['args']
+        if args[0] == 'fail':
+            reply = {'exitstatus': 22, 'stdout': '', 'stderr': 'EINVAL'}
+        else:
+            reply = {'exitstatus': 0, 'stdout': ' '.join(args),
+                     'stderr': ''}
+        sys.stdout.write(json.dumps(reply) + '\\n')
+        sys.stdout.flush()
+    """)
+
+
+class TestMonCommandSession(object):
+
+    def setup(self):
+        self.session = zbkc_manager.MonCommandSession(
+            LocalRemote(),
+            [sys.executable, '-u', '-c', STAND_IN_HELPER])
+
+    def teardown(self):
+        self.session.close()
+
+    def test_commands_share_one_process(self):
+        assert self.session.command(['osd', 'dump']) == (0, 'osd dump')
+        proc = self.session.proc
+        assert self.session.command(('pg', 'dump')) == (0, 'pg dump')
+        assert self.session.proc is proc
+
+    def test_failure_exit_status(self):
+        assert self.session.command(['fail']) == (22, '')
+
+    def test_json_through_manager(self, tmpdir):
+        # rados and zbkc_argparse stand-ins, so that the real helper
+        # answers from a canned osd dump and pg dump
+        tmpdir.join('rados.py').write(dedent("""
+            class Rados(object):
+                def __init__(self, **kwargs):
+                    pass
+
+                def connect(self):
+                    pass
+
+                def shutdown(self):
+                    pass
+            """))
+        tmpdir.join('zbkc_argparse.py').write(dedent("""
+            import json
+
+            DUMPS = {{
+                'osd dump': {{'epoch': 5, 'pools': []}},
+                'pg dump': {pg_dump},
+            }}
+
+            def json_command(cluster, prefix=None, argdict=None, timeout=None):
+                if prefix == 'get_command_descriptions':
+                    return 0, '{{}}', ''
+                assert argdict['format'] == 'json'
+                return 0, json.dumps(DUMPS[argdict['prefix']]), ''
+
+            def parse_json_funcsigs(outbuf, consumer):
+                return {{}}
+
+            def validate_command(sigdict, words):
+                return {{'prefix': ' '.join(words)}}
+            """).format(pg_dump=repr(make_dump('active+clean'))))
+        remote = LocalRemote(env={'PYTHONPATH': str(tmpdir)})
+
+        class SessionManager(zbkc_manager.ZbkcManager):
+            def _mon_session_command(self, args):
+                if self.mon_session is None:
+                    self.mon_session = zbkc_manager.MonCommandSession(
+                        remote,
+                        [sys.executable, '-u', '-c',
+                         zbkc_manager.MON_COMMAND_HELPER, 'zbkc'])
+                return self.mon_session.command(args)
+
+        manager = SessionManager(None, config={'mon_command_session': True})
+        try:
+            assert manager.get_osd_dump_json()['epoch'] == 5
+            assert manager.get_pg_snapshot().num_active_clean() == 1
+        finally:
+            manager.close_mon_session()
@@ -0,0 +1,22 @@
+from ..util import wait
+from ..zbkc_test_case import ZbkcTestCase
+
+
+class Waiter(ZbkcTestCase):
+    # Only here to be driven by the tests below, not to be collected
+    __test__ = False
+
+    def test_wait(self):
+        pass
+
+
+class TestZbkcTestCase(object):
+
+    def test_wait_until_equal_list(self):
+        def get_ranks():
+            return [0, 1]
+
+        case = Waiter('test_wait')
+        case.wait_until_equal(get_ranks, [0, 1], timeout=1)
+        label = "{0}: get_ranks".format(case.id())
+        assert wait.wait_stats[label]['count'] == 1
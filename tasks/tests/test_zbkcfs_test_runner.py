@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import zbkcfs_test_runner
+
+
+class Fixture(unittest.TestCase):
+    # Only here to be loaded by the tests below, not to be collected
+    __test__ = False
+
+
+class Alpha(Fixture):
+    def test_slow(self):
+        pass
+
+    def test_fast(self):
+        pass
+
+
+class Bravo(Fixture):
+    def test_broken(self):
+        pass
+
+
+class Charlie(Fixture):
+    def test_new(self):
+        pass
+
+
+def short_ids(test_suite):
+    return [".".join(t.id().split(".")[-2:])
+            for _, s in zbkcfs_test_runner.split_by_class(test_suite)
+            for t in s]
+
+
+class TestTestHistory(object):
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "history.json")
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def load(self, *classes):
+        loader = unittest.TestLoader()
+        return unittest.TestSuite([loader.loadTestsFromTestCase(c) for c in classes])
+
+    def test_order(self):
+        history = zbkcfs_test_runner.TestHistory(self.path)
+        prefix = Alpha.__module__
+        history.record(prefix + ".Alpha.test_slow", 30.0, True)
+        history.record(prefix + ".Alpha.test_fast", 1.0, True)
+        history.record(prefix + ".Bravo.test_broken", 50.0, False)
+
+        ordered = history.order(self.load(Alpha, Bravo, Charlie))
+        assert short_ids(ordered) == [
+            "Bravo.test_broken",  # failed last time
+            "Charlie.test_new",   # never run
+            "Alpha.test_fast",
+            "Alpha.test_slow",
+        ]
+
+    def test_save_and_load(self):
+        history = zbkcfs_test_runner.TestHistory(self.path)
+        history.record("a.B.test_c", 2.5, False)
+        history.save()
+        with open(self.path) as f:
+            assert json.load(f) == {"a.B.test_c": {"duration": 2.5, "passed": False}}
+        history = zbkcfs_test_runner.TestHistory(self.path)
+        assert history.sort_key("a.B.test_c") == (0, 2.5)
+        assert history.sort_key("unknown") == (1, 0)
+
+    def test_timing_result(self):
+        history = zbkcfs_test_runner.TestHistory(self.path)
+
+        class Result(zbkcfs_test_runner.TimingResultMixin, unittest.TestResult):
+            pass
+        Result.history = history
+
+        class Failing(Fixture):
+            def test_fails(self):
+                self.fail()
+
+            def test_skips(self):
+                self.skipTest("no")
+
+        self.load(Alpha, Failing).run(Result())
+        outcomes = dict((k.rsplit(".", 1)[1], v["passed"])
+                        for k, v in history.tests.items())
+        assert outcomes == {"test_slow": True, "test_fast": True,
+                            "test_fails": False}
@@ -120,6 +120,18 @@ def task(ctx, config):
     disable_objectstore_tool_tests: (false) disable zbkc_objectstore_tool based
                                     tests
 
+    watch_cluster: (false) follow the cluster with a persistent 'zbkc -w' so
+                   that waits for clean, recovery and osds wake up on map
+                   changes instead of polling
+
+    Every action of the thrasher is logged as an event with its start
+    time, duration and the osds it touched, and the time from its start
+    until the pgs were next seen all active (time_to_active), recovered
+    (time_to_recovered) and clean (time_to_clean), up to the end of the
+    next wait for recovery.  The distributions of these per action are
+    recorded in the job summary under thrashosds/<cluster>, and they and
+    all the events in the archive as thrashosds-<cluster>.json.
+
     example:
 
     tasks:
@@ -181,6 +193,9 @@ def task(ctx, config):
         if config.get(f):
             cluster_manager.config[f] = config.get(f)
 
+    if config.get('watch_cluster', False):
+        cluster_manager.start_watching()
+
     log.info('Beginning thrashosds...')
     thrash_proc = zbkc_manager.Thrasher(
         cluster_manager,
@@ -192,4 +207,8 @@ def task(ctx, config):
     finally:
         log.info('joining thrashosds')
         thrash_proc.do_join()
-        cluster_manager.wait_for_recovery(config.get('timeout', 360))
+        try:
+            cluster_manager.wait_for_recovery(config.get('timeout', 360))
+        finally:
+            thrash_proc.save_events()
+            cluster_manager.stop_watching()
@@ -0,0 +1,132 @@
+"""
+Run many short commands on a remote in a single invocation, rather than
+paying for an ssh round trip and a remote process per command.
+"""
+from cStringIO import StringIO
+from textwrap import dedent
+import base64
+import json
+import logging
+
+from teuthology.parallel import parallel
+
+log = logging.getLogger(__name__)
+
+# Run remotely by run_batch: reads a JSON document on stdin listing the
+# commands, and writes a JSON list with the result of each one.
+BATCH_SCRIPT = dedent("""
+    import base64
+    import json
+    import subprocess
+    import sys
+
+    req = json.load(sys.stdin)
+    results = []
+    for op in req["ops"]:
+        if any(results[i]["exitstatus"] != 0 for i in op.get("requires", [])):
+            results.append({"exitstatus": None})
+            continue
+        stdin_data = op.get("stdin")
+        if "stdin_from" in op:
+            stdin_data = results[op["stdin_from"]]["stdout"]
+        if stdin_data is not None:
+            stdin_data = base64.b64decode(stdin_data)
+        p = subprocess.Popen(op["args"], shell=not isinstance(op["args"], list),
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        out, err = p.communicate(stdin_data)
+        if "line_prefix" in op:
+            prefix = op["line_prefix"].encode("utf-8")
+            out = "".join(l for l in out.splitlines(True)
+                          if l.startswith(prefix))
+        results.append({"exitstatus": p.returncode,
+                        "stdout": base64.b64encode(out),
+                        "stderr": base64.b64encode(err)})
+        if p.returncode != 0 and req["stop_on_error"]:
+            break
+
+    json.dump(results, sys.stdout)
+    """)
+
+# Run remotely by write_files: reads a JSON dict of path to base64 encoded
+# contents on stdin.
+WRITE_FILES_SCRIPT = dedent("""
+    import base64
+    import json
+    import sys
+
+    for path, data in json.load(sys.stdin).items():
+        with open(path, "w") as f:
+            f.write(base64.b64decode(data))
+    """)
+
+
+def run_batch(remote, ops, stop_on_error=False):
+    """
+    Run commands on remote one after the other, in a single remote
+    invocation.
+
+    :param ops: list of dicts with "args", an argument list or a shell
+                command line, and optionally "stdin", the data to feed
+                the command, or "stdin_from", the index of an earlier op
+                whose output to feed it, and "requires", the indices of
+                earlier ops which must have succeeded for this one to be
+                run, and "line_prefix", to send back only the lines of its
+                output that start with it
+    :param stop_on_error: stop at the first command that fails
+    :return: list of dicts, one per op run, with "exitstatus" (None if
+             the op was skipped), "stdout" and "stderr"
+    """
+    if not ops:
+        return []
+    req_ops = []
+    for op in ops:
+        if op.get('stdin') is not None:
+            op = dict(op, stdin=base64.b64encode(op['stdin']))
+        req_ops.append(op)
+    req = {'ops': req_ops, 'stop_on_error': stop_on_error}
+    proc = remote.run(
+        args=['python', '-c', BATCH_SCRIPT],
+        stdin=json.dumps(req),
+        stdout=StringIO(),
+        )
+    results = json.loads(proc.stdout.getvalue())
+    for result in results:
+        for key in ('stdout', 'stderr'):
+            if key in result:
+                result[key] = base64.b64decode(result[key])
+    return results
+
+
+def run_batches(batches, stop_on_error=False):
+    """
+    Run several batches at once, e.g. one for each OSD.
+
+    :param batches: dict of key to (remote, ops), see run_batch
+    :return: dict of key to the results of its batch
+    """
+    results = {}
+
+    def run_one(key, remote, ops):
+        results[key] = run_batch(remote, ops, stop_on_error=stop_on_error)
+
+    with parallel() as p:
+        for key, (remote, ops) in batches.iteritems():
+            p.spawn(run_one, key, remote, ops)
+    return results
+
+
+def write_files(remote, files):
+    """
+    Write many files on remote with a single transfer, rather than one
+    per file as teuthology.misc.write_file does.
+
+    :param files: dict of path to contents
+    """
+    if not files:
+        return
+    remote.run(
+        args=['python', '-c', WRITE_FILES_SCRIPT],
+        stdin=json.dumps(dict((path, base64.b64encode(data))
+                              for path, data in files.iteritems())),
+        )
@@ -0,0 +1,330 @@
+"""
+Collect, aggregate and archive benchmark results (rados bench, omapbench)
+so that runs can be compared with each other over time.
+"""
+import json
+import logging
+import math
+import os
+import re
+import time
+from cStringIO import StringIO
+
+log = logging.getLogger(__name__)
+
+# One line per second of "rados bench":
+#   sec Cur ops   started  finished  avg MB/s  cur MB/s last lat(s)  avg lat(s)
+RADOSBENCH_SAMPLE_RE = re.compile(
+    r'^\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+([\d.]+)\s+([\d.]+)\s+(\S+)\s+([\d.]+)\s*$')
+
+RADOSBENCH_SUMMARY = [
+    ('total_time', r'Total time run'),
+    ('total_ops', r'Total (?:writes|reads) made'),
+    ('op_size', r'(?:Write|Read) size'),
+    ('bandwidth', r'Bandwidth \(MB/sec\)'),
+    ('stddev_bandwidth', r'Stddev Bandwidth'),
+    ('average_iops', r'Average IOPS'),
+    ('stddev_iops', r'Stddev IOPS'),
+    ('average_latency', r'Average Latency(?:\(s\))?'),
+    ('stddev_latency', r'Stddev Latency(?:\(s\))?'),
+    ('max_latency', r'Max latency(?:\(s\))?'),
+    ('min_latency', r'Min latency(?:\(s\))?'),
+]
+
+OMAPBENCH_SUMMARY = [
+    ('objects', r'Number of (?:kv|object )maps written'),
+    ('threads', r'Number of ops at once'),
+    ('average_latency', r'Average latency'),
+    ('min_latency', r'Minimum latency'),
+    ('max_latency', r'Maximum latency'),
+    ('total_latency', r'Total latency'),
+]
+
+PERCENTILES = [50, 90, 99]
+
+
+class BenchOutput(object):
+    """
+    A stdout for remote.run that keeps what the benchmark printed and still
+    logs it line by line, as teuthology does when no stdout is given.
+    """
+    def __init__(self, logger):
+        self.logger = logger
+        self.buf = StringIO()
+        self._partial = ''
+
+    def write(self, data):
+        self.buf.write(data)
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self.logger.info(line)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return self.buf.getvalue()
+
+
+class LatencyHistogram(object):
+    """
+    Fixed-memory histogram of latencies, after HdrHistogram: values below
+    sub_buckets units are counted exactly, larger ones in buckets that
+    double in width with every power of two, each split into sub_buckets/2
+    linear sub-buckets.  Every value is kept to within 2/sub_buckets of
+    its true value, however many are recorded.
+    """
+    LADDER = [('p50', 50), ('p90', 90), ('p99', 99), ('p99.9', 99.9)]
+
+    def __init__(self, unit=1e-6, sub_buckets=128):
+        assert sub_buckets & (sub_buckets - 1) == 0, \
+            "sub_buckets must be a power of two"
+        self.unit = unit
+        self.sub_buckets = sub_buckets
+        self.sub_bits = sub_buckets.bit_length() - 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        units = int(value / self.unit)
+        if units < self.sub_buckets:
+            return units
+        shift = units.bit_length() - self.sub_bits
+        half = self.sub_buckets / 2
+        return self.sub_buckets + (shift - 1) * half + (units >> shift) - half
+
+    def _bounds(self, index):
+        """
+        :return: the range of values, in units, counted in bucket index
+        """
+        if index < self.sub_buckets:
+            return index, index + 1
+        half = self.sub_buckets / 2
+        shift = (index - self.sub_buckets) / half + 1
+        top = (index - self.sub_buckets) % half + half
+        return top << shift, (top + 1) << shift
+
+    def record(self, value, count=1):
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        assert (other.unit, other.sub_buckets) == (self.unit, self.sub_buckets)
+        for index, count in other.counts.iteritems():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, pct):
+        """
+        The value below which pct percent of the recorded values fall, or
+        None if nothing was recorded.
+        """
+        if not self.count:
+            return None
+        target = max(1, int(math.ceil(pct / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                # The highest value that could be in the bucket, as
+                # HdrHistogram does, but no more than was actually seen
+                low, high = self._bounds(index)
+                return max(min(high * self.unit, self.max), self.min)
+
+    def summary(self):
+        """
+        :return: dict of count, mean, min, the LADDER percentiles and max
+        """
+        result = {'count': self.count}
+        if self.count:
+            result['mean'] = self.total / self.count
+            result['min'] = self.min
+            result['max'] = self.max
+            for name, pct in self.LADDER:
+                result[name] = self.percentile(pct)
+        return result
+
+
+def _parse_summary(fields, out):
+    summary = {}
+    for key, label in fields:
+        m = re.search(r'^\s*{0}:\s*([-+\d.e]+)'.format(label), out, re.M)
+        if m:
+            summary[key] = float(m.group(1))
+    return summary
+
+
+def parse_radosbench(out, started_at=None):
+    """
+    Parse the output of "rados bench".
+
+    :param started_at: when the bench was started, so that samples from
+                       concurrent benches can be lined up
+    :return: dict with the per-second 'samples' (bandwidth in MB/s, iops,
+             and the latency of the last op completed in that second) and
+             the final 'summary'
+    """
+    samples = []
+    finished = 0
+    for line in out.splitlines():
+        m = RADOSBENCH_SAMPLE_RE.match(line)
+        if not m:
+            continue
+        last_lat = m.group(7)
+        samples.append({
+            'sec': int(m.group(1)),
+            'bandwidth': float(m.group(6)),
+            'iops': int(m.group(4)) - finished,
+            'latency': None if last_lat == '-' else float(last_lat),
+        })
+        finished = int(m.group(4))
+    return {
+        'started_at': started_at,
+        'samples': samples,
+        'summary': _parse_summary(RADOSBENCH_SUMMARY, out),
+    }
+
+
+def parse_omapbench(out):
+    """
+    Parse the output of omapbench.  Latencies are in ms.
+    """
+    return {'summary': _parse_summary(OMAPBENCH_SUMMARY, out)}
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a list of numbers, or None if it is empty.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def _stats(values):
+    if not values:
+        return {}
+    mean = sum(values) / float(len(values))
+    stats = {
+        'mean': mean,
+        'stdev': math.sqrt(sum((v - mean) ** 2 for v in values) / len(values)),
+        'min': min(values),
+        'max': max(values),
+    }
+    for pct in PERCENTILES:
+        stats['p{0}'.format(pct)] = percentile(values, pct)
+    return stats
+
+
+def aggregate_radosbench(runs):
+    """
+    Combine the results of "rados bench" runs that happened at the same
+    time (several clients) or one after another (multibench segments).
+
+    Bandwidth and iops are summed over the runs active in each second of
+    wall clock time, then summarised over the seconds.  Latency
+    percentiles are over the per-second latency samples of all runs.
+    """
+    base = min([r['started_at'] for r in runs if r['started_at'] is not None] or [0])
+    bandwidth = {}
+    iops = {}
+    latencies = []
+    elapsed = 0
+    for run in runs:
+        offset = int(round((run['started_at'] or base) - base))
+        elapsed = max(elapsed, offset + run['summary'].get('total_time', 0))
+        for sample in run['samples']:
+            sec = offset + sample['sec']
+            bandwidth[sec] = bandwidth.get(sec, 0.0) + sample['bandwidth']
+            iops[sec] = iops.get(sec, 0) + sample['iops']
+            if sample['latency'] is not None:
+                latencies.append(sample['latency'])
+    total_ops = sum(r['summary'].get('total_ops', 0) for r in runs)
+    latency = _stats(latencies)
+    if total_ops:
+        # Weight each run's average by how many ops it did, that is more
+        # accurate than the mean of the samples
+        latency['mean'] = sum(r['summary'].get('average_latency', 0) *
+                              r['summary'].get('total_ops', 0)
+                              for r in runs) / total_ops
+    return {
+        'runs': len(runs),
+        'total_ops': int(total_ops),
+        'elapsed': elapsed,
+        'bandwidth': _stats(bandwidth.values()),
+        'iops': _stats(iops.values()),
+        'latency': latency,
+    }
+
+
+def aggregate_omapbench(runs):
+    """
+    Combine the results of concurrent omapbench clients.
+
+    omapbench does not report how long it ran for; each of its threads
+    writes one object map at a time, so that is estimated as its total
+    latency divided by the number of threads.
+    """
+    summaries = [r['summary'] for r in runs]
+    objects = sum(s.get('objects', 0) for s in summaries)
+    rate = 0.0
+    for s in summaries:
+        if s.get('total_latency') and s.get('threads'):
+            rate += s.get('objects', 0) / (s['total_latency'] / 1000.0 / s['threads'])
+    result = {
+        'runs': len(runs),
+        'objects': int(objects),
+        'objects_per_sec': rate,
+        'latency': {},
+    }
+    mins = [s['min_latency'] for s in summaries if 'min_latency' in s]
+    maxes = [s['max_latency'] for s in summaries if 'max_latency' in s]
+    if mins:
+        result['latency']['min'] = min(mins)
+    if maxes:
+        result['latency']['max'] = max(maxes)
+    if objects:
+        result['latency']['mean'] = sum(
+            s.get('average_latency', 0) * s.get('objects', 0)
+            for s in summaries) / objects
+    return result
+
+
+def save_results(ctx, name, aggregate, clients):
+    """
+    Record a benchmark's aggregate results in the job summary, and the
+    aggregate along with each client's full results in the archive as
+    bench/<name>-<n>.json, n counting the benchmarks run by this job.
+
+    :param clients: dict of client id to parsed results
+    """
+    benchmarks = ctx.summary.setdefault('benchmarks', [])
+    entry = dict(aggregate, task=name, time=time.time())
+    benchmarks.append(entry)
+    log.info("{0} results: {1}".format(name, json.dumps(aggregate)))
+
+    if ctx.archive is not None:
+        path = os.path.join(ctx.archive, 'bench')
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        fname = os.path.join(path, '{0}-{1}.json'.format(name, len(benchmarks) - 1))
+        with open(fname, 'w') as f:
+            json.dump({'aggregate': entry, 'clients': clients}, f,
+                      indent=2, sort_keys=True)
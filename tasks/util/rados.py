@@ -1,9 +1,78 @@
+from cStringIO import StringIO
+from textwrap import dedent
+import base64
+import json
 import logging
 
 from teuthology import misc as teuthology
 
 log = logging.getLogger(__name__)
 
+# Run remotely by populate: reads a JSON document on stdin describing the
+# objects, creates them with librados and writes a JSON list of failures.
+POPULATE_SCRIPT = dedent("""
+    import base64
+    import json
+    import subprocess
+    import sys
+
+    import rados
+
+    req = json.load(sys.stdin)
+    cluster = rados.Rados(conffile='', clustername=req["cluster"])
+    cluster.connect()
+    ioctx = cluster.open_ioctx(req["pool"])
+    namespace = ""
+    errors = []
+
+    def utf8(s):
+        return s.encode("utf-8")
+
+    for obj in req["objects"]:
+        name = utf8(obj["name"])
+        if (obj.get("namespace") or "") != namespace:
+            namespace = obj.get("namespace") or ""
+            ioctx.set_namespace(utf8(namespace))
+        op = None
+        try:
+            if "file" in obj:
+                op = "put"
+                with open(obj["file"]) as f:
+                    ioctx.write_full(name, f.read())
+            elif "data" in obj:
+                op = "put"
+                ioctx.write_full(name, base64.b64decode(obj["data"]))
+            for key, value in sorted(obj.get("xattrs", {}).items()):
+                op = "setxattr"
+                ioctx.set_xattr(name, utf8(key), utf8(value))
+            omap = sorted(obj.get("omap", {}).items())
+            if omap:
+                op = "setomapval"
+                with rados.WriteOpCtx(ioctx) as write_op:
+                    ioctx.set_omap(write_op,
+                                   tuple(utf8(k) for k, _ in omap),
+                                   tuple(utf8(v) for _, v in omap))
+                    ioctx.operate_write_op(write_op, name)
+        except (rados.Error, IOError) as e:
+            errors.append({"object": obj["name"], "op": op, "error": str(e)})
+            continue
+        if "omap_header" in obj:
+            # The python bindings have no way of setting an omap header
+            args = ["rados", "--cluster", req["cluster"], "-p", req["pool"]]
+            if namespace:
+                args += ["-N", namespace]
+            args += ["setomapheader", name, utf8(obj["omap_header"])]
+            p = subprocess.Popen(args, stderr=subprocess.PIPE)
+            _, err = p.communicate()
+            if p.returncode != 0:
+                errors.append({"object": obj["name"], "op": "setomapheader",
+                               "error": err.strip()})
+
+    ioctx.close()
+    cluster.shutdown()
+    json.dump(errors, sys.stdout)
+    """)
+
 def rados(ctx, remote, cmd, wait=True, check_status=False):
     testdir = teuthology.get_testdir(ctx)
     log.info("rados %s" % ' '.join(cmd))
@@ -24,6 +93,39 @@ def rados(ctx, remote, cmd, wait=True, check_status=False):
     else:
         return proc
 
+def populate(remote, pool, objects, cluster='zbkc'):
+    """
+    Create objects along with their xattrs and omap, shipping their
+    description to remote in one go and creating them all from a single
+    process there, rather than running rados once per object and once
+    more per attribute.
+
+    :param objects: list of dicts with the "name" of each object and
+                    optionally its "namespace", its contents as "data" or
+                    as the path of a "file" on remote, its "xattrs" and
+                    "omap" as dicts of key to value, and its "omap_header"
+    :returns: list of dicts with the "object", "op" and "error" of each
+              object that could not be fully created
+    """
+    log.info("populating pool {pool} with {num} objects".format(
+        pool=pool, num=len(objects)))
+    req_objects = []
+    for obj in objects:
+        if obj.get('data') is not None:
+            obj = dict(obj, data=base64.b64encode(obj['data']))
+        req_objects.append(obj)
+    req = {'cluster': cluster, 'pool': pool, 'objects': req_objects}
+    proc = remote.run(
+        args=['python', '-c', POPULATE_SCRIPT],
+        stdin=json.dumps(req),
+        stdout=StringIO(),
+        )
+    errors = json.loads(proc.stdout.getvalue())
+    for error in errors:
+        log.error("{op} of {obj} failed: {error}".format(
+            op=error['op'], obj=error['object'], error=error['error']))
+    return errors
+
 def create_ec_pool(remote, name, profile_name, pgnum, profile={}):
     remote.run(args=['sudo', 'zbkc'] +
                cmd_erasure_code_profile(profile_name, profile))
@@ -5,9 +5,13 @@ import requests
 from requests.packages.urllib3.util import Retry
 from urlparse import urlparse
 
+from teuthology.exceptions import CommandFailedError
 from teuthology.orchestra.connection import split_user
+from teuthology.parallel import parallel
 from teuthology import misc as teuthology
 
+from .batch import run_batch
+
 log = logging.getLogger(__name__)
 
 # simple test to indicate if multi-region testing should occur
@@ -16,11 +20,9 @@ def multi_region_enabled(ctx):
     # use that as an indicator that we're testing multi-region sync
     return 'radosgw_agent' in ctx
 
-def rgwadmin(ctx, client, cmd, stdin=StringIO(), check_status=False,
-             format='json'):
-    log.info('rgwadmin: {client} : {cmd}'.format(client=client,cmd=cmd))
+def _rgwadmin_prefix(ctx, client, format):
     testdir = teuthology.get_testdir(ctx)
-    pre = [
+    return [
         'adjust-ulimits',
         'zbkc-coverage'.format(tdir=testdir),
         '{tdir}/archive/coverage'.format(tdir=testdir),
@@ -29,6 +31,22 @@ def rgwadmin(ctx, client, cmd, stdin=StringIO(), check_status=False,
         '--format', format,
         '-n',  client,
         ]
+
+def _rgwadmin_result(r, out):
+    j = None
+    if not r and out != '':
+        try:
+            j = json.loads(out)
+            log.info(' json result: %s' % j)
+        except ValueError:
+            j = out
+            log.info(' raw result: %s' % j)
+    return (r, j)
+
+def rgwadmin(ctx, client, cmd, stdin=StringIO(), check_status=False,
+             format='json'):
+    log.info('rgwadmin: {client} : {cmd}'.format(client=client,cmd=cmd))
+    pre = _rgwadmin_prefix(ctx, client, format)
     pre.extend(cmd)
     log.info('rgwadmin: cmd=%s' % pre)
     (remote,) = ctx.cluster.only(client).remotes.iterkeys()
@@ -39,17 +57,60 @@ def rgwadmin(ctx, client, cmd, stdin=StringIO(), check_status=False,
         stderr=StringIO(),
         stdin=stdin,
         )
-    r = proc.exitstatus
-    out = proc.stdout.getvalue()
-    j = None
-    if not r and out != '':
-        try:
-            j = json.loads(out)
-            log.info(' json result: %s' % j)
-        except ValueError:
-            j = out
-            log.info(' raw result: %s' % j)
-    return (r, j)
+    return _rgwadmin_result(proc.exitstatus, proc.stdout.getvalue())
+
+def rgwadmin_batch(ctx, client, cmds, check_status=False, format='json'):
+    """
+    Run several radosgw-admin commands on client, one after the other, in
+    a single remote invocation.
+
+    :param cmds: list of radosgw-admin argument lists, as for rgwadmin
+    :param check_status: stop at the first command that fails and raise
+                         CommandFailedError
+    :return: list of (exit status, parsed output) like rgwadmin returns,
+             one per command run
+    """
+    log.info('rgwadmin_batch: {client} : {cmds}'.format(client=client, cmds=cmds))
+    if not cmds:
+        return []
+    (remote,) = ctx.cluster.only(client).remotes.iterkeys()
+    pre = _rgwadmin_prefix(ctx, client, format)
+    batch = run_batch(remote, [{'args': pre + cmd} for cmd in cmds],
+                      stop_on_error=check_status)
+    results = []
+    for cmd, result in zip(cmds, batch):
+        r = result['exitstatus']
+        if r and check_status:
+            raise CommandFailedError(' '.join(['radosgw-admin'] + cmd), r,
+                                     remote.name)
+        results.append(_rgwadmin_result(r, result['stdout']))
+    return results
+
+def rgwadmin_many(ctx, calls, check_status=False, format='json'):
+    """
+    Run radosgw-admin commands on several clients at once, e.g. to compare
+    the source and destination of a sync.  The commands for each client
+    are run in order as one rgwadmin_batch.
+
+    :param calls: list of (client, cmd)
+    :return: list of (exit status, parsed output), in the order of calls
+    """
+    by_client = {}
+    for i, (client, cmd) in enumerate(calls):
+        by_client.setdefault(client, []).append(i)
+
+    results = [None] * len(calls)
+
+    def run_client(client, indices):
+        batch = rgwadmin_batch(ctx, client, [calls[i][1] for i in indices],
+                               check_status=check_status, format=format)
+        for i, result in zip(indices, batch):
+            results[i] = result
+
+    with parallel() as p:
+        for client, indices in by_client.iteritems():
+            p.spawn(run_client, client, indices)
+    return results
 
 def get_user_summary(out, user):
     """Extract the summary for a given user"""
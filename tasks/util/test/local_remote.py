@@ -0,0 +1,29 @@
+import os
+import subprocess
+
+from mock import Mock
+
+
+class LocalRemote(object):
+    """
+    Stands in for a teuthology Remote in unit tests, running commands as
+    local processes.
+
+    :param env: extra environment variables for the commands
+    """
+
+    def __init__(self, env=None):
+        self.env = env
+
+    def run(self, args, stdin=None, stdout=None, wait=True):
+        env = None
+        if self.env is not None:
+            env = dict(os.environ, **self.env)
+        proc = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, env=env)
+        if not wait:
+            return Mock(stdin=proc.stdin, stdout=proc.stdout, wait=proc.wait)
+        out, _ = proc.communicate(stdin)
+        if stdout is not None:
+            stdout.write(out)
+        return Mock(stdout=stdout, exitstatus=proc.returncode)
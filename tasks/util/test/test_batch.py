@@ -0,0 +1,44 @@
+from .. import batch
+from .local_remote import LocalRemote
+
+
+class TestBatch(object):
+
+    def test_run_batch(self):
+        results = batch.run_batch(LocalRemote(), [
+            {'args': ['echo', 'a b']},
+            {'args': 'echo "$((1 + 2))" >&2; exit 3'},
+            {'args': ['cat'], 'stdin': 'data\0', 'requires': [0]},
+            {'args': ['echo', 'skipped'], 'requires': [0, 1]},
+            {'args': ['tr', 'a-z', 'A-Z'], 'stdin_from': 0, 'requires': [0]},
+        ])
+        assert [r['exitstatus'] for r in results] == [0, 3, 0, None, 0]
+        assert results[0]['stdout'] == 'a b\n'
+        assert results[1]['stderr'] == '3\n'
+        assert results[2]['stdout'] == 'data\0'
+        assert 'stdout' not in results[3]
+        assert results[4]['stdout'] == 'A B\n'
+
+    def test_line_prefix(self):
+        results = batch.run_batch(LocalRemote(), [
+            {'args': 'printf "100.0\\n1000.0\\n200.0\\n"',
+             'line_prefix': '100'},
+        ])
+        assert results[0]['stdout'] == '100.0\n1000.0\n'
+
+    def test_stop_on_error(self):
+        results = batch.run_batch(LocalRemote(), [
+            {'args': ['false']},
+            {'args': ['true']},
+        ], stop_on_error=True)
+        assert len(results) == 1
+        assert batch.run_batch(LocalRemote(), []) == []
+
+    def test_write_files(self, tmpdir):
+        files = {
+            str(tmpdir.join('a')): 'A\n' * 3,
+            str(tmpdir.join('b')): '\0\xff',
+        }
+        batch.write_files(LocalRemote(), files)
+        for path, data in files.iteritems():
+            assert open(path).read() == data
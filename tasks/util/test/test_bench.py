@@ -0,0 +1,136 @@
+import json
+
+from .. import bench
+
+RADOSBENCH_OUTPUT = """\
+Maintaining 16 concurrent writes of 4194304 bytes to objects of size 4194304 for up to 3 seconds or 0 objects
+Object prefix: benchmark_data_host_1234
+  sec Cur ops   started  finished  avg MB/s  cur MB/s last lat(s)  avg lat(s)
+    0       0         0         0         0         0           -           0
+    1      16        20         4   15.9951        16    0.911235    0.801228
+    2      16        36        20   39.9894        64    0.987123    0.912004
+    3      16        52        40   53.3155        80     1.00104     1.01331
+Total time run:         3.2
+Total writes made:      52
+Write size:             4194304
+Object size:            4194304
+Bandwidth (MB/sec):     65
+Stddev Bandwidth:       33.0454
+Average IOPS:           16
+Stddev IOPS:            8
+Average Latency(s):     1.0
+Stddev Latency(s):      0.1
+Max latency(s):         1.3
+Min latency(s):         0.7
+"""
+
+OMAPBENCH_OUTPUT = """\
+========================================================
+Number of kvmaps written:\t1000
+Number of ops at once:\t10
+Entries per kvmap:\t\t10
+
+Average latency:\t4.5ms
+Minimum latency:\t1.5ms
+Maximum latency:\t20ms
+Total latency:\t\t4500ms
+"""
+
+
+class FakeCtx(object):
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.summary = {}
+
+
+class TestBench(object):
+
+    def test_parse_radosbench(self):
+        result = bench.parse_radosbench(RADOSBENCH_OUTPUT, started_at=100)
+        assert [s['iops'] for s in result['samples']] == [0, 4, 16, 20]
+        assert result['samples'][0]['latency'] is None
+        assert result['samples'][2]['bandwidth'] == 64
+        assert result['summary']['total_ops'] == 52
+        assert result['summary']['bandwidth'] == 65
+        assert result['summary']['average_latency'] == 1.0
+
+    def test_aggregate_radosbench(self):
+        first = bench.parse_radosbench(RADOSBENCH_OUTPUT, started_at=100)
+        second = bench.parse_radosbench(RADOSBENCH_OUTPUT, started_at=101)
+        result = bench.aggregate_radosbench([first, second])
+        assert result['runs'] == 2
+        assert result['total_ops'] == 104
+        # seconds 0..4 of wall clock time, the runs overlapping in 1..3
+        assert result['bandwidth']['max'] == 64 + 80
+        assert result['iops']['max'] == 36
+        assert result['latency']['mean'] == 1.0
+        assert result['latency']['max'] == 1.00104
+        assert result['elapsed'] == 4.2
+
+    def test_omapbench(self):
+        run = bench.parse_omapbench(OMAPBENCH_OUTPUT)
+        assert run['summary']['objects'] == 1000
+        result = bench.aggregate_omapbench([run, run])
+        assert result['objects'] == 2000
+        assert result['objects_per_sec'] == 2 * 1000 / 0.45
+        assert result['latency'] == {'min': 1.5, 'max': 20, 'mean': 4.5}
+
+    def test_percentile(self):
+        assert bench.percentile([], 50) is None
+        assert bench.percentile([3, 1, 2, 4], 50) == 2
+        assert bench.percentile([3, 1, 2, 4], 99) == 4
+
+    def test_bench_output(self):
+        logged = []
+
+        class Logger(object):
+            def info(self, line):
+                logged.append(line)
+
+        out = bench.BenchOutput(Logger())
+        out.write('one\ntw')
+        out.write('o\n')
+        assert logged == ['one', 'two']
+        assert out.getvalue() == 'one\ntwo\n'
+
+    def test_save_results(self, tmpdir):
+        ctx = FakeCtx(str(tmpdir))
+        bench.save_results(ctx, 'radosbench', {'runs': 1}, {'0': {}})
+        bench.save_results(ctx, 'radosbench', {'runs': 2}, {'0': {}})
+        assert [b['runs'] for b in ctx.summary['benchmarks']] == [1, 2]
+        with open(str(tmpdir.join('bench', 'radosbench-1.json'))) as f:
+            assert json.load(f)['aggregate']['runs'] == 2
+
+
+class TestLatencyHistogram(object):
+
+    def test_percentiles(self):
+        hist = bench.LatencyHistogram()
+        for i in range(1, 10001):
+            hist.record(i * 0.0001)
+        summary = hist.summary()
+        assert summary['count'] == 10000
+        assert summary['min'] == 0.0001
+        assert summary['max'] == 1.0
+        for name, pct in bench.LatencyHistogram.LADDER:
+            assert abs(summary[name] - pct / 100.0) <= pct / 100.0 * 2 / 128
+
+    def test_bounded_memory(self):
+        hist = bench.LatencyHistogram(sub_buckets=16)
+        for i in range(100000):
+            hist.record((i % 1000) * 0.01)
+        # 16 exact buckets, then 8 for each power of two up to 10s in us
+        assert len(hist.counts) <= 16 + 8 * 20
+        assert hist.percentile(100) == hist.max
+
+    def test_merge(self):
+        first = bench.LatencyHistogram()
+        second = bench.LatencyHistogram()
+        first.record(0.001, count=99)
+        second.record(0.5)
+        first.merge(second)
+        assert first.count == 100
+        assert first.max == 0.5
+        assert abs(first.percentile(99) - 0.001) < 0.001 * 2 / 128
+        assert bench.LatencyHistogram().summary() == {'count': 0}
@@ -26,10 +26,115 @@
 #  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
 #  OTHER DEALINGS IN THE SOFTWARE.
 #
+import json
+import os
+from textwrap import dedent
+
 from .. import rados
+from .local_remote import LocalRemote
+
+# Stands in for the librados python bindings, recording what is done
+FAKE_RADOS = dedent("""
+    import json
+    import os
+
+    def record(*call):
+        with open(os.path.join(os.path.dirname(__file__), 'calls'), 'a') as f:
+            f.write(json.dumps(call) + '\\n')
+
+    class Error(Exception):
+        pass
+
+    class WriteOpCtx(object):
+        def __init__(self, ioctx):
+            pass
+        def __enter__(self):
+            return self
+        def __exit__(self, *args):
+            pass
+
+    class Ioctx(object):
+        def set_namespace(self, namespace):
+            record('set_namespace', namespace)
+        def write_full(self, name, data):
+            if name == 'bad':
+                raise Error('EIO')
+            record('write_full', name, data)
+        def set_xattr(self, name, key, value):
+            record('set_xattr', name, key, value)
+        def set_omap(self, op, keys, values):
+            record('set_omap', keys, values)
+        def operate_write_op(self, op, name):
+            record('operate_write_op', name)
+        def close(self):
+            pass
+
+    class Rados(object):
+        def __init__(self, **kwargs):
+            pass
+        def connect(self):
+            pass
+        def open_ioctx(self, pool):
+            record('open_ioctx', pool)
+            return Ioctx()
+        def shutdown(self):
+            pass
+    """)
+
+
+class FakeRadosRemote(LocalRemote):
+
+    def __init__(self, path):
+        super(FakeRadosRemote, self).__init__(
+            env={'PYTHONPATH': path,
+                 'PATH': path + ':' + os.environ['PATH']})
+        self.path = path
+        with open(os.path.join(path, 'rados.py'), 'w') as f:
+            f.write(FAKE_RADOS)
+        # and the rados command line, for omap headers
+        cli = os.path.join(path, 'rados')
+        with open(cli, 'w') as f:
+            f.write('#!/bin/sh\necho "$@" >> {0}/cli\n'.format(path))
+        os.chmod(cli, 0755)
+
+    def calls(self):
+        with open(os.path.join(self.path, 'calls')) as f:
+            return [json.loads(line) for line in f]
+
+    def cli(self):
+        with open(os.path.join(self.path, 'cli')) as f:
+            return f.read().splitlines()
+
 
 class TestRados(object):
 
+    def test_populate(self, tmpdir):
+        remote = FakeRadosRemote(str(tmpdir))
+        data_file = str(tmpdir.join('data'))
+        with open(data_file, 'w') as f:
+            f.write('from file')
+        errors = rados.populate(remote, 'POOL', [
+            {'name': 'obj1', 'data': '\0data',
+             'xattrs': {'k1': 'v1', 'k2': 'v2'}},
+            {'name': 'obj2', 'namespace': 'ns', 'file': data_file,
+             'omap': {'o1': 'w1', 'o2': 'w2'}, 'omap_header': 'hdr'},
+            {'name': 'bad', 'data': '', 'xattrs': {'k': 'v'}},
+        ])
+        assert errors == [{'object': 'bad', 'op': 'put', 'error': 'EIO'}]
+        assert remote.calls() == [
+            ['open_ioctx', 'POOL'],
+            ['write_full', 'obj1', '\0data'],
+            ['set_xattr', 'obj1', 'k1', 'v1'],
+            ['set_xattr', 'obj1', 'k2', 'v2'],
+            ['set_namespace', 'ns'],
+            ['write_full', 'obj2', 'from file'],
+            ['set_omap', ['o1', 'o2'], ['w1', 'w2']],
+            ['operate_write_op', 'obj2'],
+            ['set_namespace', ''],
+        ]
+        assert remote.cli() == [
+            '--cluster zbkc -p POOL -N ns setomapheader obj2 hdr']
+
     def test_cmd_erasure_code_profile(self):
         name = 'NAME'
         cmd = rados.cmd_erasure_code_profile(name, {})
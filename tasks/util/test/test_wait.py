@@ -0,0 +1,63 @@
+import pytest
+
+from .. import wait
+
+
+class FakeClock(object):
+
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        self.sleeps = []
+        monkeypatch.setattr(wait.time, 'time', lambda: self.now)
+        monkeypatch.setattr(wait.time, 'sleep', self.sleep)
+
+    def sleep(self, interval):
+        self.sleeps.append(interval)
+        self.now += interval
+
+
+class TestWait(object):
+
+    def test_backoff(self, monkeypatch):
+        clock = FakeClock(monkeypatch)
+        backoff = wait.Backoff(2, initial=0.25, max_interval=1)
+        for _ in range(5):
+            backoff.sleep()
+        assert clock.sleeps == [0.25, 0.5, 1, 0.25, 0]
+        assert backoff.expired()
+
+    def test_wait_until(self, monkeypatch):
+        clock = FakeClock(monkeypatch)
+        values = iter([{'a': 1, 'b': 0}, {'a': 1, 'b': 1}])
+        result = wait.wait_until(lambda: next(values),
+                                 lambda v: v['a'] and v['b'],
+                                 timeout=10, label='both')
+        assert result == {'a': 1, 'b': 1}
+        assert clock.sleeps == [0.1]
+        stats = wait.wait_stats['both']
+        assert (stats['count'], stats['polls'], stats['failures']) == (1, 2, 0)
+        assert stats['seconds'] == pytest.approx(0.1)
+
+    def test_wait_until_timeout(self, monkeypatch):
+        clock = FakeClock(monkeypatch)
+        with pytest.raises(RuntimeError) as e:
+            wait.wait_until(lambda: 'no', lambda v: v == 'yes', timeout=3,
+                            label='yes')
+        assert 'currently no' in str(e.value)
+        assert sum(clock.sleeps) == pytest.approx(3)
+        assert wait.wait_stats['yes']['failures'] >= 1
+
+    def test_wait_until_reject(self, monkeypatch):
+        clock = FakeClock(monkeypatch)
+        with pytest.raises(RuntimeError) as e:
+            wait.wait_until(lambda: 'bad', lambda v: v == 'good', timeout=3,
+                            reject=lambda v: v == 'bad')
+        assert 'forbidden value bad' in str(e.value)
+        assert clock.sleeps == []
+
+    def test_report_wait_stats(self, monkeypatch):
+        FakeClock(monkeypatch)
+        wait.wait_until(lambda: True, timeout=1, label='report')
+        summary = {}
+        wait.report_wait_stats(summary)
+        assert summary['wait_stats']['report']['count'] == 1
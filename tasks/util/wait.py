@@ -0,0 +1,120 @@
+"""
+Polling helpers for waiting on cluster state: check often at first, so
+that conditions which settle quickly are noticed quickly, then back off so
+that slow conditions don't hammer the cluster.
+"""
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Totals for each label of the waits done by wait_until, so that the cost
+# of waiting can be reported after a run (see report_wait_stats).  There is
+# one entry per label however many waits there are.
+wait_stats = {}
+
+
+def _record(label, elapsed, polls, success):
+    stats = wait_stats.setdefault(label, {
+        'count': 0, 'failures': 0, 'polls': 0,
+        'seconds': 0.0, 'max_seconds': 0.0})
+    stats['count'] += 1
+    if not success:
+        stats['failures'] += 1
+    stats['polls'] += polls
+    stats['seconds'] += elapsed
+    stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+
+def report_wait_stats(summary=None, top=10):
+    """
+    Log the labels that were waited on longest in total, and record all
+    of wait_stats in summary['wait_stats'] if a job summary is given.
+    """
+    if summary is not None:
+        summary['wait_stats'] = wait_stats
+    longest = sorted(wait_stats.iteritems(),
+                     key=lambda item: item[1]['seconds'], reverse=True)
+    for label, stats in longest[:top]:
+        log.info("waited {0:.1f}s for {1} ({2} waits, {3} failed, "
+                 "{4} polls, longest {5:.1f}s)".format(
+                     stats['seconds'], label, stats['count'],
+                     stats['failures'], stats['polls'],
+                     stats['max_seconds']))
+
+
+class Backoff(object):
+    """
+    Intervals that start at `initial` seconds and grow by `factor` up to
+    `max_interval`, without ever sleeping past `timeout` seconds from
+    construction.  A timeout of None means there is no deadline.
+    """
+    def __init__(self, timeout, initial=0.1, factor=2.0, max_interval=5.0):
+        self.started_at = time.time()
+        if timeout is None:
+            self.deadline = float("inf")
+        else:
+            self.deadline = self.started_at + timeout
+        self.interval = initial
+        self.factor = factor
+        self.max_interval = max_interval
+
+    def elapsed(self):
+        return time.time() - self.started_at
+
+    def expired(self):
+        return time.time() >= self.deadline
+
+    def next_interval(self):
+        """
+        :return: how long to sleep before the next poll
+        """
+        interval = max(0, min(self.interval, self.deadline - time.time()))
+        self.interval = min(self.interval * self.factor, self.max_interval)
+        return interval
+
+    def sleep(self):
+        time.sleep(self.next_interval())
+
+
+def wait_until(fetch, condition=bool, timeout=300, label=None, reject=None,
+               initial=0.1, max_interval=5.0):
+    """
+    Poll until condition(fetch()) is true.
+
+    Each poll fetches one snapshot (e.g. a status dump) and the condition
+    may look at as much of it as it likes, so testing several things at
+    once costs no more than testing one.  The condition is always checked
+    once more at the deadline.
+
+    :param reject: optional predicate on the snapshot; if it is ever true,
+                   give up straight away
+    :return: the snapshot that met the condition
+    :raises: RuntimeError on timeout or rejection
+    """
+    if label is None:
+        label = getattr(condition, '__name__', 'condition')
+    backoff = Backoff(timeout, initial=initial, max_interval=max_interval)
+    polls = 0
+    while True:
+        value = fetch()
+        polls += 1
+        if condition(value):
+            elapsed = backoff.elapsed()
+            _record(label, elapsed, polls, True)
+            log.debug("wait_until {0}: success in {1:.1f}s ({2} polls)".format(
+                label, elapsed, polls))
+            return value
+        elif reject is not None and reject(value):
+            _record(label, backoff.elapsed(), polls, False)
+            raise RuntimeError("wait_until {0}: forbidden value {1} seen".format(
+                label, value))
+        elif backoff.expired():
+            elapsed = backoff.elapsed()
+            _record(label, elapsed, polls, False)
+            raise RuntimeError(
+                "Timed out after {0:.0f} seconds waiting for {1} (currently {2})".format(
+                    elapsed, label, value))
+        else:
+            log.debug("wait_until {0}: waiting...".format(label))
+        backoff.sleep()
@@ -23,6 +23,15 @@ Usage (assuming teuthology, zbkc, zbkc-qa-suite checked out in ~/git):
     # If you wish to run a named test case, pass it as an argument:
     python ~/git/zbkc-qa-suite/tasks/vstart_runner.py tasks.zbkcfs.test_data_scan
 
+    # To keep test durations and outcomes in a file, and use them on later
+    # runs to run last time's failures first, then the quickest tests:
+    python ~/git/zbkc-qa-suite/tasks/vstart_runner.py --history=/tmp/history.json
+
+    # With spare MDS daemons and clients, run PARALLEL_SAFE test classes on
+    # several filesystems at once:
+    MDS=4 MON=1 OSD=3 ../src/vstart.sh -n
+    python ~/git/zbkc-qa-suite/tasks/vstart_runner.py --workers=2
+
 """
 
 from StringIO import StringIO
@@ -107,7 +116,8 @@ try:
     from teuthology.exceptions import CommandFailedError
     from tasks.zbkc_manager import ZbkcManager
     from tasks.zbkcfs.fuse_mount import FuseMount
-    from tasks.zbkcfs.filesystem import Filesystem, MDSCluster, ZbkcCluster
+    from tasks.zbkcfs.mount import AGENT_SCRIPT
+    from tasks.zbkcfs.filesystem import Filesystem, MDSCluster, ZbkcCluster, shared_mon_manager
     from mgr.mgr_test_case import MgrCluster
     from teuthology.contextutil import MaxWhileTries
     from teuthology.task import interactive
@@ -201,6 +211,34 @@ class LocalRemoteProcess(object):
         return FakeStdIn(self)
 
 
+class LocalStreamingProcess(LocalRemoteProcess):
+    """
+    A LocalRemoteProcess whose stdout is copied to the caller's file object
+    line by line as it arrives, rather than all at once when it exits, as
+    with a teuthology RemoteProcess.
+    """
+    def __init__(self, args, subproc, stdout):
+        super(LocalStreamingProcess, self).__init__(args, subproc, False, stdout, None)
+        self._copier = threading.Thread(target=self._copy)
+        self._copier.daemon = True
+        self._copier.start()
+
+    def _copy(self):
+        for line in iter(self.subproc.stdout.readline, ''):
+            self.stdout.write(line)
+
+    def wait(self):
+        self.subproc.wait()
+        self._copier.join()
+        self.exitstatus = self.returncode = self.subproc.returncode
+
+    @property
+    def finished(self):
+        if self.exitstatus is None and self.subproc.poll() is not None:
+            self.wait()
+        return self.exitstatus is not None
+
+
 class LocalRemote(object):
     """
     Amusingly named class to present the teuthology RemoteProcess interface when we are really
@@ -440,6 +478,8 @@ class LocalFuseMount(FuseMount):
         if mount_path is not None:
             prefix += ["--client_mountpoint={0}".format(mount_path)]
 
+        if mount_fs_name is None:
+            mount_fs_name = self.default_fs_name
         if mount_fs_name is not None:
             prefix += ["--client_mds_namespace={0}".format(mount_fs_name)]
 
@@ -490,6 +530,14 @@ class LocalFuseMount(FuseMount):
             'python', '-c', pyscript
         ], wait=False)
 
+    def _start_agent(self):
+        """
+        LocalRemote does not stream stdin/stdout, so talk to the mount
+        agent over a plain subprocess.
+        """
+        return subprocess.Popen(['python', '-u', '-c', AGENT_SCRIPT],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
 
 class LocalZbkcManager(ZbkcManager):
     def __init__(self):
@@ -501,6 +549,8 @@ class LocalZbkcManager(ZbkcManager):
         # certain teuthology tests want to run tasks in parallel
         self.lock = threading.RLock()
 
+        self._init_cluster_state(pg_snapshot_ttl=1.0)
+
     def find_remote(self, daemon_type, daemon_id):
         """
         daemon_type like 'mds', 'osd'
@@ -508,9 +558,17 @@ class LocalZbkcManager(ZbkcManager):
         """
         return LocalRemote()
 
-    def run_zbkc_w(self):
-        proc = self.controller.run([os.path.join(BIN_PREFIX, "zbkc"), "-w"], wait=False, stdout=StringIO())
-        return proc
+    def run_zbkc_w(self, stdout=None):
+        args = [os.path.join(BIN_PREFIX, "zbkc"), "-w"]
+        if stdout is None:
+            return self.controller.run(args, wait=False, stdout=StringIO())
+
+        # Someone is following the output (e.g. a ClusterWatcher), so hand
+        # it over as it comes
+        log.info("Running {0}".format(args))
+        subproc = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                   stdin=subprocess.PIPE)
+        return LocalStreamingProcess(args, subproc, stdout)
 
     def raw_cluster_cmd(self, *args):
         """
@@ -571,7 +629,7 @@ class LocalZbkcCluster(ZbkcCluster):
     def __init__(self, ctx):
         # Deliberately skip calling parent constructor
         self._ctx = ctx
-        self.mon_manager = LocalZbkcManager()
+        self.mon_manager = shared_mon_manager(ctx, LocalZbkcManager)
         self._conf = defaultdict(dict)
 
     def get_config(self, key, service_type=None):
@@ -649,7 +707,10 @@ class LocalMDSCluster(LocalZbkcCluster, MDSCluster):
         pass
 
     def newfs(self, name):
-        return LocalFilesystem(self._ctx, create=name)
+        return self._adopt(LocalFilesystem(self._ctx, create=name))
+
+    def get_filesystem(self, fscid):
+        return self._adopt(LocalFilesystem(self._ctx, fscid=fscid))
 
 
 class LocalMgrCluster(LocalZbkcCluster, MgrCluster):
@@ -691,7 +752,7 @@ class LocalFilesystem(Filesystem, LocalMDSCluster):
 
         log.info("Discovered MDS IDs: {0}".format(self.mds_ids))
 
-        self.mon_manager = LocalZbkcManager()
+        self.mon_manager = shared_mon_manager(ctx, LocalZbkcManager)
 
         self.mds_daemons = dict([(id_, LocalDaemon("mds", id_)) for id_ in self.mds_ids])
 
@@ -841,7 +902,9 @@ def exec_test():
     mds_cluster = LocalMDSCluster(ctx)
     mgr_cluster = LocalMgrCluster(ctx)
 
-    from tasks.zbkcfs_test_runner import DecoratingLoader
+    from tasks.zbkcfs_test_runner import DecoratingLoader, make_workers, run_tests, merge_results, \
+        TestHistory, TimingResultMixin
+    from tasks.util.wait import report_wait_stats
 
     class LogStream(object):
         def __init__(self):
@@ -900,6 +963,10 @@ def exec_test():
                 yield s, t
 
     interactive_on_error = False
+    worker_count = 1
+    # Durations and outcomes of previous runs, used to run tests that failed
+    # last time first and then the quickest ones (off unless --history=PATH)
+    history_path = None
 
     args = sys.argv[1:]
     flags = [a for a in args if a.startswith("-")]
@@ -907,6 +974,10 @@ def exec_test():
     for f in flags:
         if f == "--interactive":
             interactive_on_error = True
+        elif f.startswith("--workers="):
+            worker_count = int(f.split("=", 1)[1])
+        elif f.startswith("--history="):
+            history_path = f.split("=", 1)[1]
         else:
             log.error("Unknown option '{0}'".format(f))
             sys.exit(-1)
@@ -955,13 +1026,18 @@ def exec_test():
     for s, method in victims:
         s._tests.remove(method)
 
+    history = None
+    if history_path:
+        history = TestHistory(history_path)
+        overall_suite = history.order(overall_suite)
+
     if interactive_on_error:
         result_class = InteractiveFailureResult
     else:
         result_class = unittest.TextTestResult
     fail_on_skip = False
 
-    class LoggingResult(result_class):
+    class LoggingResult(TimingResultMixin, result_class):
         def startTest(self, test):
             log.info("Starting test: {0}".format(self.getDescription(test)))
             test.started_at = datetime.datetime.utcnow()
@@ -972,6 +1048,7 @@ def exec_test():
                 self.getDescription(test),
                 (datetime.datetime.utcnow() - test.started_at).total_seconds()
             ))
+            return super(LoggingResult, self).stopTest(test)
 
         def addSkip(self, test, reason):
             if fail_on_skip:
@@ -980,12 +1057,30 @@ def exec_test():
             else:
                 super(LoggingResult, self).addSkip(test, reason)
 
+    def run_suite(test_suite):
+        return unittest.TextTestRunner(
+            stream=LogStream(),
+            resultclass=LoggingResult,
+            verbosity=2,
+            failfast=True).run(test_suite)
+
+    LoggingResult.history = history
+
     # Execute!
-    result = unittest.TextTestRunner(
-        stream=LogStream(),
-        resultclass=LoggingResult,
-        verbosity=2,
-        failfast=True).run(overall_suite)
+    workers = make_workers(mds_cluster, mounts, worker_count)
+    try:
+        if workers:
+            results = run_tests(overall_suite, run_suite, mds_cluster, workers,
+                                history=history)
+            result = merge_results(results, LoggingResult(
+                unittest.runner._WritelnDecorator(LogStream()), True, 2))
+        else:
+            result = run_suite(overall_suite)
+    finally:
+        zbkc_cluster.mon_manager.stop_watching()
+        if history is not None:
+            history.save()
+        report_wait_stats()
 
     if not result.wasSuccessful():
         result.printErrors()  # duplicate output at end for convenience
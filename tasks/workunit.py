@@ -1,9 +1,12 @@
 """
 Workunit task -- Run zbkc on sets of specific clients
 """
+import contextlib
 import logging
 import pipes
 import os
+import re
+from cStringIO import StringIO
 
 from util import get_remote_for_role
 
@@ -59,6 +62,22 @@ def task(ctx, config):
               BAZ: quux
             timeout: 3h
 
+    The workunits are fetched and built once per remote and shared by all
+    the clients on it.  The copy is removed when the task finishes, unless
+    keep_cache is set, in which case later workunit tasks for the same
+    sha1 reuse it and it is removed at the end of the job:
+
+        tasks:
+        - zbkc:
+        - zbkc-fuse:
+        - workunit:
+            keep_cache: true
+            clients:
+              all: [suites/fsx.sh]
+        - workunit:
+            clients:
+              all: [suites/pjd.sh]
+
     This task supports roles that include a zbkc cluster, e.g.::
 
         tasks:
@@ -107,22 +126,129 @@ def task(ctx, config):
         created_mnt_dir = _make_scratch_dir(ctx, role, config.get('subdir'))
         created_mountpoint[role] = created_mnt_dir
 
-    # Execute any non-all workunits
-    with parallel() as p:
-        for role, tests in clients.iteritems():
-            if role != "all":
-                p.spawn(_run_tests, ctx, refspec, role, tests,
-                        config.get('env'), timeout=timeout)
+    try:
+        # Execute any non-all workunits
+        with parallel() as p:
+            for role, tests in clients.iteritems():
+                if role != "all":
+                    p.spawn(_run_tests, ctx, refspec, role, tests,
+                            config.get('env'), timeout=timeout)
+
+        # Clean up dirs from any non-all workunits
+        for role, created in created_mountpoint.items():
+            _delete_dir(ctx, role, created)
+
+        # Execute any 'all' workunits
+        if 'all' in clients:
+            all_tasks = clients["all"]
+            _spawn_on_all_clients(ctx, refspec, all_tasks, config.get('env'),
+                                  config.get('subdir'), timeout=timeout)
+    except Exception:
+        _delete_cache(ctx)
+        raise
+
+    if config.get('keep_cache', False):
+        return _delete_cache_at_exit(ctx)
+    _delete_cache(ctx)
+
+
+@contextlib.contextmanager
+def _delete_cache_at_exit(ctx):
+    """
+    Returned by task() when keep_cache is set.  teuthology enters it once
+    the task has run and exits it as the job unwinds its tasks, so the
+    kept copy is removed at the end of the job whatever the tasks after
+    this one do.
+    """
+    try:
+        yield
+    finally:
+        _delete_cache(ctx)
+
+
+def _cache_dir(ctx):
+    """
+    Returns the path of the directory holding the fetched workunits on
+    each remote, one subdirectory per sha1.
+    """
+    return os.path.join(misc.get_testdir(ctx), 'workunit.cache')
+
+
+def _delete_cache(ctx):
+    """
+    Remove the shared copies of the workunits from every remote.
+    """
+    ctx.cluster.run(
+        args=[
+            'rm', '-rf', '--', _cache_dir(ctx),
+        ],
+    )
+
+
+def _resolve_refspec(remote, git_url, refspec):
+    """
+    Returns the sha1 that refspec points to, or refspec itself if it
+    cannot be resolved (e.g. it is an abbreviated sha1).
+    """
+    if re.match('^[0-9a-f]{40}$', refspec):
+        return refspec
+    proc = remote.run(
+        args=['git', 'ls-remote', git_url, refspec],
+        stdout=StringIO(),
+        check_status=False,
+    )
+    for line in proc.stdout.getvalue().splitlines():
+        return line.split()[0]
+    return refspec
 
-    # Clean up dirs from any non-all workunits
-    for role, created in created_mountpoint.items():
-        _delete_dir(ctx, role, created)
 
-    # Execute any 'all' workunits
-    if 'all' in clients:
-        all_tasks = clients["all"]
-        _spawn_on_all_clients(ctx, refspec, all_tasks, config.get('env'),
-                              config.get('subdir'), timeout=timeout)
+def _fetch_workunits(ctx, remote, refspec, role):
+    """
+    Fetch and build the workunits of refspec on remote, unless a previous
+    role or task already did so.  Only qa/workunits is checked out, from a
+    shallow fetch when the git server allows it.  Concurrent callers on the
+    same remote are serialized with flock, so the fetch happens once.
+
+    :returns: the directory holding the workunits and the path of the
+              file listing them
+    """
+    git_url = teuth_config.get_zbkc_git_url()
+    sha1 = _resolve_refspec(remote, git_url, refspec)
+    cache = _cache_dir(ctx)
+    key = re.sub('[^A-Za-z0-9._-]', '_', sha1)
+    checkout = os.path.join(cache, key)
+    script = """
+set -e
+mkdir -p {cache}
+exec 9>{cache}/.lock
+flock 9
+if [ ! -d {checkout} ]; then
+    rm -rf {checkout}.tmp
+    mkdir {checkout}.tmp
+    cd {checkout}.tmp
+    git init -q
+    git remote add origin {url}
+    git config core.sparseCheckout true
+    echo qa/workunits/ > .git/info/sparse-checkout
+    if git fetch --depth 1 origin {ref}; then
+        git checkout -q FETCH_HEAD
+    else
+        git fetch origin
+        git checkout -q {ref}
+    fi
+    cd qa/workunits
+    if test -e Makefile; then make; fi
+    find -executable -type f -printf '%P\\0' > {checkout}.tmp/workunits.list
+    mv {checkout}.tmp {checkout}
+fi
+""".format(cache=pipes.quote(cache), checkout=pipes.quote(checkout),
+           url=pipes.quote(git_url), ref=pipes.quote(sha1))
+    remote.run(
+        logger=log.getChild(role),
+        args=['bash', '-c', script],
+    )
+    return (os.path.join(checkout, 'qa', 'workunits'),
+            os.path.join(checkout, 'workunits.list'))
 
 
 def _client_mountpoint(ctx, cluster, id_):
@@ -305,39 +431,7 @@ def _run_tests(ctx, refspec, role, tests, env, subdir=None, timeout=None):
         scratch_tmp = os.path.join(mnt, 'client.{id}'.format(id=id_), 'tmp')
     else:
         scratch_tmp = os.path.join(mnt, subdir)
-    srcdir = '{tdir}/workunit.{role}'.format(tdir=testdir, role=role)
-    clonedir = '{tdir}/clone.{role}'.format(tdir=testdir, role=role)
-
-    git_url = teuth_config.get_zbkc_git_url()
-    remote.run(
-        logger=log.getChild(role),
-        args=[
-            'git',
-            'clone',
-            git_url,
-            clonedir,
-            run.Raw(';'),
-            'cd', '--', clonedir,
-            run.Raw('&&'),
-            'git', 'checkout', refspec,
-            run.Raw('&&'),
-            'mv', 'qa/workunits', srcdir,
-        ],
-    )
-
-    remote.run(
-        logger=log.getChild(role),
-        args=[
-            'cd', '--', srcdir,
-            run.Raw('&&'),
-            'if', 'test', '-e', 'Makefile', run.Raw(';'), 'then', 'make', run.Raw(';'), 'fi',
-            run.Raw('&&'),
-            'find', '-executable', '-type', 'f', '-printf', r'%P\0'.format(srcdir=srcdir),
-            run.Raw('>{tdir}/workunits.list.{role}'.format(tdir=testdir, role=role)),
-        ],
-    )
-
-    workunits_file = '{tdir}/workunits.list.{role}'.format(tdir=testdir, role=role)
+    srcdir, workunits_file = _fetch_workunits(ctx, remote, refspec, role)
     workunits = sorted(misc.get_file(remote, workunits_file).split('\0'))
     assert workunits
 
@@ -391,9 +485,3 @@ def _run_tests(ctx, refspec, role, tests, env, subdir=None, timeout=None):
                 )
     finally:
         log.info('Stopping %s on %s...', tests, role)
-        remote.run(
-            logger=log.getChild(role),
-            args=[
-                'rm', '-rf', '--', workunits_file, srcdir, clonedir,
-            ],
-        )
@@ -21,6 +21,7 @@ from teuthology import misc as teuthology
 from teuthology import contextutil
 from teuthology import exceptions
 from teuthology.orchestra import run
+from teuthology.parallel import parallel
 import zbkc_client as cclient
 from teuthology.orchestra.daemon import DaemonGroup
 
@@ -371,6 +372,130 @@ def zbkcfs_setup(ctx, config):
     yield
 
 
+def osd_mkfs_remote(ctx, config, remote, roles_for_host, roles_to_devs,
+                    devs_to_clean):
+    """
+    Create, mount and mkfs the data directories of every osd of the
+    cluster on one remote.  This is run for all osd hosts in parallel.
+
+    :param ctx: Context
+    :param config: Configuration of the cluster task
+    :param remote: Remote the osds live on
+    :param roles_for_host: roles of remote
+    :param roles_to_devs: map of osd role to the device to use for it
+    :param devs_to_clean: map of remote to mount points to unmount later
+    """
+    testdir = teuthology.get_testdir(ctx)
+    coverage_dir = '{tdir}/archive/coverage'.format(tdir=testdir)
+    monmap_path = '{tdir}/{cluster}.monmap'.format(tdir=testdir,
+                                                   cluster=config['cluster'])
+    cluster_name = config['cluster']
+    for role in teuthology.cluster_roles_of_type(roles_for_host, 'osd', cluster_name):
+        _, _, id_ = teuthology.split_role(role)
+        mnt_point = '/var/lib/zbkc/osd/{cluster}-{id}'.format(cluster=cluster_name, id=id_)
+        remote.run(
+            args=[
+                'sudo',
+                'mkdir',
+                '-p',
+                mnt_point,
+            ])
+        log.info(role)
+        if roles_to_devs.get(role):
+            dev = roles_to_devs[role]
+            fs = config.get('fs')
+            package = None
+            mkfs_options = config.get('mkfs_options')
+            mount_options = config.get('mount_options')
+            if fs == 'btrfs':
+                # package = 'btrfs-tools'
+                if mount_options is None:
+                    mount_options = ['noatime', 'user_subvol_rm_allowed']
+                if mkfs_options is None:
+                    mkfs_options = ['-m', 'single',
+                                    '-l', '32768',
+                                    '-n', '32768']
+            if fs == 'xfs':
+                # package = 'xfsprogs'
+                if mount_options is None:
+                    mount_options = ['noatime']
+                if mkfs_options is None:
+                    mkfs_options = ['-f', '-i', 'size=2048']
+            if fs == 'ext4' or fs == 'ext3':
+                if mount_options is None:
+                    mount_options = ['noatime', 'user_xattr']
+
+            if mount_options is None:
+                mount_options = []
+            if mkfs_options is None:
+                mkfs_options = []
+            mkfs = ['mkfs.%s' % fs] + mkfs_options
+            log.info('%s on %s on %s' % (mkfs, dev, remote))
+            if package is not None:
+                remote.run(
+                    args=[
+                        'sudo',
+                        'apt-get', 'install', '-y', package
+                    ],
+                    stdout=StringIO(),
+                )
+
+            try:
+                remote.run(args=['yes', run.Raw('|')] + ['sudo'] + mkfs + [dev])
+            except run.CommandFailedError:
+                # Newer btfs-tools doesn't prompt for overwrite, use -f
+                if '-f' not in mount_options:
+                    mkfs_options.append('-f')
+                    mkfs = ['mkfs.%s' % fs] + mkfs_options
+                    log.info('%s on %s on %s' % (mkfs, dev, remote))
+                remote.run(args=['yes', run.Raw('|')] + ['sudo'] + mkfs + [dev])
+
+            log.info('mount %s on %s -o %s' % (dev, remote,
+                                               ','.join(mount_options)))
+            remote.run(
+                args=[
+                    'sudo',
+                    'mount',
+                    '-t', fs,
+                    '-o', ','.join(mount_options),
+                    dev,
+                    mnt_point,
+                ]
+            )
+            remote.run(
+                args=[
+                    'sudo', '/sbin/restorecon', mnt_point,
+                ],
+                check_status=False,
+            )
+            if not remote in ctx.disk_config.remote_to_roles_to_dev_mount_options:
+                ctx.disk_config.remote_to_roles_to_dev_mount_options[remote] = {}
+            ctx.disk_config.remote_to_roles_to_dev_mount_options[remote][role] = mount_options
+            if not remote in ctx.disk_config.remote_to_roles_to_dev_fstype:
+                ctx.disk_config.remote_to_roles_to_dev_fstype[remote] = {}
+            ctx.disk_config.remote_to_roles_to_dev_fstype[remote][role] = fs
+            devs_to_clean[remote].append(mnt_point)
+
+    for role in teuthology.cluster_roles_of_type(roles_for_host, 'osd', cluster_name):
+        _, _, id_ = teuthology.split_role(role)
+        remote.run(
+            args=[
+                'sudo',
+                'MALLOC_CHECK_=3',
+                'adjust-ulimits',
+                'zbkc-coverage',
+                coverage_dir,
+                'zbkc-osd',
+                '--cluster',
+                cluster_name,
+                '--mkfs',
+                '--mkkey',
+                '-i', id_,
+                '--monmap', monmap_path,
+            ],
+        )
+
+
 @contextlib.contextmanager
 def cluster(ctx, config):
     """
@@ -619,6 +744,7 @@ def cluster(ctx, config):
 
     log.info('Setting up mgr nodes...')
     mgrs = ctx.cluster.only(teuthology.is_type('mgr', cluster_name))
+    setup_procs = []
     for remote, roles_for_host in mgrs.remotes.iteritems():
         for role in teuthology.cluster_roles_of_type(roles_for_host, 'mgr',
                                                      cluster_name):
@@ -627,7 +753,7 @@ def cluster(ctx, config):
                 cluster=cluster_name,
                 id=id_,
             )
-            remote.run(
+            setup_procs.append(remote.run(
                 args=[
                     'sudo',
                     'mkdir',
@@ -644,10 +770,13 @@ def cluster(ctx, config):
                     '--name=mgr.{id}'.format(id=id_),
                     mgr_dir + '/keyring',
                 ],
-            )
+                wait=False,
+            ))
+    run.wait(setup_procs)
 
     log.info('Setting up mds nodes...')
     mdss = ctx.cluster.only(teuthology.is_type('mds', cluster_name))
+    setup_procs = []
     for remote, roles_for_host in mdss.remotes.iteritems():
         for role in teuthology.cluster_roles_of_type(roles_for_host, 'mds',
                                                      cluster_name):
@@ -656,7 +785,7 @@ def cluster(ctx, config):
                 cluster=cluster_name,
                 id=id_,
             )
-            remote.run(
+            setup_procs.append(remote.run(
                 args=[
                     'sudo',
                     'mkdir',
@@ -673,7 +802,9 @@ def cluster(ctx, config):
                     '--name=mds.{id}'.format(id=id_),
                     mds_dir + '/keyring',
                 ],
-            )
+                wait=False,
+            ))
+    run.wait(setup_procs)
 
     cclient.create_keyring(ctx, cluster_name)
     log.info('Running mkfs on osd nodes...')
@@ -693,143 +824,46 @@ def cluster(ctx, config):
     teuthology.deep_merge(ctx.disk_config.remote_to_roles_to_journals, remote_to_roles_to_journals)
 
     log.info("ctx.disk_config.remote_to_roles_to_dev: {r}".format(r=str(ctx.disk_config.remote_to_roles_to_dev)))
-    for remote, roles_for_host in osds.remotes.iteritems():
-        roles_to_devs = remote_to_roles_to_devs[remote]
-        roles_to_journals = remote_to_roles_to_journals[remote]
-
-        for role in teuthology.cluster_roles_of_type(roles_for_host, 'osd', cluster_name):
-            _, _, id_ = teuthology.split_role(role)
-            mnt_point = '/var/lib/zbkc/osd/{cluster}-{id}'.format(cluster=cluster_name, id=id_)
-            remote.run(
-                args=[
-                    'sudo',
-                    'mkdir',
-                    '-p',
-                    mnt_point,
-                ])
-            log.info(str(roles_to_journals))
-            log.info(role)
-            if roles_to_devs.get(role):
-                dev = roles_to_devs[role]
-                fs = config.get('fs')
-                package = None
-                mkfs_options = config.get('mkfs_options')
-                mount_options = config.get('mount_options')
-                if fs == 'btrfs':
-                    # package = 'btrfs-tools'
-                    if mount_options is None:
-                        mount_options = ['noatime', 'user_subvol_rm_allowed']
-                    if mkfs_options is None:
-                        mkfs_options = ['-m', 'single',
-                                        '-l', '32768',
-                                        '-n', '32768']
-                if fs == 'xfs':
-                    # package = 'xfsprogs'
-                    if mount_options is None:
-                        mount_options = ['noatime']
-                    if mkfs_options is None:
-                        mkfs_options = ['-f', '-i', 'size=2048']
-                if fs == 'ext4' or fs == 'ext3':
-                    if mount_options is None:
-                        mount_options = ['noatime', 'user_xattr']
-
-                if mount_options is None:
-                    mount_options = []
-                if mkfs_options is None:
-                    mkfs_options = []
-                mkfs = ['mkfs.%s' % fs] + mkfs_options
-                log.info('%s on %s on %s' % (mkfs, dev, remote))
-                if package is not None:
-                    remote.run(
-                        args=[
-                            'sudo',
-                            'apt-get', 'install', '-y', package
-                        ],
-                        stdout=StringIO(),
-                    )
-
-                try:
-                    remote.run(args=['yes', run.Raw('|')] + ['sudo'] + mkfs + [dev])
-                except run.CommandFailedError:
-                    # Newer btfs-tools doesn't prompt for overwrite, use -f
-                    if '-f' not in mount_options:
-                        mkfs_options.append('-f')
-                        mkfs = ['mkfs.%s' % fs] + mkfs_options
-                        log.info('%s on %s on %s' % (mkfs, dev, remote))
-                    remote.run(args=['yes', run.Raw('|')] + ['sudo'] + mkfs + [dev])
-
-                log.info('mount %s on %s -o %s' % (dev, remote,
-                                                   ','.join(mount_options)))
-                remote.run(
-                    args=[
-                        'sudo',
-                        'mount',
-                        '-t', fs,
-                        '-o', ','.join(mount_options),
-                        dev,
-                        mnt_point,
-                    ]
-                )
-                remote.run(
-                    args=[
-                        'sudo', '/sbin/restorecon', mnt_point,
-                    ],
-                    check_status=False,
-                )
-                if not remote in ctx.disk_config.remote_to_roles_to_dev_mount_options:
-                    ctx.disk_config.remote_to_roles_to_dev_mount_options[remote] = {}
-                ctx.disk_config.remote_to_roles_to_dev_mount_options[remote][role] = mount_options
-                if not remote in ctx.disk_config.remote_to_roles_to_dev_fstype:
-                    ctx.disk_config.remote_to_roles_to_dev_fstype[remote] = {}
-                ctx.disk_config.remote_to_roles_to_dev_fstype[remote][role] = fs
-                devs_to_clean[remote].append(mnt_point)
-
-        for role in teuthology.cluster_roles_of_type(roles_for_host, 'osd', cluster_name):
-            _, _, id_ = teuthology.split_role(role)
-            remote.run(
-                args=[
-                    'sudo',
-                    'MALLOC_CHECK_=3',
-                    'adjust-ulimits',
-                    'zbkc-coverage',
-                    coverage_dir,
-                    'zbkc-osd',
-                    '--cluster',
-                    cluster_name,
-                    '--mkfs',
-                    '--mkkey',
-                    '-i', id_,
-                    '--monmap', monmap_path,
-                ],
-            )
+    with parallel() as p:
+        for remote, roles_for_host in osds.remotes.iteritems():
+            p.spawn(osd_mkfs_remote, ctx, config, remote, roles_for_host,
+                    remote_to_roles_to_devs[remote], devs_to_clean)
 
     log.info('Reading keys from all nodes...')
-    keys_fp = StringIO()
     keys = []
+    reads = []
     for remote, roles_for_host in ctx.cluster.remotes.iteritems():
+        paths = []
         for type_ in ['mgr',  'mds', 'osd']:
             for role in teuthology.cluster_roles_of_type(roles_for_host, type_, cluster_name):
                 _, _, id_ = teuthology.split_role(role)
-                data = teuthology.get_file(
-                    remote=remote,
-                    path='/var/lib/zbkc/{type}/{cluster}-{id}/keyring'.format(
+                paths.append(
+                    '/var/lib/zbkc/{type}/{cluster}-{id}/keyring'.format(
                         type=type_,
                         id=id_,
                         cluster=cluster_name,
-                    ),
-                    sudo=True,
+                    )
                 )
-                keys.append((type_, id_, data))
-                keys_fp.write(data)
-    for remote, roles_for_host in ctx.cluster.remotes.iteritems():
+                keys.append((type_, id_))
         for role in teuthology.cluster_roles_of_type(roles_for_host, 'client', cluster_name):
             _, _, id_ = teuthology.split_role(role)
-            data = teuthology.get_file(
-                remote=remote,
-                path='/etc/zbkc/{cluster}.client.{id}.keyring'.format(id=id_, cluster=cluster_name)
+            paths.append(
+                '/etc/zbkc/{cluster}.client.{id}.keyring'.format(id=id_, cluster=cluster_name)
+            )
+            keys.append(('client', id_))
+        if paths:
+            # one read per host for all of its keyrings
+            reads.append(
+                remote.run(
+                    args=['sudo', 'cat', '--'] + paths,
+                    stdout=StringIO(),
+                    wait=False,
+                )
             )
-            keys.append(('client', id_, data))
-            keys_fp.write(data)
+    run.wait(reads)
+    keys_fp = StringIO()
+    for proc in reads:
+        keys_fp.write(proc.stdout.getvalue())
 
     log.info('Adding keys to all mons...')
     writes = mons.run(
@@ -844,39 +878,43 @@ def cluster(ctx, config):
     keys_fp.seek(0)
     teuthology.feed_many_stdins_and_close(keys_fp, writes)
     run.wait(writes)
-    for type_, id_, data in keys:
+    # set the caps of every key in a single command per mon host
+    authtool_args = []
+    for type_, id_ in keys:
+        if authtool_args:
+            authtool_args.append(run.Raw('&&'))
+        authtool_args.extend([
+            'sudo',
+            'adjust-ulimits',
+            'zbkc-coverage',
+            coverage_dir,
+            'zbkc-authtool',
+            keyring_path,
+            '--name={type}.{id}'.format(
+                type=type_,
+                id=id_,
+            ),
+        ] + list(generate_caps(type_)))
+    if authtool_args:
         run.wait(
             mons.run(
-                args=[
-                         'sudo',
-                         'adjust-ulimits',
-                         'zbkc-coverage',
-                         coverage_dir,
-                         'zbkc-authtool',
-                         keyring_path,
-                         '--name={type}.{id}'.format(
-                             type=type_,
-                             id=id_,
-                         ),
-                     ] + list(generate_caps(type_)),
+                args=authtool_args,
                 wait=False,
             ),
         )
 
     log.info('Running mkfs on mon nodes...')
+    mkfs_procs = []
     for remote, roles_for_host in mons.remotes.iteritems():
         for role in teuthology.cluster_roles_of_type(roles_for_host, 'mon', cluster_name):
             _, _, id_ = teuthology.split_role(role)
-            remote.run(
+            mkfs_procs.append(remote.run(
                 args=[
                     'sudo',
                     'mkdir',
                     '-p',
                     '/var/lib/zbkc/mon/{cluster}-{id}'.format(id=id_, cluster=cluster_name),
-                ],
-            )
-            remote.run(
-                args=[
+                    run.Raw('&&'),
                     'sudo',
                     'adjust-ulimits',
                     'zbkc-coverage',
@@ -889,7 +927,9 @@ def cluster(ctx, config):
                     '--osdmap', osdmap_path,
                     '--keyring', keyring_path,
                 ],
-            )
+                wait=False,
+            ))
+    run.wait(mkfs_procs)
 
     run.wait(
         mons.run(
@@ -1496,6 +1536,14 @@ def task(ctx, config):
         - zbkc:
             log-whitelist: ['foo.*bar', 'bad message']
 
+    To have the cluster manager send its mon commands through one
+    persistent, authenticated session instead of starting the zbkc CLI
+    for every command, use::
+
+        tasks:
+        - zbkc:
+            mon_command_session: true
+
     To run multiple zbkc clusters, use multiple zbkc tasks, and roles
     with a cluster name prefix, e.g. cluster1.client.0. Roles with no
     cluster use the default cluster name, 'zbkc'. OSDs from separate
@@ -1589,6 +1637,9 @@ def task(ctx, config):
             logger=log.getChild('zbkc_manager.' + config['cluster']),
             cluster=config['cluster'],
         )
+        if config.get('mon_command_session', False):
+            ctx.managers[config['cluster']].config['mon_command_session'] = \
+                True
 
         try:
             if config.get('wait-for-healthy', True):
@@ -1598,3 +1649,4 @@ def task(ctx, config):
         finally:
             if config.get('wait-for-scrub', True):
                 osd_scrub_pgs(ctx, config)
+            ctx.managers[config['cluster']].close_mon_session()
@@ -3,6 +3,8 @@ zbkc manager -- Thrasher and ZbkcManager objects
 """
 from cStringIO import StringIO
 from functools import wraps
+from textwrap import dedent
+import collections
 import contextlib
 import random
 import signal
@@ -11,12 +13,15 @@ import gevent
 import base64
 import json
 import logging
+import re
 import threading
 import traceback
 import os
 from teuthology import misc as teuthology
 from tasks.scrub import Scrubber
-from util.rados import cmd_erasure_code_profile
+from util.rados import cmd_erasure_code_profile, populate
+from util.bench import LatencyHistogram
+from util.batch import run_batch
 from util import get_remote
 from teuthology.contextutil import safe_while
 from teuthology.orchestra.remote import Remote
@@ -99,6 +104,9 @@ class Thrasher:
     """
     Object used to thrash Zbkc
     """
+    # how often to look at the pg map between actions, to time recovery
+    RECOVERY_POLL_INTERVAL = 1
+
     def __init__(self, manager, config, logger=None):
         self.zbkc_manager = manager
         self.cluster = manager.cluster
@@ -143,6 +151,8 @@ class Thrasher:
         except Exception:
             manager.raw_cluster_cmd('--', 'mon', 'tell', '*', 'injectargs',
                                     '--mon-osd-down-out-interval 0')
+        self.event_log = ThrashEventLog()
+        manager.subscribe_pg_snapshots(self.event_log.observe)
         self.thread = gevent.spawn(self.do_thrash)
         if self.sighup_delay:
             self.sighup_thread = gevent.spawn(self.do_sighup)
@@ -191,6 +201,7 @@ class Thrasher:
             osd = random.choice(self.live_osds)
         self.log("Killing osd %s, live_osds are %s" % (str(osd),
                                                        str(self.live_osds)))
+        self.event_log.annotate(osd)
         self.live_osds.remove(osd)
         self.dead_osds.append(osd)
         self.zbkc_manager.kill_osd(osd)
@@ -254,22 +265,18 @@ class Thrasher:
                                     "exp.{pg}.{id}".format(
                                         pg=pg,
                                         id=exp_osd))
-            # export
-            cmd = prefix + "--op export --pgid {pg} --file {file}"
-            cmd = cmd.format(id=exp_osd, pg=pg, file=exp_path)
-            proc = exp_remote.run(args=cmd)
-            if proc.exitstatus:
-                raise Exception("zbkc-objectstore-tool: "
-                                "export failure with status {ret}".
-                                format(ret=proc.exitstatus))
-            # remove
-            cmd = prefix + "--op remove --pgid {pg}"
-            cmd = cmd.format(id=exp_osd, pg=pg)
-            proc = exp_remote.run(args=cmd)
-            if proc.exitstatus:
-                raise Exception("zbkc-objectstore-tool: "
-                                "remove failure with status {ret}".
-                                format(ret=proc.exitstatus))
+            # export and remove, in one go
+            export_cmd = prefix + "--op export --pgid {pg} --file {file}"
+            remove_cmd = prefix + "--op remove --pgid {pg}"
+            results = run_batch(exp_remote, [
+                {'args': export_cmd.format(id=exp_osd, pg=pg, file=exp_path)},
+                {'args': remove_cmd.format(id=exp_osd, pg=pg)},
+            ], stop_on_error=True)
+            for op, result in zip(['export', 'remove'], results):
+                if result['exitstatus']:
+                    raise Exception("zbkc-objectstore-tool: "
+                                    "{op} failure with status {ret}".
+                                    format(op=op, ret=result['exitstatus']))
             # If there are at least 2 dead osds we might move the pg
             if exp_osd != imp_osd:
                 # If pg isn't already on this osd, then we will move it there
@@ -295,38 +302,41 @@ class Thrasher:
                     # Can't move the pg after all
                     imp_osd = exp_osd
                     imp_remote = exp_remote
-            # import
+            # import, and clean up the export on the importing side
             cmd = (prefix + "--op import --file {file}")
             cmd = cmd.format(id=imp_osd, file=exp_path)
-            proc = imp_remote.run(args=cmd, wait=True, check_status=False)
-            if proc.exitstatus == 10:
+            rm_cmd = "rm -f {file}".format(file=exp_path)
+            result = run_batch(imp_remote, [
+                {'args': cmd},
+                {'args': rm_cmd},
+            ])[0]
+            if result['exitstatus'] == 10:
                 self.log("Pool went away before processing an import"
                          "...ignored")
-            elif proc.exitstatus == 11:
+            elif result['exitstatus'] == 11:
                 self.log("Attempt to import an incompatible export"
                          "...ignored")
-            elif proc.exitstatus:
+            elif result['exitstatus']:
                 raise Exception("zbkc-objectstore-tool: "
                                 "import failure with status {ret}".
-                                format(ret=proc.exitstatus))
-            cmd = "rm -f {file}".format(file=exp_path)
-            exp_remote.run(args=cmd)
+                                format(ret=result['exitstatus']))
             if imp_remote != exp_remote:
-                imp_remote.run(args=cmd)
-
-            # apply low split settings to each pool
-            for pool in self.zbkc_manager.list_pools():
-                no_sudo_prefix = prefix[5:]
-                cmd = ("ZBKC_ARGS='--filestore-merge-threshold 1 "
-                       "--filestore-split-multiple 1' sudo -E "
-                       + no_sudo_prefix + "--op apply-layout-settings --pool " + pool).format(id=osd)
-                proc = remote.run(args=cmd, wait=True, check_status=False, stderr=StringIO())
-                output = proc.stderr.getvalue()
-                if 'Couldn\'t find pool' in output:
+                exp_remote.run(args=rm_cmd)
+
+            # apply low split settings to each pool, in one go
+            no_sudo_prefix = prefix[5:]
+            pools = self.zbkc_manager.list_pools()
+            results = run_batch(remote, [
+                {'args': ("ZBKC_ARGS='--filestore-merge-threshold 1 "
+                          "--filestore-split-multiple 1' sudo -E "
+                          + no_sudo_prefix + "--op apply-layout-settings --pool " + pool).format(id=osd)}
+                for pool in pools])
+            for pool, result in zip(pools, results):
+                if 'Couldn\'t find pool' in result['stderr']:
                     continue
-                if proc.exitstatus:
+                if result['exitstatus']:
                     raise Exception("zbkc-objectstore-tool apply-layout-settings"
-                                    " failed with {status}".format(status=proc.exitstatus))
+                                    " failed with {status}".format(status=result['exitstatus']))
 
     def rm_past_intervals(self, osd=None):
         """
@@ -365,6 +375,7 @@ class Thrasher:
                 self.log("No PGs found for osd.{osd}".format(osd=osd))
                 return
             pg = random.choice(pgs)
+            self.event_log.annotate(osd)
             cmd = (prefix + "--op rm-past-intervals --pgid {pg}").\
                 format(id=osd, pg=pg)
             proc = remote.run(args=cmd)
@@ -382,6 +393,7 @@ class Thrasher:
             osd = random.choice(self.live_osds)
         self.log("Blackholing and then killing osd %s, live_osds are %s" %
                  (str(osd), str(self.live_osds)))
+        self.event_log.annotate(osd)
         self.live_osds.remove(osd)
         self.dead_osds.append(osd)
         self.zbkc_manager.blackhole_kill_osd(osd)
@@ -394,6 +406,7 @@ class Thrasher:
         if osd is None:
             osd = random.choice(self.dead_osds)
         self.log("Reviving osd %s" % (str(osd),))
+        self.event_log.annotate(osd)
         self.zbkc_manager.revive_osd(
             osd,
             self.revive_timeout,
@@ -410,6 +423,7 @@ class Thrasher:
             osd = random.choice(self.in_osds)
         self.log("Removing osd %s, in_osds are: %s" %
                  (str(osd), str(self.in_osds)))
+        self.event_log.annotate(osd)
         self.zbkc_manager.mark_out_osd(osd)
         self.in_osds.remove(osd)
         self.out_osds.append(osd)
@@ -424,6 +438,7 @@ class Thrasher:
         if osd in self.dead_osds:
             return self.revive_osd(osd)
         self.log("Adding osd %s" % (str(osd),))
+        self.event_log.annotate(osd)
         self.out_osds.remove(osd)
         self.in_osds.append(osd)
         self.zbkc_manager.mark_in_osd(osd)
@@ -439,6 +454,7 @@ class Thrasher:
                 osd = random.choice(self.in_osds)
             val = random.uniform(.1, 1.0)
             self.log("Reweighting osd %s to %s" % (str(osd), str(val)))
+            self.event_log.annotate(osd)
             self.zbkc_manager.raw_cluster_cmd('osd', 'reweight',
                                               str(osd), str(val))
         else:
@@ -468,6 +484,7 @@ class Thrasher:
         else:
             pa = 0
         self.log('Setting osd %s primary_affinity to %f' % (str(osd), pa))
+        self.event_log.annotate(osd)
         self.zbkc_manager.raw_cluster_cmd('osd', 'primary-affinity',
                                           str(osd), str(pa))
 
@@ -552,6 +569,10 @@ class Thrasher:
         """
         the_one = random.choice(self.live_osds)
         self.log("inject_pause on {osd}".format(osd=the_one))
+        self.event_log.annotate(
+            the_one,
+            action='inject_pause_long' if should_be_down else 'inject_pause_short',
+            conf_key=conf_key)
         self.log(
             "Testing {key} pause injection for duration {duration}".format(
                 key=conf_key,
@@ -823,15 +844,56 @@ class Thrasher:
                     self.zbkc_manager.wait_for_recovery(
                         timeout=self.config.get('timeout')
                         )
+                self.event_log.settle()
                 time.sleep(self.clean_wait)
                 if scrubint > 0:
                     if random.uniform(0, 1) < (float(delay) / scrubint):
                         self.log('Scrubbing while thrashing being performed')
                         Scrubber(self.zbkc_manager, self.config)
-            self.choose_action()()
-            time.sleep(delay)
+            action = self.choose_action()
+            self.event_log.begin(action.__name__)
+            action()
+            event = self.event_log.end()
+            self.log("thrash event: {e}".format(
+                e=json.dumps(event, sort_keys=True)))
+            self.watch_recovery(delay)
         self.all_up()
 
+    def watch_recovery(self, seconds):
+        """
+        Sleep for the given number of seconds, looking at the pg map every
+        RECOVERY_POLL_INTERVAL seconds meanwhile while there are events
+        that have not been seen active and recovered yet.
+        """
+        deadline = time.time() + seconds
+        while self.event_log.recovering():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            self.zbkc_manager._next_pg_snapshot(
+                min(self.RECOVERY_POLL_INTERVAL, remaining),
+                PGMapSnapshot.is_recovered)
+        time.sleep(max(0, deadline - time.time()))
+
+    def save_events(self):
+        """
+        Stop measuring recovery times, and record the per-action summary
+        of the events in the job summary under 'thrashosds', and it and
+        every event in the archive as thrashosds-<cluster>.json.
+        """
+        self.zbkc_manager.unsubscribe_pg_snapshots(self.event_log.observe)
+        ctx = self.zbkc_manager.ctx
+        summary = self.event_log.summary()
+        ctx.summary.setdefault('thrashosds', {})[self.cluster] = summary
+        self.log("thrash event summary: {s}".format(s=json.dumps(summary)))
+        if ctx.archive is not None:
+            path = os.path.join(ctx.archive,
+                                'thrashosds-{c}.json'.format(c=self.cluster))
+            with open(path, 'w') as f:
+                json.dump({'summary': summary,
+                           'events': self.event_log.events},
+                          f, indent=2, sort_keys=True)
+
 
 class ObjectStoreTool:
 
@@ -899,6 +961,590 @@ class ObjectStoreTool:
                 self.manager.revive_osd(self.osd)
 
 
+class PGMapSnapshot(object):
+    """
+    One ``pg dump`` of the cluster, taken at a single point in time.
+
+    All of the derived pg counters used by the ZbkcManager waiters are
+    answered from the same dump, so a polling loop only needs to fetch
+    the pg map once per iteration.
+    """
+    def __init__(self, dump, stamp=None):
+        self.dump = dump
+        self.pg_stats = dump['pg_stats']
+        self.version = dump.get('version')
+        self.osdmap_epoch = dump.get('last_osdmap_epoch')
+        if stamp is None:
+            stamp = time.time()
+        self.stamp = stamp
+        self.state_counts = {}
+        for pg in self.pg_stats:
+            state = pg['state']
+            self.state_counts[state] = self.state_counts.get(state, 0) + 1
+
+    @classmethod
+    def from_state_counts(cls, state_counts, version=None, osdmap_epoch=None):
+        """
+        Build a snapshot from a pgmap summary (number of pgs per state)
+        rather than from a full pg dump.  Such a snapshot has no per-pg
+        stats, so it can only answer the state counters.
+        """
+        snap = cls({'version': version,
+                    'last_osdmap_epoch': osdmap_epoch,
+                    'pg_stats': []})
+        snap.state_counts = dict(state_counts)
+        return snap
+
+    def age(self):
+        """
+        Seconds elapsed since this snapshot was taken
+        """
+        return time.time() - self.stamp
+
+    def _count(self, predicate):
+        return sum([num for state, num in self.state_counts.iteritems()
+                    if predicate(state)])
+
+    def num_pgs(self):
+        """
+        Number of pgs in the snapshot
+        """
+        return sum(self.state_counts.values())
+
+    def num_creating(self):
+        """
+        Number of pgs in creating mode
+        """
+        return self._count(lambda s: 'creating' in s)
+
+    def num_active_clean(self):
+        """
+        Number of active and clean pgs
+        """
+        return self._count(lambda s: (s.count('active') and
+                                      s.count('clean') and
+                                      not s.count('stale')))
+
+    def num_active_recovered(self):
+        """
+        Number of active and recovered pgs
+        """
+        return self._count(lambda s: (s.count('active') and
+                                      not s.count('recover') and
+                                      not s.count('backfill') and
+                                      not s.count('stale')))
+
+    def num_active(self):
+        """
+        Number of active pgs
+        """
+        return self._count(lambda s: (s.count('active') and
+                                      not s.count('stale')))
+
+    def num_down(self):
+        """
+        Number of pgs that are down or incomplete
+        """
+        return self._count(lambda s: ((s.count('down') or
+                                       s.count('incomplete')) and
+                                      not s.count('stale')))
+
+    def num_active_down(self):
+        """
+        Number of pgs that are either active or down
+        """
+        return self._count(lambda s: ((s.count('active') or
+                                       s.count('down') or
+                                       s.count('incomplete')) and
+                                      not s.count('stale')))
+
+    def num_unfound_objects(self):
+        """
+        Number of unfound objects summed over all pgs
+        """
+        return sum([pg.get('stat_sum', {}).get('num_objects_unfound', 0)
+                    for pg in self.pg_stats])
+
+    def state_histogram(self):
+        """
+        Return a histogram of pg state values
+        """
+        ret = {}
+        for state, num in self.state_counts.iteritems():
+            for status in state.split('+'):
+                if status not in ret:
+                    ret[status] = 0
+                ret[status] += num
+        return ret
+
+    def is_clean(self):
+        return self.num_active_clean() == self.num_pgs()
+
+    def is_recovered(self):
+        return self.num_active_recovered() == self.num_pgs()
+
+    def is_active(self):
+        return self.num_active() == self.num_pgs()
+
+    def is_active_or_down(self):
+        return self.num_active_down() == self.num_pgs()
+
+
+class ThrashEventLog(object):
+    """
+    What a Thrasher did and when, and how long the cluster took to get
+    over it.
+
+    Each action is an event with the time it started, how long it took,
+    the osds it touched and the time from its start until the pg map was
+    next seen all active, recovered and clean.  An event waits for these
+    until the next recovery wait of the thrasher is over (see settle);
+    those not seen by then are left as None.
+    """
+    MEASURES = ['time_to_active', 'time_to_recovered', 'time_to_clean']
+
+    def __init__(self):
+        self.events = []
+        self.current = None
+        self.pending = []
+
+    def begin(self, action):
+        self.current = {
+            'action': action,
+            'time': time.time(),
+            'duration': None,
+            'osds': [],
+        }
+        for measure in self.MEASURES:
+            self.current[measure] = None
+
+    def annotate(self, osd=None, **fields):
+        """
+        Add an osd the current action touched, and any other fields, to its
+        event.  Does nothing outside of an action.
+        """
+        event = self.current
+        if event is None:
+            return
+        if osd is not None and osd not in event['osds']:
+            event['osds'].append(osd)
+        event.update(fields)
+
+    def end(self):
+        event = self.current
+        self.current = None
+        event['duration'] = time.time() - event['time']
+        self.events.append(event)
+        self.pending.append(event)
+        return event
+
+    def observe(self, snap):
+        """
+        Take note of a PGMapSnapshot taken while waiting on the cluster.
+        """
+        checks = [('time_to_active', snap.is_active),
+                  ('time_to_recovered', snap.is_recovered),
+                  ('time_to_clean', snap.is_clean)]
+        for event in self.pending:
+            if snap.stamp < event['time'] + event['duration']:
+                # taken before the action was over
+                continue
+            for measure, check in checks:
+                if event[measure] is None and check():
+                    event[measure] = snap.stamp - event['time']
+        self.pending = [event for event in self.pending
+                        if event['time_to_clean'] is None]
+
+    def recovering(self):
+        """
+        Whether some event has not been seen active and recovered yet
+        """
+        return any(event['time_to_active'] is None or
+                   event['time_to_recovered'] is None
+                   for event in self.pending)
+
+    def settle(self):
+        """
+        Stop measuring the events so far: the cluster has been waited on.
+        """
+        self.pending = []
+
+    def summary(self):
+        """
+        :return: dict of action to its number of events and the
+                 distributions of their duration and MEASURES
+        """
+        histograms = {}
+        for event in self.events:
+            action = histograms.setdefault(event['action'], {})
+            for measure in ['duration'] + self.MEASURES:
+                if event[measure] is not None:
+                    action.setdefault(
+                        measure, LatencyHistogram(unit=1e-3)).record(
+                            event[measure])
+        result = {}
+        for action, measures in histograms.iteritems():
+            result[action] = dict(
+                (measure, histogram.summary())
+                for measure, histogram in measures.iteritems())
+            result[action]['count'] = measures['duration'].count
+        return result
+
+
+MON_COMMAND_HELPER = dedent("""
+    import json
+    import subprocess
+    import sys
+
+    import rados
+    from zbkc_argparse import json_command, parse_json_funcsigs, \\
+        validate_command
+
+    cluster_name = sys.argv[1]
+    FALLBACK_OPTIONS = ('-m', '-c', '--conf', '-n', '--name', '--id',
+                        '-i', '-o', '-k', '--keyring')
+
+    def run_cli(args):
+        proc = subprocess.Popen(['zbkc', '--cluster', cluster_name] + args,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        return proc.returncode, out, err
+
+    def split_format(args):
+        fmt = None
+        words = []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg == '--':
+                words.extend(args[i + 1:])
+                break
+            elif arg.startswith('--format='):
+                fmt = arg.split('=', 1)[1]
+            elif arg in ('--format', '-f') and i + 1 < len(args):
+                fmt = args[i + 1]
+                i += 1
+            elif arg in FALLBACK_OPTIONS:
+                return None, None
+            else:
+                words.append(arg)
+            i += 1
+        return fmt, words
+
+    cluster = rados.Rados(conffile='', clustername=cluster_name)
+    cluster.connect()
+    ret, outbuf, outs = json_command(cluster,
+                                     prefix='get_command_descriptions')
+    sigdict = parse_json_funcsigs(outbuf, 'cli')
+
+    for line in iter(sys.stdin.readline, ''):
+        args = [str(a) for a in json.loads(line)['args']]
+        fmt, words = split_format(args)
+        valid = None
+        if words and words[0] not in ('tell', 'daemon'):
+            valid = validate_command(sigdict, words)
+        if not valid:
+            exitstatus, out, err = run_cli(args)
+        else:
+            if fmt:
+                valid['format'] = fmt
+            ret, out, err = json_command(cluster, argdict=valid, timeout=120)
+            exitstatus = -ret if ret < 0 else ret
+            if out and fmt and fmt.startswith('json'):
+                # the CLI starts json output with a blank line, which
+                # callers skip
+                out = '\\n' + out
+        sys.stdout.write(json.dumps({'exitstatus': exitstatus,
+                                     'stdout': out,
+                                     'stderr': err}) + '\\n')
+        sys.stdout.flush()
+    cluster.shutdown()
+    """)
+
+
+class MonCommandSession(object):
+    """
+    A long-lived command channel to the mons of one cluster.
+
+    The helper process reads one JSON request per line on stdin and
+    answers each with one JSON line on stdout, so the process startup,
+    authentication and monmap fetch of the zbkc CLI are paid once rather
+    than for every command.  Commands that it cannot send through its
+    mon session (tell, daemon, ...) are handed to the zbkc CLI by the
+    helper itself.
+    """
+    def __init__(self, remote, args):
+        self.remote = remote
+        self.args = args
+        self.proc = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.proc = self.remote.run(
+            args=self.args,
+            stdin=run.PIPE,
+            stdout=run.PIPE,
+            wait=False,
+            )
+
+    def command(self, args):
+        """
+        Send one command to the helper.
+
+        :param args: the arguments that would follow "zbkc --cluster X"
+        :returns: (exitstatus, stdout) of the command
+        """
+        with self.lock:
+            if self.proc is None:
+                self.start()
+            self.proc.stdin.write(json.dumps({'args': list(args)}) + '\n')
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+            if not line:
+                self.proc = None
+                raise RuntimeError('mon command helper exited while running '
+                                   '{args}'.format(args=args))
+            reply = json.loads(line)
+            return reply['exitstatus'], str(reply['stdout'])
+
+    def close(self):
+        """
+        Close the helper's stdin and wait for it to exit.
+        """
+        with self.lock:
+            if self.proc is not None:
+                self.proc.stdin.close()
+                self.proc.wait()
+                self.proc = None
+
+
+class LogMatcher(object):
+    """
+    Watch cluster log lines for the first one matching a pattern: a plain
+    string (matched as a substring), a compiled regex, or a predicate
+    taking the line.
+    """
+    def __init__(self, pattern):
+        self.pattern = pattern
+        if hasattr(pattern, 'search'):
+            self.predicate = pattern.search
+        elif callable(pattern):
+            self.predicate = pattern
+        else:
+            self.predicate = lambda line: pattern in line
+        self.line = None
+
+    @property
+    def matched(self):
+        return self.line is not None
+
+    def feed(self, line):
+        if self.line is None and self.predicate(line):
+            self.line = line
+
+
+class ClusterWatcher(object):
+    """
+    Follow the output of a long-running ``zbkc -w`` and keep the latest
+    pgmap, osdmap, fsmap epoch and quorum it reported, so that waiters can block until
+    the cluster changes instead of sleeping and re-querying the mons.
+
+    The watcher is handed to the remote process as its stdout; every
+    complete line written to it is parsed, passed to any subscribed
+    LogMatchers and wakes up the waiters.  Only the last RECENT_LINES
+    lines are kept.
+    """
+    PGMAP_RE = re.compile(r'pgmap v(\d+): (\d+) pgs: ([^;]*)')
+    OSDMAP_RE = re.compile(r'osdmap e(\d+): (\d+) osds: (\d+) up, (\d+) in')
+    QUORUM_RE = re.compile(r'won leader election with quorum ([\d,]+)')
+    FSMAP_RE = re.compile(r'(?:fsmap|mdsmap) e(\d+):')
+    RECENT_LINES = 1000
+    # How often a waiter checks that "zbkc -w" is still there
+    EXIT_CHECK_INTERVAL = 1.0
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.cond = threading.Condition()
+        self.proc = None
+        self.pgmap = None
+        self.osdmap_epoch = None
+        self.num_osds = None
+        self.num_up_osds = None
+        self.num_in_osds = None
+        self.fsmap_epoch = None
+        self.quorum = None
+        self.recent = collections.deque(maxlen=self.RECENT_LINES)
+        self.matchers = []
+        self._partial = ''
+
+    def start(self):
+        """
+        Start following ``zbkc -w`` on the manager's controller.
+        """
+        self.proc = self.manager.run_zbkc_w(stdout=self)
+
+    def stop(self):
+        """
+        Stop the ``zbkc -w`` process and wake any waiter.
+        """
+        if self.proc is not None:
+            self.proc.stdin.close()
+            try:
+                self.proc.wait()
+            except CommandFailedError:
+                pass
+            self.proc = None
+        with self.cond:
+            self.cond.notify_all()
+
+    def running(self):
+        """
+        Whether the ``zbkc -w`` process is still there: once it has exited
+        nothing will update the watched state any more.
+        """
+        return self.proc is not None and not self.proc.finished
+
+    def write(self, data):
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self.handle_line(line)
+
+    def flush(self):
+        pass
+
+    def handle_line(self, line):
+        """
+        Update the watched state from one line of ``zbkc -w`` output.
+        """
+        with self.cond:
+            self.recent.append(line)
+            for matcher in self.matchers:
+                matcher.feed(line)
+            m = self.PGMAP_RE.search(line)
+            if m:
+                counts = {}
+                for item in m.group(3).split(','):
+                    item = item.strip()
+                    if not item:
+                        continue
+                    num, state = item.split(' ', 1)
+                    counts[state] = int(num)
+                self.pgmap = PGMapSnapshot.from_state_counts(
+                    counts, version=int(m.group(1)),
+                    osdmap_epoch=self.osdmap_epoch)
+            m = self.OSDMAP_RE.search(line)
+            if m:
+                self.osdmap_epoch = int(m.group(1))
+                self.num_osds = int(m.group(2))
+                self.num_up_osds = int(m.group(3))
+                self.num_in_osds = int(m.group(4))
+            m = self.FSMAP_RE.search(line)
+            if m:
+                self.fsmap_epoch = int(m.group(1))
+            m = self.QUORUM_RE.search(line)
+            if m:
+                self.quorum = [int(r) for r in m.group(1).split(',')]
+            self.cond.notify_all()
+
+    def subscribe(self, matcher):
+        """
+        Feed every line from now on to matcher, until unsubscribe().
+
+        :returns: matcher
+        """
+        with self.cond:
+            self.matchers.append(matcher)
+        return matcher
+
+    def unsubscribe(self, matcher):
+        with self.cond:
+            self.matchers.remove(matcher)
+
+    def wait(self, predicate, timeout):
+        """
+        Block until predicate(self) is true or timeout seconds pass.
+
+        :returns: the final value of predicate(self)
+        """
+        end = time.time() + timeout
+        with self.cond:
+            while not predicate(self):
+                remaining = end - time.time()
+                if remaining <= 0 or not self.running():
+                    break
+                self.cond.wait(min(remaining, self.EXIT_CHECK_INTERVAL))
+            return predicate(self)
+
+
+class PGStatsIndex(object):
+    """
+    pg_stats of the cluster indexed by pgid.
+
+    Entries are replaced only when the pg reports something new, so
+    callers can tell which pgs changed between two refreshes and look a
+    single pg up without scanning the whole pg map.
+    """
+    def __init__(self):
+        self.pgs = {}
+
+    @staticmethod
+    def _report_key(pg):
+        return (pg.get('reported_epoch'), pg.get('reported_seq'),
+                pg['state'])
+
+    def update(self, pg_stats):
+        """
+        Merge a full list of pg_stats into the index.
+
+        :returns: the set of pgids that were added, changed or removed
+        """
+        changed = set()
+        seen = set()
+        for pg in pg_stats:
+            pgid = pg['pgid']
+            seen.add(pgid)
+            old = self.pgs.get(pgid)
+            if old is None or self._report_key(old) != self._report_key(pg):
+                self.pgs[pgid] = pg
+                changed.add(pgid)
+        for pgid in set(self.pgs.keys()) - seen:
+            del self.pgs[pgid]
+            changed.add(pgid)
+        return changed
+
+    def update_brief(self, pgs_brief):
+        """
+        Merge the output of ``pg dump pgs_brief`` into the index.  Only the
+        state, up and acting fields are refreshed; the rest of a known pg's
+        stats are kept from the last full update.
+
+        :returns: the set of pgids whose brief fields changed
+        """
+        changed = set()
+        seen = set()
+        for brief in pgs_brief:
+            pgid = brief['pgid']
+            seen.add(pgid)
+            old = self.pgs.get(pgid, {})
+            if any(old.get(k) != v for k, v in brief.iteritems()):
+                entry = dict(old)
+                entry.update(brief)
+                self.pgs[pgid] = entry
+                changed.add(pgid)
+        for pgid in set(self.pgs.keys()) - seen:
+            del self.pgs[pgid]
+            changed.add(pgid)
+        return changed
+
+    def get(self, pgid):
+        """
+        :returns: the stats of pgid, or None if it is not known
+        """
+        return self.pgs.get(pgid)
+
+
 class ZbkcManager:
     """
     Zbkc manager object.
@@ -930,6 +1576,7 @@ class ZbkcManager:
             self.log = tmp
         if self.config is None:
             self.config = dict()
+        self._init_cluster_state(self.config.get('pg_snapshot_ttl', 1.0))
         pools = self.list_pools()
         self.pools = {}
         for pool in pools:
@@ -939,10 +1586,65 @@ class ZbkcManager:
             except CommandFailedError:
                 self.log('Failed to get pg_num from pool %s, ignoring' % pool)
 
+    def _init_cluster_state(self, pg_snapshot_ttl):
+        """
+        Set up the cached pg snapshot and indexes, the cluster watcher and
+        the mon session.  Subclasses that skip __init__ must call this.
+        """
+        self.pg_snapshot_ttl = pg_snapshot_ttl
+        self._pg_snapshot = None
+        self.pg_snapshot_subscribers = []
+        self.pg_index = PGStatsIndex()
+        # Kept apart from pg_index so that an entry there always holds the
+        # stats of a single full pg dump
+        self.pg_brief_index = PGStatsIndex()
+        self.watcher = None
+        self.mon_session = None
+
+    def _mon_session_command(self, args):
+        """
+        Run a command through the persistent mon session, starting it if
+        needed.  Used instead of the zbkc CLI when the mon_command_session
+        config option is set.
+
+        :returns: (exitstatus, stdout) of the command
+        """
+        if self.mon_session is None:
+            testdir = teuthology.get_testdir(self.ctx)
+            self.mon_session = MonCommandSession(
+                self.controller,
+                [
+                    'sudo',
+                    'adjust-ulimits',
+                    'zbkc-coverage',
+                    '{tdir}/archive/coverage'.format(tdir=testdir),
+                    'python',
+                    '-u',
+                    '-c',
+                    MON_COMMAND_HELPER,
+                    self.cluster,
+                ])
+        return self.mon_session.command(args)
+
+    def close_mon_session(self):
+        """
+        Stop the persistent mon session, if one was started.
+        """
+        if self.mon_session is not None:
+            self.mon_session.close()
+            self.mon_session = None
+
     def raw_cluster_cmd(self, *args):
         """
         Start zbkc on a raw cluster.  Return count
         """
+        if self.config.get('mon_command_session', False):
+            exitstatus, out = self._mon_session_command(args)
+            if exitstatus != 0:
+                raise CommandFailedError(['zbkc', '--cluster', self.cluster] +
+                                         list(args), exitstatus,
+                                         self.controller.name)
+            return out
         testdir = teuthology.get_testdir(self.ctx)
         zbkc_args = [
             'sudo',
@@ -966,6 +1668,9 @@ class ZbkcManager:
         """
         Start zbkc on a cluster.  Return success or failure information.
         """
+        if self.config.get('mon_command_session', False):
+            exitstatus, out = self._mon_session_command(args)
+            return exitstatus
         testdir = teuthology.get_testdir(self.ctx)
         zbkc_args = [
             'sudo',
@@ -985,11 +1690,13 @@ class ZbkcManager:
             )
         return proc.exitstatus
 
-    def run_zbkc_w(self):
+    def run_zbkc_w(self, stdout=None):
         """
-        Execute "zbkc -w" in the background with stdout connected to a StringIO,
-        and return the RemoteProcess.
+        Execute "zbkc -w" in the background with stdout connected to a StringIO
+        (or to stdout, if given), and return the RemoteProcess.
         """
+        if stdout is None:
+            stdout = StringIO()
         return self.controller.run(
             args=["sudo",
                   "daemon-helper",
@@ -998,7 +1705,96 @@ class ZbkcManager:
                   '--cluster',
                   self.cluster,
                   "-w"],
-            wait=False, stdout=StringIO(), stdin=run.PIPE)
+            wait=False, stdout=stdout, stdin=run.PIPE)
+
+    def start_watching(self):
+        """
+        Follow the cluster with a persistent "zbkc -w" so that the wait_*
+        helpers wake up as soon as the maps change rather than on their
+        next polling interval.
+        """
+        with self.lock:
+            if self.watcher is None:
+                self.watcher = ClusterWatcher(self)
+                self.watcher.start()
+
+    def stop_watching(self):
+        """
+        Stop the "zbkc -w" started by start_watching.
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def _live_watcher(self):
+        """
+        :returns: the watcher, if there is one and its "zbkc -w" is still
+                  running.  A watcher whose process has died is restarted,
+                  and None returned so that the caller polls this time.
+        """
+        with self.lock:
+            watcher = self.watcher
+            if watcher is None or watcher.running():
+                return watcher
+            self.log('zbkc -w exited, restarting the cluster watcher')
+            watcher.stop()
+            self.watcher = ClusterWatcher(self)
+            self.watcher.start()
+            return None
+
+    def _wait_for_cluster_change(self, interval, predicate):
+        """
+        Sleep for interval seconds, or less if the cluster is being watched
+        and predicate(watcher) becomes true first.  A predicate that
+        already holds cannot signal anything, so it is only waited on once
+        it is false; it should compare against the epoch or version seen
+        before the wait.
+        """
+        watcher = self._live_watcher()
+        if watcher is None or predicate(watcher):
+            time.sleep(interval)
+        else:
+            watcher.wait(predicate, interval)
+
+    def _next_pg_snapshot(self, interval, done):
+        """
+        Wait for the next pg snapshot in a polling loop.
+
+        Without a watcher this sleeps interval seconds and fetches a pg
+        dump.  With one, the pgmap summary from "zbkc -w" is returned
+        without any mon command while it keeps being updated, until
+        done(pgmap) holds, at which point a pg dump is fetched to
+        confirm it.
+
+        :param done: a PGMapSnapshot method, e.g. PGMapSnapshot.is_clean
+        """
+        watcher = self._live_watcher()
+        if (watcher is None or
+                watcher.pgmap is None or done(watcher.pgmap)):
+            # nothing to wait on, or the stream already says we are
+            # done and the last pg dump disagreed: poll as usual
+            time.sleep(interval)
+            return self.get_pg_snapshot(max_age=0)
+        if (watcher.wait(lambda w: done(w.pgmap), interval) or
+                watcher.pgmap.age() >= interval):
+            return self.get_pg_snapshot(max_age=0)
+        self._publish_pg_snapshot(watcher.pgmap)
+        return watcher.pgmap
+
+    def subscribe_pg_snapshots(self, callback):
+        """
+        Have callback called with every new PGMapSnapshot taken, whether
+        from a pg dump or from the pgmap summary of "zbkc -w".
+        """
+        self.pg_snapshot_subscribers.append(callback)
+
+    def unsubscribe_pg_snapshots(self, callback):
+        if callback in self.pg_snapshot_subscribers:
+            self.pg_snapshot_subscribers.remove(callback)
+
+    def _publish_pg_snapshot(self, snap):
+        for callback in list(self.pg_snapshot_subscribers):
+            callback(snap)
 
     def do_rados(self, remote, cmd, check_status=True):
         """
@@ -1056,6 +1852,14 @@ class ZbkcManager:
             check_status=False
         ).exitstatus
 
+    def do_populate(self, pool, objects):
+        """
+        Create many objects at once, see util.rados.populate
+
+        :returns: list of failures
+        """
+        return populate(self.controller, pool, objects, cluster=self.cluster)
+
     def do_get(self, pool, obj, fname='/dev/null', namespace=None):
         """
         Implement rados get operation
@@ -1163,25 +1967,17 @@ class ZbkcManager:
         """
         get replica for pool, pgnum (e.g. (data, 0)->0
         """
-        output = self.raw_cluster_cmd("pg", "dump", '--format=json')
-        j = json.loads('\n'.join(output.split('\n')[1:]))
-        pg_str = self.get_pgid(pool, pgnum)
-        for pg in j['pg_stats']:
-            if pg['pgid'] == pg_str:
-                return int(pg['acting'][-1])
-        assert False
+        pg = self.get_pg_brief(self.get_pgid(pool, pgnum))
+        assert pg is not None
+        return int(pg['acting'][-1])
 
     def get_pg_primary(self, pool, pgnum):
         """
         get primary for pool, pgnum (e.g. (data, 0)->0
         """
-        output = self.raw_cluster_cmd("pg", "dump", '--format=json')
-        j = json.loads('\n'.join(output.split('\n')[1:]))
-        pg_str = self.get_pgid(pool, pgnum)
-        for pg in j['pg_stats']:
-            if pg['pgid'] == pg_str:
-                return int(pg['acting'][0])
-        assert False
+        pg = self.get_pg_brief(self.get_pgid(pool, pgnum))
+        assert pg is not None
+        return int(pg['acting'][0])
 
     def get_pool_num(self, pool):
         """
@@ -1532,49 +2328,90 @@ class ZbkcManager:
             del r['more']
         return r
 
+    def get_pg_snapshot(self, max_age=None, min_osdmap_epoch=None):
+        """
+        Return a PGMapSnapshot of the cluster, reusing the last one taken
+        if it is recent enough.
+
+        :param max_age: maximum age in seconds of a reusable snapshot,
+                        defaults to the pg_snapshot_ttl config option.
+                        Pass 0 to always fetch a new pg dump.
+        :param min_osdmap_epoch: if set, a snapshot taken against an older
+                                 osdmap epoch is never reused.
+        """
+        if max_age is None:
+            max_age = self.pg_snapshot_ttl
+        snap = self._pg_snapshot
+        if (snap is None or snap.age() >= max_age or
+                (min_osdmap_epoch is not None and
+                 snap.osdmap_epoch < min_osdmap_epoch)):
+            out = self.raw_cluster_cmd('pg', 'dump', '--format=json')
+            j = json.loads('\n'.join(out.split('\n')[1:]))
+            snap = PGMapSnapshot(j)
+            self._pg_snapshot = snap
+            self.pg_index.update(snap.pg_stats)
+            self._publish_pg_snapshot(snap)
+        return snap
+
+    def invalidate_pg_snapshot(self):
+        """
+        Forget the cached pg snapshot so the next query fetches a new one.
+        """
+        self._pg_snapshot = None
+
+    def refresh_pg_index_brief(self):
+        """
+        Refresh the state, up and acting sets of every pg in
+        pg_brief_index from ``pg dump pgs_brief``, which is much smaller
+        than a full pg dump.
+
+        :returns: the set of pgids whose brief fields changed
+        """
+        out = self.raw_cluster_cmd('pg', 'dump', 'pgs_brief', '--format=json')
+        j = json.loads('\n'.join(out.split('\n')[1:]))
+        if isinstance(j, dict):
+            j = j['pg_stats']
+        return self.pg_brief_index.update_brief(j)
+
+    def get_pg_brief(self, pgid):
+        """
+        Return the current state, up and acting sets of pgid, or None if
+        there is no such pg.
+        """
+        self.refresh_pg_index_brief()
+        return self.pg_brief_index.get(pgid)
+
     def get_pg_stats(self):
         """
         Dump the cluster and get pg stats
         """
-        out = self.raw_cluster_cmd('pg', 'dump', '--format=json')
-        j = json.loads('\n'.join(out.split('\n')[1:]))
-        return j['pg_stats']
+        return self.get_pg_snapshot(max_age=0).pg_stats
 
     def compile_pg_status(self):
         """
         Return a histogram of pg state values
         """
-        ret = {}
-        j = self.get_pg_stats()
-        for pg in j:
-            for status in pg['state'].split('+'):
-                if status not in ret:
-                    ret[status] = 0
-                ret[status] += 1
-        return ret
+        return self.get_pg_snapshot(max_age=0).state_histogram()
 
     def pg_scrubbing(self, pool, pgnum):
         """
         pg scrubbing wrapper
         """
-        pgstr = self.get_pgid(pool, pgnum)
-        stats = self.get_single_pg_stats(pgstr)
+        stats = self.get_pg_brief(self.get_pgid(pool, pgnum))
         return 'scrub' in stats['state']
 
     def pg_repairing(self, pool, pgnum):
         """
         pg repairing wrapper
         """
-        pgstr = self.get_pgid(pool, pgnum)
-        stats = self.get_single_pg_stats(pgstr)
+        stats = self.get_pg_brief(self.get_pgid(pool, pgnum))
         return 'repair' in stats['state']
 
     def pg_inconsistent(self, pool, pgnum):
         """
         pg inconsistent wrapper
         """
-        pgstr = self.get_pgid(pool, pgnum)
-        stats = self.get_single_pg_stats(pgstr)
+        stats = self.get_pg_brief(self.get_pgid(pool, pgnum))
         return 'inconsistent' in stats['state']
 
     def get_last_scrub_stamp(self, pool, pgnum):
@@ -1606,15 +2443,10 @@ class ZbkcManager:
 
     def get_single_pg_stats(self, pgid):
         """
-        Return pg for the pgid specified.
+        Return pg for the pgid specified, from a new pg dump.
         """
-        all_stats = self.get_pg_stats()
-
-        for pg in all_stats:
-            if pg['pgid'] == pgid:
-                return pg
-
-        return None
+        self.get_pg_snapshot(max_age=0)
+        return self.pg_index.get(pgid)
 
     def get_object_pg_with_shard(self, pool, name, osdid):
         """
@@ -1667,49 +2499,27 @@ class ZbkcManager:
 
     def get_num_unfound_objects(self):
         """
-        Check cluster status to get the number of unfound objects
+        Check the pg map to get the number of unfound objects
         """
-        status = self.raw_cluster_status()
-        self.log(status)
-        return status['pgmap'].get('unfound_objects', 0)
+        return self.get_pg_snapshot().num_unfound_objects()
 
     def get_num_creating(self):
         """
         Find the number of pgs in creating mode.
         """
-        pgs = self.get_pg_stats()
-        num = 0
-        for pg in pgs:
-            if 'creating' in pg['state']:
-                num += 1
-        return num
+        return self.get_pg_snapshot().num_creating()
 
     def get_num_active_clean(self):
         """
         Find the number of active and clean pgs.
         """
-        pgs = self.get_pg_stats()
-        num = 0
-        for pg in pgs:
-            if (pg['state'].count('active') and
-                    pg['state'].count('clean') and
-                    not pg['state'].count('stale')):
-                num += 1
-        return num
+        return self.get_pg_snapshot().num_active_clean()
 
     def get_num_active_recovered(self):
         """
         Find the number of active and recovered pgs.
         """
-        pgs = self.get_pg_stats()
-        num = 0
-        for pg in pgs:
-            if (pg['state'].count('active') and
-                    not pg['state'].count('recover') and
-                    not pg['state'].count('backfill') and
-                    not pg['state'].count('stale')):
-                num += 1
-        return num
+        return self.get_pg_snapshot().num_active_recovered()
 
     def get_is_making_recovery_progress(self):
         """
@@ -1726,60 +2536,37 @@ class ZbkcManager:
         """
         Find the number of active pgs.
         """
-        pgs = self.get_pg_stats()
-        num = 0
-        for pg in pgs:
-            if pg['state'].count('active') and not pg['state'].count('stale'):
-                num += 1
-        return num
+        return self.get_pg_snapshot().num_active()
 
     def get_num_down(self):
         """
         Find the number of pgs that are down.
         """
-        pgs = self.get_pg_stats()
-        num = 0
-        for pg in pgs:
-            if ((pg['state'].count('down') and not
-                    pg['state'].count('stale')) or
-                (pg['state'].count('incomplete') and not
-                    pg['state'].count('stale'))):
-                num += 1
-        return num
+        return self.get_pg_snapshot().num_down()
 
     def get_num_active_down(self):
         """
         Find the number of pgs that are either active or down.
         """
-        pgs = self.get_pg_stats()
-        num = 0
-        for pg in pgs:
-            if ((pg['state'].count('active') and not
-                    pg['state'].count('stale')) or
-                (pg['state'].count('down') and not
-                    pg['state'].count('stale')) or
-                (pg['state'].count('incomplete') and not
-                    pg['state'].count('stale'))):
-                num += 1
-        return num
+        return self.get_pg_snapshot().num_active_down()
 
     def is_clean(self):
         """
         True if all pgs are clean
         """
-        return self.get_num_active_clean() == self.get_num_pgs()
+        return self.get_pg_snapshot().is_clean()
 
     def is_recovered(self):
         """
         True if all pgs have recovered
         """
-        return self.get_num_active_recovered() == self.get_num_pgs()
+        return self.get_pg_snapshot().is_recovered()
 
     def is_active_or_down(self):
         """
         True if all pgs are active or down
         """
-        return self.get_num_active_down() == self.get_num_pgs()
+        return self.get_pg_snapshot().is_active_or_down()
 
     def wait_for_clean(self, timeout=None):
         """
@@ -1787,8 +2574,9 @@ class ZbkcManager:
         """
         self.log("waiting for clean")
         start = time.time()
-        num_active_clean = self.get_num_active_clean()
-        while not self.is_clean():
+        snap = self.get_pg_snapshot(max_age=0)
+        num_active_clean = snap.num_active_clean()
+        while not snap.is_clean():
             if timeout is not None:
                 if self.get_is_making_recovery_progress():
                     self.log("making progress, resetting timeout")
@@ -1801,11 +2589,11 @@ class ZbkcManager:
                         self.log(out)
                         assert time.time() - start < timeout, \
                             'failed to become clean before timeout expired'
-            cur_active_clean = self.get_num_active_clean()
+            cur_active_clean = snap.num_active_clean()
             if cur_active_clean != num_active_clean:
                 start = time.time()
                 num_active_clean = cur_active_clean
-            time.sleep(3)
+            snap = self._next_pg_snapshot(3, PGMapSnapshot.is_clean)
         self.log("clean!")
 
     def are_all_osds_up(self):
@@ -1826,7 +2614,11 @@ class ZbkcManager:
             if timeout is not None:
                 assert time.time() - start < timeout, \
                     'timeout expired in wait_for_all_up'
-            time.sleep(3)
+            epoch = self.watcher and self.watcher.osdmap_epoch
+            self._wait_for_cluster_change(
+                3, lambda w: (w.osdmap_epoch != epoch and
+                              w.num_osds is not None and
+                              w.num_up_osds == w.num_osds))
         self.log("all up!")
 
     def wait_for_recovery(self, timeout=None):
@@ -1835,8 +2627,9 @@ class ZbkcManager:
         """
         self.log("waiting for recovery to complete")
         start = time.time()
-        num_active_recovered = self.get_num_active_recovered()
-        while not self.is_recovered():
+        snap = self.get_pg_snapshot(max_age=0)
+        num_active_recovered = snap.num_active_recovered()
+        while not snap.is_recovered():
             now = time.time()
             if timeout is not None:
                 if self.get_is_making_recovery_progress():
@@ -1850,11 +2643,11 @@ class ZbkcManager:
                         self.log(out)
                         assert now - start < timeout, \
                             'failed to recover before timeout expired'
-            cur_active_recovered = self.get_num_active_recovered()
+            cur_active_recovered = snap.num_active_recovered()
             if cur_active_recovered != num_active_recovered:
                 start = time.time()
                 num_active_recovered = cur_active_recovered
-            time.sleep(3)
+            snap = self._next_pg_snapshot(3, PGMapSnapshot.is_recovered)
         self.log("recovered!")
 
     def wait_for_active(self, timeout=None):
@@ -1863,8 +2656,9 @@ class ZbkcManager:
         """
         self.log("waiting for peering to complete")
         start = time.time()
-        num_active = self.get_num_active()
-        while not self.is_active():
+        snap = self.get_pg_snapshot(max_age=0)
+        num_active = snap.num_active()
+        while not snap.is_active():
             if timeout is not None:
                 if time.time() - start >= timeout:
                     self.log('dumping pgs')
@@ -1872,11 +2666,11 @@ class ZbkcManager:
                     self.log(out)
                     assert time.time() - start < timeout, \
                         'failed to recover before timeout expired'
-            cur_active = self.get_num_active()
+            cur_active = snap.num_active()
             if cur_active != num_active:
                 start = time.time()
                 num_active = cur_active
-            time.sleep(3)
+            snap = self._next_pg_snapshot(3, PGMapSnapshot.is_active)
         self.log("active!")
 
     def wait_for_active_or_down(self, timeout=None):
@@ -1886,8 +2680,9 @@ class ZbkcManager:
         """
         self.log("waiting for peering to complete or become blocked")
         start = time.time()
-        num_active_down = self.get_num_active_down()
-        while not self.is_active_or_down():
+        snap = self.get_pg_snapshot(max_age=0)
+        num_active_down = snap.num_active_down()
+        while not snap.is_active_or_down():
             if timeout is not None:
                 if time.time() - start >= timeout:
                     self.log('dumping pgs')
@@ -1895,11 +2690,11 @@ class ZbkcManager:
                     self.log(out)
                     assert time.time() - start < timeout, \
                         'failed to recover before timeout expired'
-            cur_active_down = self.get_num_active_down()
+            cur_active_down = snap.num_active_down()
             if cur_active_down != num_active_down:
                 start = time.time()
                 num_active_down = cur_active_down
-            time.sleep(3)
+            snap = self._next_pg_snapshot(3, PGMapSnapshot.is_active_or_down)
         self.log("active or down!")
 
     def osd_is_up(self, osd):
@@ -1919,14 +2714,16 @@ class ZbkcManager:
             if timeout is not None:
                 assert time.time() - start < timeout, \
                     'osd.%d failed to come up before timeout expired' % osd
-            time.sleep(3)
+            epoch = self.watcher and self.watcher.osdmap_epoch
+            self._wait_for_cluster_change(
+                3, lambda w: w.osdmap_epoch != epoch)
         self.log('osd.%d is up' % osd)
 
     def is_active(self):
         """
         Wrapper to check if all pgs are active
         """
-        return self.get_num_active() == self.get_num_pgs()
+        return self.get_pg_snapshot().is_active()
 
     def wait_till_active(self, timeout=None):
         """
@@ -1934,7 +2731,8 @@ class ZbkcManager:
         """
         self.log("waiting till active")
         start = time.time()
-        while not self.is_active():
+        snap = self.get_pg_snapshot(max_age=0)
+        while not snap.is_active():
             if timeout is not None:
                 if time.time() - start >= timeout:
                     self.log('dumping pgs')
@@ -1942,7 +2740,7 @@ class ZbkcManager:
                     self.log(out)
                     assert time.time() - start < timeout, \
                         'failed to become active before timeout expired'
-            time.sleep(3)
+            snap = self._next_pg_snapshot(3, PGMapSnapshot.is_active)
         self.log("active!")
 
     def mark_out_osd(self, osd):
@@ -2109,7 +2907,10 @@ class ZbkcManager:
                 assert time.time() - start < timeout, \
                     ('failed to reach quorum size %d '
                      'before timeout expired' % size)
-            time.sleep(3)
+            quorum = self.watcher and self.watcher.quorum
+            self._wait_for_cluster_change(
+                3, lambda w: (w.quorum != quorum and
+                              len(w.quorum) == size))
         self.log("quorum is size %d" % size)
 
     def get_mon_health(self, debug=False):
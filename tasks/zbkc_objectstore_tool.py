@@ -1,7 +1,6 @@
 """
 zbkc_objectstore_tool - Simple test of zbkc-objectstore-tool utility
 """
-from cStringIO import StringIO
 import contextlib
 import logging
 import zbkc_manager
@@ -9,11 +8,12 @@ from teuthology import misc as teuthology
 import time
 import os
 import string
-from teuthology.orchestra import run
 import sys
 import tempfile
 import json
-from util.rados import (rados, create_replicated_pool, create_ec_pool)
+from util.rados import (rados, create_replicated_pool, create_ec_pool,
+                        populate)
+from util.batch import run_batches, write_files
 # from util.rados import (rados, create_ec_pool,
 #                               create_replicated_pool,
 #                               create_cache_pool)
@@ -44,56 +44,32 @@ def cod_setup_local_data(log, ctx, NUM_OBJECTS, DATADIR,
 def cod_setup_remote_data(log, ctx, remote, NUM_OBJECTS, DATADIR,
                           BASE_NAME, DATALINECOUNT):
 
-    objects = range(1, NUM_OBJECTS + 1)
-    for i in objects:
+    files = {}
+    for i in range(1, NUM_OBJECTS + 1):
         NAME = BASE_NAME + "{num}".format(num=i)
         DDNAME = os.path.join(DATADIR, NAME)
-
-        remote.run(args=['rm', '-f', DDNAME])
-
-        dataline = range(DATALINECOUNT)
-        data = "This is the data for " + NAME + "\n"
-        DATA = ""
-        for _ in dataline:
-            DATA += data
-        teuthology.write_file(remote, DDNAME, DATA)
+        files[DDNAME] = ("This is the data for " + NAME + "\n") * DATALINECOUNT
+    write_files(remote, files)
 
 
 def cod_setup(log, ctx, remote, NUM_OBJECTS, DATADIR,
               BASE_NAME, DATALINECOUNT, POOL, db, ec):
-    ERRORS = 0
     log.info("Creating {objs} objects in pool".format(objs=NUM_OBJECTS))
 
-    objects = range(1, NUM_OBJECTS + 1)
-    for i in objects:
+    objects = []
+    for i in range(1, NUM_OBJECTS + 1):
         NAME = BASE_NAME + "{num}".format(num=i)
         DDNAME = os.path.join(DATADIR, NAME)
-
-        proc = rados(ctx, remote, ['-p', POOL, 'put', NAME, DDNAME],
-                     wait=False)
-        # proc = remote.run(args=['rados', '-p', POOL, 'put', NAME, DDNAME])
-        ret = proc.wait()
-        if ret != 0:
-            log.critical("Rados put failed with status {ret}".
-                         format(ret=proc.exitstatus))
-            sys.exit(1)
+        obj = {'name': NAME, 'file': DDNAME}
+        objects.append(obj)
 
         db[NAME] = {}
 
-        keys = range(i)
-        db[NAME]["xattr"] = {}
-        for k in keys:
-            if k == 0:
-                continue
-            mykey = "key{i}-{k}".format(i=i, k=k)
-            myval = "val{i}-{k}".format(i=i, k=k)
-            proc = remote.run(args=['rados', '-p', POOL, 'setxattr',
-                                    NAME, mykey, myval])
-            ret = proc.wait()
-            if ret != 0:
-                log.error("setxattr failed with {ret}".format(ret=ret))
-                ERRORS += 1
-            db[NAME]["xattr"][mykey] = myval
+        keys = range(1, i)
+        db[NAME]["xattr"] = dict(
+            ("key{i}-{k}".format(i=i, k=k), "val{i}-{k}".format(i=i, k=k))
+            for k in keys)
+        obj['xattrs'] = db[NAME]["xattr"]
 
         # Erasure coded pools don't support omap
         if ec:
@@ -101,29 +77,49 @@ def cod_setup(log, ctx, remote, NUM_OBJECTS, DATADIR,
 
         # Create omap header in all objects but REPobject1
         if i != 1:
-            myhdr = "hdr{i}".format(i=i)
-            proc = remote.run(args=['rados', '-p', POOL, 'setomapheader',
-                                    NAME, myhdr])
-            ret = proc.wait()
-            if ret != 0:
-                log.critical("setomapheader failed with {ret}".format(ret=ret))
-                ERRORS += 1
-            db[NAME]["omapheader"] = myhdr
+            db[NAME]["omapheader"] = "hdr{i}".format(i=i)
+            obj['omap_header'] = db[NAME]["omapheader"]
+
+        db[NAME]["omap"] = dict(
+            ("okey{i}-{k}".format(i=i, k=k), "oval{i}-{k}".format(i=i, k=k))
+            for k in keys)
+        obj['omap'] = db[NAME]["omap"]
+
+    errors = populate(remote, POOL, objects)
+    for error in errors:
+        if error['op'] == 'put':
+            log.critical("Rados put failed with {error}".
+                         format(error=error['error']))
+            sys.exit(1)
+
+    return len(errors)
 
-        db[NAME]["omap"] = {}
-        for k in keys:
-            if k == 0:
+
+def osd_remotes(osds):
+    """
+    :return: dict of the id of each OSD of the cluster osds to its remote
+    """
+    result = {}
+    for remote, roles in osds.remotes.iteritems():
+        for role in roles:
+            if string.find(role, "osd.") != 0:
                 continue
-            mykey = "okey{i}-{k}".format(i=i, k=k)
-            myval = "oval{i}-{k}".format(i=i, k=k)
-            proc = remote.run(args=['rados', '-p', POOL, 'setomapval',
-                                    NAME, mykey, myval])
-            ret = proc.wait()
-            if ret != 0:
-                log.critical("setomapval failed with {ret}".format(ret=ret))
-            db[NAME]["omap"][mykey] = myval
+            result[int(role.split('.')[1])] = remote
+    return result
 
-    return ERRORS
+
+def run_osd_batches(osd_remote, osd_ops):
+    """
+    Run the ops of each OSD one after the other in a single remote
+    invocation, and those of all the OSDs at the same time: the
+    objectstore tool needs exclusive use of an OSD's store, but the stores
+    of different OSDs are independent.
+
+    :param osd_ops: dict of OSD id to list of ops (see util.batch.run_batch)
+    :return: dict of OSD id to the list of results of its ops
+    """
+    return run_batches(dict((osdid, (osd_remote[osdid], ops))
+                            for osdid, ops in osd_ops.iteritems() if ops))
 
 
 def get_lines(filename):
@@ -274,203 +270,146 @@ def test_objectstore(ctx, config, cli_remote, REP_POOL, REP_NAME, ec=False):
     pgswithobjects = set()
     objsinpg = {}
 
-    # Test --op list and generate json for all objects
-    log.info("Test --op list by generating json for all objects")
+    osd_remote = osd_remotes(osds)
     prefix = ("sudo zbkc-objectstore-tool "
               "--data-path {fpath} "
               "--journal-path {jpath} ").format(fpath=FSPATH, jpath=JPATH)
-    for remote in osds.remotes.iterkeys():
-        log.debug(remote)
-        log.debug(osds.remotes[remote])
-        for role in osds.remotes[remote]:
-            if string.find(role, "osd.") != 0:
-                continue
-            osdid = int(role.split('.')[1])
-            log.info("process osd.{id} on {remote}".
-                     format(id=osdid, remote=remote))
-            cmd = (prefix + "--op list").format(id=osdid)
-            proc = remote.run(args=cmd.split(), check_status=False,
-                              stdout=StringIO())
-            if proc.exitstatus != 0:
-                log.error("Bad exit status {ret} from --op list request".
-                          format(ret=proc.exitstatus))
-                ERRORS += 1
-            else:
-                for pgline in proc.stdout.getvalue().splitlines():
-                    if not pgline:
-                        continue
-                    (pg, obj) = json.loads(pgline)
-                    name = obj['oid']
-                    if name in db:
-                        pgswithobjects.add(pg)
-                        objsinpg.setdefault(pg, []).append(name)
-                        db[name].setdefault("pg2json",
-                                            {})[pg] = json.dumps(obj)
+
+    def tool(osdid, *args):
+        return prefix.format(id=osdid).split() + list(args)
+
+    # Test --op list and generate json for all objects
+    log.info("Test --op list by generating json for all objects")
+    for osdid, remote in osd_remote.iteritems():
+        log.info("process osd.{id} on {remote}".
+                 format(id=osdid, remote=remote))
+    results = run_osd_batches(osd_remote, dict(
+        (osdid, [{'args': tool(osdid, "--op", "list")}])
+        for osdid in osd_remote))
+    for osdid, (result,) in results.iteritems():
+        if result['exitstatus'] != 0:
+            log.error("Bad exit status {ret} from --op list request".
+                      format(ret=result['exitstatus']))
+            ERRORS += 1
+        else:
+            for pgline in result['stdout'].splitlines():
+                if not pgline:
+                    continue
+                (pg, obj) = json.loads(pgline)
+                name = obj['oid']
+                if name in db:
+                    pgswithobjects.add(pg)
+                    objsinpg.setdefault(pg, []).append(name)
+                    db[name].setdefault("pg2json",
+                                        {})[pg] = json.dumps(obj)
 
     log.info(db)
     log.info(pgswithobjects)
     log.info(objsinpg)
 
+    # (osd id, pg, object json) of every copy of every object
+    copies = []
+    for basename in db.keys():
+        for osdid in osd_remote:
+            if osdid not in pgs:
+                continue
+            for pg, JSON in db[basename]["pg2json"].iteritems():
+                if pg in pgs[osdid]:
+                    copies.append((basename, osdid, pg, JSON))
+
     if pool_dump["type"] == zbkc_manager.ZbkcManager.REPLICATED_POOL:
         # Test get-bytes
         log.info("Test get-bytes and set-bytes")
-        for basename in db.keys():
+        osd_ops = {}
+        checks = []
+        for basename, osdid, pg, JSON in copies:
             file = os.path.join(DATADIR, basename)
-            GETNAME = os.path.join(DATADIR, "get")
-            SETNAME = os.path.join(DATADIR, "set")
-
-            for remote in osds.remotes.iterkeys():
-                for role in osds.remotes[remote]:
-                    if string.find(role, "osd.") != 0:
-                        continue
-                    osdid = int(role.split('.')[1])
-                    if osdid not in pgs:
-                        continue
-
-                    for pg, JSON in db[basename]["pg2json"].iteritems():
-                        if pg in pgs[osdid]:
-                            cmd = ((prefix + "--pgid {pg}").
-                                   format(id=osdid, pg=pg).split())
-                            cmd.append(run.Raw("'{json}'".format(json=JSON)))
-                            cmd += ("get-bytes {fname}".
-                                    format(fname=GETNAME).split())
-                            proc = remote.run(args=cmd, check_status=False)
-                            if proc.exitstatus != 0:
-                                remote.run(args="rm -f {getfile}".
-                                           format(getfile=GETNAME).split())
-                                log.error("Bad exit status {ret}".
-                                          format(ret=proc.exitstatus))
-                                ERRORS += 1
-                                continue
-                            cmd = ("diff -q {file} {getfile}".
-                                   format(file=file, getfile=GETNAME))
-                            proc = remote.run(args=cmd.split())
-                            if proc.exitstatus != 0:
-                                log.error("Data from get-bytes differ")
-                                # log.debug("Got:")
-                                # cat_file(logging.DEBUG, GETNAME)
-                                # log.debug("Expected:")
-                                # cat_file(logging.DEBUG, file)
-                                ERRORS += 1
-                            remote.run(args="rm -f {getfile}".
-                                       format(getfile=GETNAME).split())
-
-                            data = ("put-bytes going into {file}\n".
-                                    format(file=file))
-                            teuthology.write_file(remote, SETNAME, data)
-                            cmd = ((prefix + "--pgid {pg}").
-                                   format(id=osdid, pg=pg).split())
-                            cmd.append(run.Raw("'{json}'".format(json=JSON)))
-                            cmd += ("set-bytes {fname}".
-                                    format(fname=SETNAME).split())
-                            proc = remote.run(args=cmd, check_status=False)
-                            proc.wait()
-                            if proc.exitstatus != 0:
-                                log.info("set-bytes failed for object {obj} "
-                                         "in pg {pg} osd.{id} ret={ret}".
-                                         format(obj=basename, pg=pg,
-                                                id=osdid, ret=proc.exitstatus))
-                                ERRORS += 1
-
-                            cmd = ((prefix + "--pgid {pg}").
-                                   format(id=osdid, pg=pg).split())
-                            cmd.append(run.Raw("'{json}'".format(json=JSON)))
-                            cmd += "get-bytes -".split()
-                            proc = remote.run(args=cmd, check_status=False,
-                                              stdout=StringIO())
-                            proc.wait()
-                            if proc.exitstatus != 0:
-                                log.error("get-bytes after "
-                                          "set-bytes ret={ret}".
-                                          format(ret=proc.exitstatus))
-                                ERRORS += 1
-                            else:
-                                if data != proc.stdout.getvalue():
-                                    log.error("Data inconsistent after "
-                                              "set-bytes, got:")
-                                    log.error(proc.stdout.getvalue())
-                                    ERRORS += 1
-
-                            cmd = ((prefix + "--pgid {pg}").
-                                   format(id=osdid, pg=pg).split())
-                            cmd.append(run.Raw("'{json}'".format(json=JSON)))
-                            cmd += ("set-bytes {fname}".
-                                    format(fname=file).split())
-                            proc = remote.run(args=cmd, check_status=False)
-                            proc.wait()
-                            if proc.exitstatus != 0:
-                                log.info("set-bytes failed for object {obj} "
-                                         "in pg {pg} osd.{id} ret={ret}".
-                                         format(obj=basename, pg=pg,
-                                                id=osdid, ret=proc.exitstatus))
-                                ERRORS += 1
+            GETNAME = os.path.join(DATADIR, "get.{id}".format(id=osdid))
+            obj = tool(osdid, "--pgid", pg, JSON)
+            data = ("put-bytes going into {file}\n".
+                    format(file=file))
+            ops = osd_ops.setdefault(osdid, [])
+            get = len(ops)
+            ops.extend([
+                {'args': obj + ["get-bytes", GETNAME]},
+                {'args': ["diff", "-q", file, GETNAME], 'requires': [get]},
+                {'args': ["rm", "-f", GETNAME]},
+                {'args': obj + ["set-bytes", "-"], 'stdin': data,
+                 'requires': [get]},
+                {'args': obj + ["get-bytes", "-"], 'requires': [get]},
+                {'args': obj + ["set-bytes", file], 'requires': [get]},
+            ])
+            checks.append((basename, osdid, pg, get, data))
+        results = run_osd_batches(osd_remote, osd_ops)
+        for basename, osdid, pg, i, data in checks:
+            (get, diff, _, set_bytes, get_after, restore) = \
+                results[osdid][i:i + 6]
+            if get['exitstatus'] != 0:
+                log.error("Bad exit status {ret}".
+                          format(ret=get['exitstatus']))
+                ERRORS += 1
+                continue
+            if diff['exitstatus'] != 0:
+                log.error("Data from get-bytes differ")
+                ERRORS += 1
+            for result in (set_bytes, restore):
+                if result['exitstatus'] != 0:
+                    log.info("set-bytes failed for object {obj} "
+                             "in pg {pg} osd.{id} ret={ret}".
+                             format(obj=basename, pg=pg,
+                                    id=osdid, ret=result['exitstatus']))
+                    ERRORS += 1
+            if get_after['exitstatus'] != 0:
+                log.error("get-bytes after "
+                          "set-bytes ret={ret}".
+                          format(ret=get_after['exitstatus']))
+                ERRORS += 1
+            elif data != get_after['stdout']:
+                log.error("Data inconsistent after "
+                          "set-bytes, got:")
+                log.error(get_after['stdout'])
+                ERRORS += 1
 
     log.info("Test list-attrs get-attr")
-    for basename in db.keys():
-        file = os.path.join(DATADIR, basename)
-        GETNAME = os.path.join(DATADIR, "get")
-        SETNAME = os.path.join(DATADIR, "set")
-
-        for remote in osds.remotes.iterkeys():
-            for role in osds.remotes[remote]:
-                if string.find(role, "osd.") != 0:
-                    continue
-                osdid = int(role.split('.')[1])
-                if osdid not in pgs:
-                    continue
-
-                for pg, JSON in db[basename]["pg2json"].iteritems():
-                    if pg in pgs[osdid]:
-                        cmd = ((prefix + "--pgid {pg}").
-                               format(id=osdid, pg=pg).split())
-                        cmd.append(run.Raw("'{json}'".format(json=JSON)))
-                        cmd += ["list-attrs"]
-                        proc = remote.run(args=cmd, check_status=False,
-                                          stdout=StringIO(), stderr=StringIO())
-                        proc.wait()
-                        if proc.exitstatus != 0:
-                            log.error("Bad exit status {ret}".
-                                      format(ret=proc.exitstatus))
-                            ERRORS += 1
-                            continue
-                        keys = proc.stdout.getvalue().split()
-                        values = dict(db[basename]["xattr"])
-
-                        for key in keys:
-                            if (key == "_" or
-                                    key == "snapset" or
-                                    key == "hinfo_key"):
-                                continue
-                            key = key.strip("_")
-                            if key not in values:
-                                log.error("The key {key} should be present".
-                                          format(key=key))
-                                ERRORS += 1
-                                continue
-                            exp = values.pop(key)
-                            cmd = ((prefix + "--pgid {pg}").
-                                   format(id=osdid, pg=pg).split())
-                            cmd.append(run.Raw("'{json}'".format(json=JSON)))
-                            cmd += ("get-attr {key}".
-                                    format(key="_" + key).split())
-                            proc = remote.run(args=cmd, check_status=False,
-                                              stdout=StringIO())
-                            proc.wait()
-                            if proc.exitstatus != 0:
-                                log.error("get-attr failed with {ret}".
-                                          format(ret=proc.exitstatus))
-                                ERRORS += 1
-                                continue
-                            val = proc.stdout.getvalue()
-                            if exp != val:
-                                log.error("For key {key} got value {got} "
-                                          "instead of {expected}".
-                                          format(key=key, got=val,
-                                                 expected=exp))
-                                ERRORS += 1
-                        if "hinfo_key" in keys:
-                            cmd_prefix = prefix.format(id=osdid)
-                            cmd = """
+    osd_ops = {}
+    listed = []
+    for basename, osdid, pg, JSON in copies:
+        ops = osd_ops.setdefault(osdid, [])
+        listed.append((basename, osdid, pg, JSON, len(ops)))
+        ops.append({'args': tool(osdid, "--pgid", pg, JSON, "list-attrs")})
+    results = run_osd_batches(osd_remote, osd_ops)
+
+    # then get-attr each of the attrs listed
+    osd_ops = {}
+    checks = []
+    for basename, osdid, pg, JSON, i in listed:
+        result = results[osdid][i]
+        if result['exitstatus'] != 0:
+            log.error("Bad exit status {ret}".
+                      format(ret=result['exitstatus']))
+            ERRORS += 1
+            continue
+        keys = result['stdout'].split()
+        values = dict(db[basename]["xattr"])
+
+        ops = osd_ops.setdefault(osdid, [])
+        for key in keys:
+            if (key == "_" or
+                    key == "snapset" or
+                    key == "hinfo_key"):
+                continue
+            key = key.strip("_")
+            if key not in values:
+                log.error("The key {key} should be present".
+                          format(key=key))
+                ERRORS += 1
+                continue
+            checks.append((osdid, len(ops), key, values.pop(key)))
+            ops.append({'args': tool(osdid, "--pgid", pg, JSON,
+                                     "get-attr", "_" + key)})
+        if "hinfo_key" in keys:
+            cmd_prefix = prefix.format(id=osdid)
+            cmd = """
       expected=$({prefix} --pgid {pg} '{json}' get-attr {key} | base64)
       echo placeholder | {prefix} --pgid {pg} '{json}' set-attr {key} -
       test $({prefix} --pgid {pg} '{json}' get-attr {key}) = placeholder
@@ -479,72 +418,80 @@ def test_objectstore(ctx, config, cli_remote, REP_POOL, REP_NAME, ec=False):
       test $({prefix} --pgid {pg} '{json}' get-attr {key} | base64) = $expected
                             """.format(prefix=cmd_prefix, pg=pg, json=JSON,
                                        key="hinfo_key")
-                            log.debug(cmd)
-                            proc = remote.run(args=['bash', '-e', '-x',
-                                                    '-c', cmd],
-                                              check_status=False,
-                                              stdout=StringIO(),
-                                              stderr=StringIO())
-                            proc.wait()
-                            if proc.exitstatus != 0:
-                                log.error("failed with " +
-                                          str(proc.exitstatus))
-                                log.error(proc.stdout.getvalue() + " " +
-                                          proc.stderr.getvalue())
-                                ERRORS += 1
-
-                        if len(values) != 0:
-                            log.error("Not all keys found, remaining keys:")
-                            log.error(values)
-
-    log.info("Test pg info")
-    for remote in osds.remotes.iterkeys():
-        for role in osds.remotes[remote]:
-            if string.find(role, "osd.") != 0:
-                continue
-            osdid = int(role.split('.')[1])
-            if osdid not in pgs:
-                continue
-
-            for pg in pgs[osdid]:
-                cmd = ((prefix + "--op info --pgid {pg}").
-                       format(id=osdid, pg=pg).split())
-                proc = remote.run(args=cmd, check_status=False,
-                                  stdout=StringIO())
-                proc.wait()
-                if proc.exitstatus != 0:
-                    log.error("Failure of --op info command with {ret}".
-                              format(proc.exitstatus))
-                    ERRORS += 1
-                    continue
-                info = proc.stdout.getvalue()
-                if not str(pg) in info:
-                    log.error("Bad data from info: {info}".format(info=info))
-                    ERRORS += 1
+            log.debug(cmd)
+            checks.append((osdid, len(ops), "hinfo_key", None))
+            ops.append({'args': ['bash', '-e', '-x', '-c', cmd]})
+
+        if len(values) != 0:
+            log.error("Not all keys found, remaining keys:")
+            log.error(values)
+
+    results = run_osd_batches(osd_remote, osd_ops)
+    for osdid, i, key, exp in checks:
+        result = results[osdid][i]
+        if key == "hinfo_key":
+            if result['exitstatus'] != 0:
+                log.error("failed with " +
+                          str(result['exitstatus']))
+                log.error(result['stdout'] + " " + result['stderr'])
+                ERRORS += 1
+            continue
+        if result['exitstatus'] != 0:
+            log.error("get-attr failed with {ret}".
+                      format(ret=result['exitstatus']))
+            ERRORS += 1
+            continue
+        val = result['stdout']
+        if exp != val:
+            log.error("For key {key} got value {got} "
+                      "instead of {expected}".
+                      format(key=key, got=val, expected=exp))
+            ERRORS += 1
+
+    # Each OSD gets through its pgs' info, log, export and removal in
+    # one go, all of the OSDs at the same time
+    log.info("Test pg info, pg logging, pg export and pg removal")
+    osd_ops = {}
+    for osdid in osd_remote:
+        if osdid not in pgs:
+            continue
+        osd_ops[osdid] = (
+            [{'args': tool(osdid, "--op", "info", "--pgid", pg)}
+             for pg in pgs[osdid]] +
+            [{'args': tool(osdid, "--op", "log", "--pgid", pg)}
+             for pg in pgs[osdid]] +
+            [{'args': tool(osdid, "--op", "export", "--pgid", pg, "--file",
+                           os.path.join(DATADIR, "osd{id}.{pg}".
+                                        format(id=osdid, pg=pg)))}
+             for pg in pgs[osdid]] +
+            [{'args': tool(osdid, "--op", "remove", "--pgid", pg)}
+             for pg in pgs[osdid]])
+    results = run_osd_batches(osd_remote, osd_ops)
 
-    log.info("Test pg logging")
-    for remote in osds.remotes.iterkeys():
-        for role in osds.remotes[remote]:
-            if string.find(role, "osd.") != 0:
-                continue
-            osdid = int(role.split('.')[1])
-            if osdid not in pgs:
-                continue
+    EXP_ERRORS = 0
+    RM_ERRORS = 0
+    for osdid, osd_results in results.iteritems():
+        n = len(pgs[osdid])
+        for j, pg in enumerate(pgs[osdid]):
+            (info, pglog, export, remove) = [osd_results[k * n + j]
+                                             for k in range(4)]
+            if info['exitstatus'] != 0:
+                log.error("Failure of --op info command with {ret}".
+                          format(ret=info['exitstatus']))
+                ERRORS += 1
+            elif not str(pg) in info['stdout']:
+                log.error("Bad data from info: {info}".
+                          format(info=info['stdout']))
+                ERRORS += 1
 
-            for pg in pgs[osdid]:
-                cmd = ((prefix + "--op log --pgid {pg}").
-                       format(id=osdid, pg=pg).split())
-                proc = remote.run(args=cmd, check_status=False,
-                                  stdout=StringIO())
-                proc.wait()
-                if proc.exitstatus != 0:
-                    log.error("Getting log failed for pg {pg} "
-                              "from osd.{id} with {ret}".
-                              format(pg=pg, id=osdid, ret=proc.exitstatus))
-                    ERRORS += 1
-                    continue
+            if pglog['exitstatus'] != 0:
+                log.error("Getting log failed for pg {pg} "
+                          "from osd.{id} with {ret}".
+                          format(pg=pg, id=osdid, ret=pglog['exitstatus']))
+                ERRORS += 1
+            else:
                 HASOBJ = pg in pgswithobjects
-                MODOBJ = "modify" in proc.stdout.getvalue()
+                MODOBJ = "modify" in pglog['stdout']
                 if HASOBJ != MODOBJ:
                     log.error("Bad log for pg {pg} from osd.{id}".
                               format(pg=pg, id=osdid))
@@ -553,82 +500,44 @@ def test_objectstore(ctx, config, cli_remote, REP_POOL, REP_NAME, ec=False):
                               format(msg=MSG))
                     ERRORS += 1
 
-    log.info("Test pg export")
-    EXP_ERRORS = 0
-    for remote in osds.remotes.iterkeys():
-        for role in osds.remotes[remote]:
-            if string.find(role, "osd.") != 0:
-                continue
-            osdid = int(role.split('.')[1])
-            if osdid not in pgs:
-                continue
+            if export['exitstatus'] != 0:
+                log.error("Exporting failed for pg {pg} "
+                          "on osd.{id} with {ret}".
+                          format(pg=pg, id=osdid, ret=export['exitstatus']))
+                EXP_ERRORS += 1
 
-            for pg in pgs[osdid]:
-                fpath = os.path.join(DATADIR, "osd{id}.{pg}".
-                                     format(id=osdid, pg=pg))
-
-                cmd = ((prefix + "--op export --pgid {pg} --file {file}").
-                       format(id=osdid, pg=pg, file=fpath))
-                proc = remote.run(args=cmd, check_status=False,
-                                  stdout=StringIO())
-                proc.wait()
-                if proc.exitstatus != 0:
-                    log.error("Exporting failed for pg {pg} "
-                              "on osd.{id} with {ret}".
-                              format(pg=pg, id=osdid, ret=proc.exitstatus))
-                    EXP_ERRORS += 1
+            if remove['exitstatus'] != 0:
+                log.error("Removing failed for pg {pg} "
+                          "on osd.{id} with {ret}".
+                          format(pg=pg, id=osdid, ret=remove['exitstatus']))
+                RM_ERRORS += 1
 
     ERRORS += EXP_ERRORS
-
-    log.info("Test pg removal")
-    RM_ERRORS = 0
-    for remote in osds.remotes.iterkeys():
-        for role in osds.remotes[remote]:
-            if string.find(role, "osd.") != 0:
-                continue
-            osdid = int(role.split('.')[1])
-            if osdid not in pgs:
-                continue
-
-            for pg in pgs[osdid]:
-                cmd = ((prefix + "--op remove --pgid {pg}").
-                       format(pg=pg, id=osdid))
-                proc = remote.run(args=cmd, check_status=False,
-                                  stdout=StringIO())
-                proc.wait()
-                if proc.exitstatus != 0:
-                    log.error("Removing failed for pg {pg} "
-                              "on osd.{id} with {ret}".
-                              format(pg=pg, id=osdid, ret=proc.exitstatus))
-                    RM_ERRORS += 1
-
     ERRORS += RM_ERRORS
 
     IMP_ERRORS = 0
     if EXP_ERRORS == 0 and RM_ERRORS == 0:
         log.info("Test pg import")
 
-        for remote in osds.remotes.iterkeys():
-            for role in osds.remotes[remote]:
-                if string.find(role, "osd.") != 0:
-                    continue
-                osdid = int(role.split('.')[1])
-                if osdid not in pgs:
-                    continue
-
-                for pg in pgs[osdid]:
-                    fpath = os.path.join(DATADIR, "osd{id}.{pg}".
-                                         format(id=osdid, pg=pg))
-
-                    cmd = ((prefix + "--op import --file {file}").
-                           format(id=osdid, file=fpath))
-                    proc = remote.run(args=cmd, check_status=False,
-                                      stdout=StringIO())
-                    proc.wait()
-                    if proc.exitstatus != 0:
-                        log.error("Import failed from {file} with {ret}".
-                                  format(file=fpath, ret=proc.exitstatus))
-                        IMP_ERRORS += 1
+        osd_ops = {}
+        for osdid in osd_remote:
+            if osdid not in pgs:
+                continue
+            osd_ops[osdid] = [
+                {'args': tool(osdid, "--op", "import", "--file",
+                              os.path.join(DATADIR, "osd{id}.{pg}".
+                                           format(id=osdid, pg=pg)))}
+                for pg in pgs[osdid]]
+        results = run_osd_batches(osd_remote, osd_ops)
+        for osdid, osd_results in results.iteritems():
+            for pg, result in zip(pgs[osdid], osd_results):
+                if result['exitstatus'] != 0:
+                    log.error("Import failed from {file} with {ret}".
+                              format(file=os.path.join(
+                                  DATADIR, "osd{id}.{pg}".
+                                  format(id=osdid, pg=pg)),
+                                  ret=result['exitstatus']))
+                    IMP_ERRORS += 1
     else:
         log.warning("SKIPPING IMPORT TESTS DUE TO PREVIOUS FAILURES")
 
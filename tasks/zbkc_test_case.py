@@ -1,9 +1,9 @@
 
 import unittest
-import time
 import logging
 
-from teuthology.orchestra.run import CommandFailedError
+from tasks.util import wait
+from tasks.zbkc_manager import LogMatcher
 
 log = logging.getLogger(__name__)
 
@@ -35,45 +35,52 @@ class ZbkcTestCase(unittest.TestCase):
 
     def assert_cluster_log(self, expected_pattern, invert_match=False, timeout=10):
         """
-        Context manager.  Assert that during execution, or up to 5 seconds later,
-        the Zbkc cluster log emits a message matching the expected pattern.
+        Context manager.  Assert that during execution, or up to 5 + timeout
+        seconds later, the Zbkc cluster log emits a message matching the
+        expected pattern.  Returns as soon as the message is seen.
 
-        :param expected_pattern: a string that you expect to see in the log output
+        The log is followed by the cluster's shared ``zbkc -w`` watcher
+        (see ZbkcManager.start_watching).  If it was not already running,
+        it is started for the assertion and stopped again afterwards.
+
+        :param expected_pattern: a string that you expect to see in the log
+                                 output, or a compiled regex or predicate
+                                 on log lines
         """
 
         zbkc_manager = self.zbkc_cluster.mon_manager
 
         class ContextManager(object):
-            def match(self):
-                found = expected_pattern in self.watcher_process.stdout.getvalue()
-                if invert_match:
-                    return not found
-
-                return found
-
             def __enter__(self):
-                self.watcher_process = zbkc_manager.run_zbkc_w()
+                self.started = zbkc_manager.watcher is None
+                zbkc_manager.start_watching()
+                self.watcher = zbkc_manager.watcher
+                # A new watcher has nothing to show us until "zbkc -w" has
+                # connected and printed the cluster status
+                self.watcher.wait(lambda w: len(w.recent) > 0, 10)
+                self.matcher = self.watcher.subscribe(LogMatcher(expected_pattern))
 
             def __exit__(self, exc_type, exc_val, exc_tb):
-                if not self.watcher_process.finished:
-                    # Check if we got an early match, wait a bit if we didn't
-                    if self.match():
+                try:
+                    if exc_type is not None:
                         return
+                    # Default monc tick interval is 10s, so wait that long and
+                    # then some grace
+                    self.watcher.wait(lambda w: self.matcher.matched, 5 + timeout)
+                finally:
+                    self.watcher.unsubscribe(self.matcher)
+                    if self.started:
+                        zbkc_manager.stop_watching()
+
+                if self.matcher.matched == invert_match:
+                    log.error("Recent log output: \n{0}\n".format(
+                        "\n".join(self.watcher.recent)))
+                    if invert_match:
+                        raise AssertionError("Unexpected log message found: '{0}'".format(
+                            self.matcher.line))
                     else:
-                        log.debug("No log hits yet, waiting...")
-                        # Default monc tick interval is 10s, so wait that long and
-                        # then some grace
-                        time.sleep(5 + timeout)
-
-                self.watcher_process.stdin.close()
-                try:
-                    self.watcher_process.wait()
-                except CommandFailedError:
-                    pass
-
-                if not self.match():
-                    log.error("Log output: \n{0}\n".format(self.watcher_process.stdout.getvalue()))
-                    raise AssertionError("Expected log message not found: '{0}'".format(expected_pattern))
+                        raise AssertionError("Expected log message not found: '{0}'".format(
+                            expected_pattern))
 
         return ContextManager()
 
@@ -81,8 +88,7 @@ class ZbkcTestCase(unittest.TestCase):
         """
         Wait until 'zbkc health' contains messages matching the pattern
         """
-        def seen_health_warning():
-            health = self.zbkc_cluster.mon_manager.get_mon_health()
+        def seen_health_warning(health):
             summary_strings = [s['summary'] for s in health['summary']]
             if len(summary_strings) == 0:
                 log.debug("Not expected number of summary strings ({0})".format(summary_strings))
@@ -95,52 +101,34 @@ class ZbkcTestCase(unittest.TestCase):
             log.debug("Not found expected summary strings yet ({0})".format(summary_strings))
             return False
 
-        self.wait_until_true(seen_health_warning, timeout)
+        self.wait_until(self.zbkc_cluster.mon_manager.get_mon_health,
+                        seen_health_warning, timeout,
+                        label="health {0}".format(pattern))
 
     def wait_for_health_clear(self, timeout):
         """
         Wait until `zbkc health` returns no messages
         """
-        def is_clear():
-            health = self.zbkc_cluster.mon_manager.get_mon_health()
+        def is_clear(health):
             return len(health['summary']) == 0
 
-        self.wait_until_true(is_clear, timeout)
+        self.wait_until(self.zbkc_cluster.mon_manager.get_mon_health,
+                        is_clear, timeout)
 
-    def wait_until_equal(self, get_fn, expect_val, timeout, reject_fn=None):
-        period = 5
-        elapsed = 0
-        while True:
-            val = get_fn()
-            if val == expect_val:
-                return
-            elif reject_fn and reject_fn(val):
-                raise RuntimeError("wait_until_equal: forbidden value {0} seen".format(val))
-            else:
-                if elapsed >= timeout:
-                    raise RuntimeError("Timed out after {0} seconds waiting for {1} (currently {2})".format(
-                        elapsed, expect_val, val
-                    ))
-                else:
-                    log.debug("wait_until_equal: {0} != {1}, waiting...".format(val, expect_val))
-                time.sleep(period)
-                elapsed += period
+    def wait_until(self, fetch, condition, timeout, label=None, reject=None):
+        """
+        Poll fetch() with backoff until condition() is true of its result,
+        and return that result.  See tasks.util.wait.wait_until.
+        """
+        if label is None:
+            label = "{0}: {1}".format(self.id(), getattr(condition, '__name__', 'condition'))
+        return wait.wait_until(fetch, condition, timeout, label=label, reject=reject)
 
-        log.debug("wait_until_equal: success")
+    def wait_until_equal(self, get_fn, expect_val, timeout, reject_fn=None):
+        label = "{0}: {1}".format(self.id(), getattr(get_fn, '__name__', 'value'))
+        self.wait_until(get_fn, lambda val: val == expect_val, timeout,
+                        label=label, reject=reject_fn)
 
     def wait_until_true(self, condition, timeout):
-        period = 5
-        elapsed = 0
-        while True:
-            if condition():
-                log.debug("wait_until_true: success in {0}s".format(elapsed))
-                return
-            else:
-                if elapsed >= timeout:
-                    raise RuntimeError("Timed out after {0}s".format(elapsed))
-                else:
-                    log.debug("wait_until_true: waiting...")
-                time.sleep(period)
-                elapsed += period
-
-
+        self.wait_until(condition, bool, timeout,
+                        label=getattr(condition, '__name__', 'condition'))
@@ -1,5 +1,6 @@
 
 from StringIO import StringIO
+import copy
 import json
 import logging
 from gevent import Greenlet
@@ -15,6 +16,8 @@ from teuthology.nuke import clear_firewall
 from teuthology.parallel import parallel
 from tasks.zbkc_manager import write_conf
 from tasks import zbkc_manager
+from tasks.util.batch import run_batch
+from tasks.util.wait import Backoff
 
 
 log = logging.getLogger(__name__)
@@ -23,6 +26,19 @@ log = logging.getLogger(__name__)
 DAEMON_WAIT_TIMEOUT = 120
 ROOT_INO = 1
 
+def shared_mon_manager(ctx, factory):
+    """
+    The ZbkcManager shared by all the ZbkcCluster, MDSCluster and
+    Filesystem objects of a run, so that a ``zbkc -w`` watcher started on
+    any of them (see ZbkcManager.start_watching) wakes the FSMap waits of
+    all of them.
+
+    :param factory: called to create the manager the first time
+    """
+    if getattr(ctx, "zbkcfs_mon_manager", None) is None:
+        ctx.zbkcfs_mon_manager = factory()
+    return ctx.zbkcfs_mon_manager
+
 
 class ObjectNotFound(Exception):
     def __init__(self, object_name):
@@ -31,13 +47,79 @@ class ObjectNotFound(Exception):
     def __str__(self):
         return "Object not found: '{0}'".format(self._object_name)
 
+class FSMapCache(object):
+    """
+    The last FSMap fetched from the mons, fetched again only when the
+    FSMap epoch has moved on.
+
+    The current epoch is learned from the one-line ``mds stat`` summary
+    rather than a full ``fs dump``; waiters following ``zbkc -w`` learn it
+    from there without asking the mons at all.
+    """
+    EPOCH_RE = re.compile(r'^e(\d+):')
+
+    def __init__(self, mon_manager):
+        self.mon = mon_manager
+        self.epoch = None
+        self.map = None
+
+    def current_epoch(self):
+        """
+        :return: the current FSMap epoch, or None if the summary did not
+                 include one
+        """
+        m = self.EPOCH_RE.match(self.mon.raw_cluster_cmd("mds", "stat").strip())
+        if m:
+            return int(m.group(1))
+        return None
+
+    def get(self, epoch=None):
+        """
+        Get the FSMap, fetching it only if the cached one is not at epoch
+        (by default, the current epoch).
+
+        :return: the decoded ``fs dump`` output; do not modify it
+        """
+        if epoch is None:
+            epoch = self.current_epoch()
+        if self.map is None or epoch is None or epoch != self.epoch:
+            self.map = json.loads(self.mon.raw_cluster_cmd("fs", "dump", "--format=json-pretty"))
+            self.epoch = self.map['epoch']
+        return self.map
+
+    def wait_for_change(self, timeout):
+        """
+        Block until the FSMap epoch moves past the cached one, or timeout
+        seconds pass.  Unless the ZbkcManager is following ``zbkc -w``,
+        this is a plain sleep.
+
+        :return: the epoch reported by the watcher, or None if it did not
+                 report a newer one
+        """
+        watcher = self.mon.watcher
+        if watcher is None or not watcher.running():
+            time.sleep(timeout)
+            return None
+
+        epoch = self.epoch
+
+        def changed(w):
+            return w.fsmap_epoch is not None and (epoch is None or w.fsmap_epoch > epoch)
+
+        if watcher.wait(changed, timeout):
+            return watcher.fsmap_epoch
+        return None
+
+
 class FSStatus(object):
     """
     Operations on a snapshot of the FSMap.
     """
-    def __init__(self, mon_manager):
+    def __init__(self, mon_manager, fsmap=None):
         self.mon = mon_manager
-        self.map = json.loads(self.mon.raw_cluster_cmd("fs", "dump", "--format=json-pretty"))
+        if fsmap is None:
+            fsmap = json.loads(self.mon.raw_cluster_cmd("fs", "dump", "--format=json-pretty"))
+        self.map = fsmap
 
     def __str__(self):
         return json.dumps(self.map, indent = 2, sort_keys = True)
@@ -147,7 +229,8 @@ class ZbkcCluster(object):
 
     def __init__(self, ctx):
         self._ctx = ctx
-        self.mon_manager = zbkc_manager.ZbkcManager(self.admin_remote, ctx=ctx, logger=log.getChild('zbkc_manager'))
+        self.mon_manager = shared_mon_manager(
+            ctx, lambda: zbkc_manager.ZbkcManager(self.admin_remote, ctx=ctx, logger=log.getChild('zbkc_manager')))
 
     def get_config(self, key, service_type=None):
         """
@@ -189,6 +272,11 @@ class MDSCluster(ZbkcCluster):
     a parent of Filesystem.  The correct way to use MDSCluster going forward is
     as a separate instance outside of your (multiple) Filesystem instances.
     """
+
+    # Set on the views returned by scoped(): the one filesystem managed
+    # through this MDSCluster.
+    fs_name = None
+
     def __init__(self, ctx):
         super(MDSCluster, self).__init__(ctx)
 
@@ -201,6 +289,29 @@ class MDSCluster(ZbkcCluster):
             # Presence of 'daemons' attribute implies zbkc task rather than zbkc_deploy task
             self.mds_daemons = dict([(mds_id, self._ctx.daemons.get_daemon('mds', mds_id)) for mds_id in self.mds_ids])
 
+    def scoped(self, mds_ids, fs_name):
+        """
+        Get a view of this MDSCluster restricted to some of the MDS daemons
+        and to the filesystem called fs_name, so that several users (e.g.
+        parallel test workers) can share the cluster without touching each
+        other's filesystems and daemons.
+        """
+        view = copy.copy(self)
+        view.mds_ids = list(mds_ids)
+        view.mds_daemons = dict([(mds_id, self.mds_daemons[mds_id]) for mds_id in mds_ids])
+        view.fs_name = fs_name
+        return view
+
+    def _adopt(self, fs):
+        """
+        Restrict a Filesystem created through a scoped() view to the view's
+        MDS daemons.
+        """
+        if self.fs_name is not None:
+            fs.mds_ids = list(self.mds_ids)
+            fs.mds_daemons = self.mds_daemons
+        return fs
+
     def _one_or_all(self, mds_id, cb, in_parallel=True):
         """
         Call a callback for a single named MDS, or for all.
@@ -257,28 +368,63 @@ class MDSCluster(ZbkcCluster):
         self._one_or_all(mds_id, _fail_restart)
 
     def newfs(self, name):
-        return Filesystem(self._ctx, create=name)
+        return self._adopt(Filesystem(self._ctx, create=name))
+
+    def get_filesystem(self, fscid):
+        return self._adopt(Filesystem(self._ctx, fscid=fscid))
+
+    @property
+    def fsmap_cache(self):
+        """
+        The FSMapCache shared by all the MDSCluster and Filesystem objects
+        of this run.
+        """
+        if getattr(self._ctx, "fsmap_cache", None) is None:
+            self._ctx.fsmap_cache = FSMapCache(self.mon_manager)
+        return self._ctx.fsmap_cache
+
+    def status(self, epoch=None):
+        """
+        Get an FSStatus, refreshing the FSMap only if its epoch changed.
+
+        :param epoch: if the caller already knows the current FSMap epoch
+                      (e.g. from _wait_for_fsmap_change), skip asking the
+                      mons for it
+        """
+        return FSStatus(self.mon_manager, fsmap=self.fsmap_cache.get(epoch))
 
-    def status(self):
-        return FSStatus(self.mon_manager)
+    def _wait_for_fsmap_change(self, timeout):
+        """
+        Sleep until the FSMap changes or timeout seconds pass, following
+        ``zbkc -w`` if the ZbkcManager is watching the cluster.
+
+        :return: the new epoch if it is already known, else None
+        """
+        return self.fsmap_cache.wait_for_change(timeout)
 
     def delete_all_filesystems(self):
         """
-        Remove all filesystems that exist, and any pools in use by them.
+        Remove all filesystems that exist, and any pools in use by them.  On a
+        scoped() view, only the view's filesystem is removed.
         """
         pools = json.loads(self.mon_manager.raw_cluster_cmd("osd", "dump", "--format=json-pretty"))['pools']
         pool_id_name = {}
         for pool in pools:
             pool_id_name[pool['pool']] = pool['pool_name']
 
+        def our_filesystems(status):
+            for fs in status.get_filesystems():
+                if self.fs_name is None or fs['mdsmap']['fs_name'] == self.fs_name:
+                    yield fs
+
         # mark cluster down for each fs to prevent churn during deletion
         status = self.status()
-        for fs in status.get_filesystems():
+        for fs in our_filesystems(status):
             self.mon_manager.raw_cluster_cmd("fs", "set", fs['mdsmap']['fs_name'], "cluster_down", "true")
 
         # get a new copy as actives may have since changed
         status = self.status()
-        for fs in status.get_filesystems():
+        for fs in our_filesystems(status):
             mdsmap = fs['mdsmap']
             metadata_pool = pool_id_name[mdsmap['metadata_pool']]
 
@@ -447,6 +593,37 @@ class Filesystem(MDSCluster):
 
         self.getinfo(refresh = True)
 
+    def reset(self):
+        """
+        Recreate this filesystem, empty, on the pools it already uses.
+
+        This is much cheaper than deleting the filesystem and calling
+        create(), which has to wait for new pools' PGs to be created.  The
+        MDS daemons should be stopped first, and clients unmounted: they
+        will need to mount the new filesystem.
+        """
+        self.getinfo(refresh=True)
+        mds_map = self.get_mds_map()
+        # The first data pool is the default one, keep it that way
+        data_pool_names = [self.data_pools[p] for p in mds_map['data_pools']]
+
+        log.info("Resetting filesystem '{0}'".format(self.name))
+        self.mon_manager.raw_cluster_cmd("fs", "set", self.name, "cluster_down", "true")
+        for gid in mds_map['up'].values():
+            self.mon_manager.raw_cluster_cmd('mds', 'fail', gid.__str__())
+        self.mon_manager.raw_cluster_cmd('fs', 'rm', self.name, '--yes-i-really-mean-it')
+
+        for pool in [self.metadata_pool_name] + data_pool_names:
+            self.rados(["purge", pool, "--yes-i-really-really-mean-it"], pool=pool)
+
+        self.mon_manager.raw_cluster_cmd('fs', 'new', self.name,
+                                         self.metadata_pool_name, data_pool_names[0])
+        for data_pool_name in data_pool_names[1:]:
+            self.mon_manager.raw_cluster_cmd('fs', 'add_data_pool', self.name, data_pool_name)
+
+        self.id = None
+        self.getinfo(refresh=True)
+
     def __del__(self):
         if getattr(self._ctx, "filesystem", None) == self:
             delattr(self._ctx, "filesystem")
@@ -482,8 +659,8 @@ class Filesystem(MDSCluster):
     def _df(self):
         return json.loads(self.mon_manager.raw_cluster_cmd("df", "--format=json-pretty"))
 
-    def get_mds_map(self):
-        return self.status().get_fsmap(self.id)['mdsmap']
+    def get_mds_map(self, epoch=None):
+        return self.status(epoch).get_fsmap(self.id)['mdsmap']
 
     def add_data_pool(self, name):
         self.mon_manager.raw_cluster_cmd('osd', 'pool', 'create', name, self.get_pgs_per_fs_pool().__str__())
@@ -551,7 +728,7 @@ class Filesystem(MDSCluster):
     def get_usage(self):
         return self._df()['stats']['total_used_bytes']
 
-    def are_daemons_healthy(self):
+    def are_daemons_healthy(self, epoch=None):
         """
         Return true if all daemons are in one of active, standby, standby-replay, and
         at least max_mds daemons are in 'active'.
@@ -566,7 +743,7 @@ class Filesystem(MDSCluster):
 
         active_count = 0
         try:
-            mds_map = self.get_mds_map()
+            mds_map = self.get_mds_map(epoch)
         except CommandFailedError as cfe:
             # Old version, fall back to non-multi-fs commands
             if cfe.exitstatus == errno.EINVAL:
@@ -666,16 +843,15 @@ class Filesystem(MDSCluster):
         if timeout is None:
             timeout = DAEMON_WAIT_TIMEOUT
 
-        elapsed = 0
+        backoff = Backoff(timeout, max_interval=2)
+        epoch = None
         while True:
-            if self.are_daemons_healthy():
+            if self.are_daemons_healthy(epoch):
                 return
-            else:
-                time.sleep(1)
-                elapsed += 1
-
-            if elapsed > timeout:
+            elif backoff.expired():
                 raise RuntimeError("Timed out waiting for MDS daemons to become healthy")
+            else:
+                epoch = self._wait_for_fsmap_change(backoff.next_interval())
 
     def get_lone_mds_id(self):
         """
@@ -791,8 +967,10 @@ class Filesystem(MDSCluster):
         """
 
         started_at = time.time()
+        backoff = Backoff(timeout, max_interval=2)
+        epoch = None
         while True:
-            status = self.status()
+            status = self.status(epoch)
             if mds_id is not None:
                 # mds_info is None if no daemon with this ID exists in the map
                 mds_info = status.get_mds(mds_id)
@@ -822,36 +1000,125 @@ class Filesystem(MDSCluster):
                         elapsed, goal_state, current_state
                     ))
             else:
-                time.sleep(1)
+                epoch = self._wait_for_fsmap_change(backoff.next_interval())
 
-    def _read_data_xattr(self, ino_no, xattr_name, type, pool):
-        mds_id = self.mds_ids[0]
-        remote = self.mds_daemons[mds_id].remote
+    def _rados_bulk(self, ops, pool=None, namespace=None):
+        """
+        Run many `rados` CLI operations against one pool in a single remote
+        invocation (see util.batch), rather than one remote process per
+        object.
+
+        :param ops: list of dicts with "args" (the rados arguments after
+                    the pool), and optionally "prefix" to keep only the
+                    output lines starting with it (filtered on the remote),
+                    or "decode" to pass the output through zbkc-dencoder as
+                    that type
+        :return: list of dicts, one per op, with "exitstatus", "stderr"
+                 and, if it succeeded, one of "names", "decoded" or
+                 "stdout" (raw output)
+        """
+        if not ops:
+            return []
         if pool is None:
-            pool = self.get_data_pool_name()
+            pool = self.get_metadata_pool_name()
 
-        obj_name = "{0:x}.00000000".format(ino_no)
+        # Doesn't matter which MDS we use to run rados commands, they all
+        # have access to the pools
+        remote = self.mds_daemons[self.mds_ids[0]].remote
 
-        args = [
-            os.path.join(self._prefix, "rados"), "-p", pool, "getxattr", obj_name, xattr_name
-        ]
-        try:
-            proc = remote.run(
-                args=args,
-                stdout=StringIO())
-        except CommandFailedError as e:
-            log.error(e.__str__())
-            raise ObjectNotFound(obj_name)
+        base_args = [os.path.join(self._prefix, "rados"), "-p", pool]
+        if namespace:
+            base_args += ["--namespace", namespace]
+        batch_ops = []
+        positions = []
+        for op in ops:
+            positions.append(len(batch_ops))
+            batch_op = {"args": base_args + op["args"]}
+            if "prefix" in op:
+                batch_op["line_prefix"] = op["prefix"]
+            batch_ops.append(batch_op)
+            if "decode" in op:
+                i = len(batch_ops) - 1
+                batch_ops.append({
+                    "args": [os.path.join(self._prefix, "zbkc-dencoder"),
+                             "type", op["decode"],
+                             "import", "-", "decode", "dump_json"],
+                    "stdin_from": i, "requires": [i]})
+        batch = run_batch(remote, batch_ops)
+
+        results = []
+        for op, i in zip(ops, positions):
+            result = batch[i]
+            if result["exitstatus"] == 0 and "decode" in op:
+                result = batch[i + 1]
+                if result["exitstatus"] == 0:
+                    result["decoded"] = json.loads(result.pop("stdout"))
+            elif result["exitstatus"] == 0 and "prefix" in op:
+                result["names"] = [l for l in result.pop("stdout").split("\n")
+                                   if l]
+            results.append(result)
+        return results
+
+    def list_objects(self, prefix="", pool=None, namespace=None):
+        """
+        List the objects in a pool whose names start with prefix.  Only the
+        matching names are sent back from the remote.
+
+        :return: list of strings
+        """
+        result = self._rados_bulk([{"args": ["ls"], "prefix": prefix}],
+                                  pool=pool, namespace=namespace)[0]
+        if result["exitstatus"] != 0:
+            raise CommandFailedError("rados ls", result["exitstatus"])
+        return result["names"]
+
+    def stat_objects(self, object_names, pool=None, namespace=None):
+        """
+        Look up several objects in one go.
+
+        :return: dict of object name to size in bytes, or to None for
+                 objects that do not exist
+        """
+        results = self._rados_bulk([{"args": ["stat", o]} for o in object_names],
+                                   pool=pool, namespace=namespace)
+        sizes = {}
+        for o, result in zip(object_names, results):
+            if result["exitstatus"] == 0:
+                sizes[o] = int(re.search(r"size (\d+)", result["stdout"]).group(1))
+            else:
+                sizes[o] = None
+        return sizes
 
-        data = proc.stdout.getvalue()
+    def remove_objects(self, object_names, pool=None, namespace=None):
+        """
+        Remove several objects in one go.
+        """
+        results = self._rados_bulk([{"args": ["rm", o]} for o in object_names],
+                                   pool=pool, namespace=namespace)
+        for o, result in zip(object_names, results):
+            if result["exitstatus"] != 0:
+                log.error("Failed to remove {0}: {1}".format(o, result.get("stderr")))
+                raise CommandFailedError("rados rm {0}".format(o), result["exitstatus"])
 
-        p = remote.run(
-            args=[os.path.join(self._prefix, "zbkc-dencoder"), "type", type, "import", "-", "decode", "dump_json"],
-            stdout=StringIO(),
-            stdin=data
-        )
+    def _read_data_xattr(self, ino_no, xattr_name, type, pool):
+        """
+        Read and decode an xattr from the 0th data object of an inode, in
+        a single remote invocation.
 
-        return json.loads(p.stdout.getvalue().strip())
+        :raises: ObjectNotFound if the xattr can't be read
+        """
+        if pool is None:
+            pool = self.get_data_pool_name()
+
+        obj_name = "{0:x}.00000000".format(ino_no)
+        result = self._rados_bulk(
+            [{"args": ["getxattr", obj_name, xattr_name], "decode": type}],
+            pool=pool)[0]
+        if result["exitstatus"] != 0:
+            log.error("Failed to read {0} from {1}: {2}".format(
+                xattr_name, obj_name, result.get("stderr")))
+            raise ObjectNotFound(obj_name)
+        return result["decoded"]
 
     def _write_data_xattr(self, ino_no, xattr_name, data, pool=None):
         """
@@ -919,7 +1186,7 @@ class Filesystem(MDSCluster):
 
     def _enumerate_data_objects(self, ino, size):
         """
-        Get the list of expected data objects for a range, and the list of objects
+        Get the list of expected data objects for a range, and the list of those
         that really exist.
 
         :return a tuple of two lists of strings (expected, actual)
@@ -933,7 +1200,8 @@ class Filesystem(MDSCluster):
             for n in range(0, ((size - 1) / stripe_size) + 1)
         ]
 
-        exist_objects = self.rados(["ls"], pool=self.get_data_pool_name()).split("\n")
+        sizes = self.stat_objects(want_objects, pool=self.get_data_pool_name())
+        exist_objects = [o for o in want_objects if sizes[o] is not None]
 
         return want_objects, exist_objects
 
@@ -1013,13 +1281,10 @@ class Filesystem(MDSCluster):
         For all objects in the metadata pool matching the prefix,
         erase them.
 
-        This O(N) with the number of objects in the pool, so only suitable
-        for use on toy test filesystems.
+        The listing is O(N) with the number of objects in the pool, so only
+        suitable for use on toy test filesystems.
         """
-        all_objects = self.rados(["ls"]).split("\n")
-        matching_objects = [o for o in all_objects if o.startswith(prefix)]
-        for o in matching_objects:
-            self.rados(["rm", o])
+        self.remove_objects(self.list_objects(prefix))
 
     def erase_mds_objects(self, rank):
         """
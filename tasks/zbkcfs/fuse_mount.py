@@ -54,6 +54,8 @@ class FuseMount(ZbkcFSMount):
         if mount_path is not None:
             fuse_cmd += ["--client_mountpoint={0}".format(mount_path)]
 
+        if mount_fs_name is None:
+            mount_fs_name = self.default_fs_name
         if mount_fs_name is not None:
             fuse_cmd += ["--client_mds_namespace={0}".format(mount_fs_name)]
 
@@ -64,6 +64,8 @@ class KernelMount(ZbkcFSMount):
         opts = 'name={id},secretfile={secret},norequire_active_mds'.format(id=self.client_id,
                                                       secret=secret)
 
+        if mount_fs_name is None:
+            mount_fs_name = self.default_fs_name
         if mount_fs_name is not None:
             opts += ",mds_namespace={0}".format(mount_fs_name)
 
@@ -1,7 +1,9 @@
 from contextlib import contextmanager
+import base64
 import json
 import logging
 import datetime
+import errno
 import time
 from textwrap import dedent
 import os
@@ -12,6 +14,247 @@ from teuthology.orchestra.run import CommandFailedError, ConnectionLostError
 log = logging.getLogger(__name__)
 
 
+# Run on the client host by MountAgent: reads one JSON request per line
+# on stdin, performs it and writes one JSON reply per line on stdout.  A
+# request is either {"op": ..., <args>} or {"batch": [<request>, ...]},
+# with an optional "timeout" in seconds.
+#
+# The syscalls are made by a forked worker, so that one hung on a wedged
+# mount can be killed: it is killed, and ETIMEDOUT returned, when it does
+# not answer within the timeout, and killed when stdin closes, the way
+# daemon-helper kill would (which cannot wrap the agent itself, as it
+# keeps stdin for signals).
+AGENT_SCRIPT = dedent("""
+    import base64
+    import ctypes
+    import errno
+    import json
+    import os
+    import select
+    import signal
+    import sys
+    import time
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    STAT_ATTRS = ["st_mode", "st_ino", "st_dev", "st_nlink", "st_uid",
+                  "st_gid", "st_size", "st_atime", "st_mtime", "st_ctime"]
+
+    def check(ret):
+        if ret < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return ret
+
+    def stat_dict(s):
+        return dict([(a, getattr(s, a)) for a in STAT_ATTRS])
+
+    def do_stat(req):
+        return stat_dict(os.stat(req["path"]))
+
+    def do_lstat(req):
+        return stat_dict(os.lstat(req["path"]))
+
+    def do_walk(req):
+        root = req["path"]
+        stat = os.stat if req.get("follow_symlinks") else os.lstat
+        result = {}
+
+        def visit(path):
+            rel_path = os.path.relpath(path, root)
+            try:
+                result[rel_path] = stat_dict(stat(path))
+            except OSError as e:
+                result[rel_path] = {"errno": e.errno}
+
+        visit(root)
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in dirnames + filenames:
+                visit(os.path.join(dirpath, name))
+        return result
+
+    def do_listdir(req):
+        return sorted(os.listdir(req["path"]))
+
+    def c_str(s):
+        # json gives unicode, which ctypes would pass as a wchar_t*
+        if isinstance(s, unicode):
+            return s.encode("utf-8")
+        return s
+
+    def do_getxattr(req):
+        path, name = c_str(req["path"]), c_str(req["name"])
+        size = check(libc.getxattr(path, name, None, 0))
+        buf = ctypes.create_string_buffer(size)
+        size = check(libc.getxattr(path, name, buf, size))
+        return base64.b64encode(buf.raw[:size])
+
+    def do_setxattr(req):
+        path, name = c_str(req["path"]), c_str(req["name"])
+        value = base64.b64decode(req["value"])
+        check(libc.setxattr(path, name, value, len(value), 0))
+
+    def do_open(req):
+        f = open(req["path"], req.get("mode", "r"))
+        f.close()
+
+    def do_write(req):
+        fd = os.open(req["path"], os.O_WRONLY | os.O_CREAT, 0644)
+        try:
+            os.lseek(fd, req.get("offset", 0), os.SEEK_SET)
+            os.write(fd, base64.b64decode(req["data"]))
+            if req.get("fsync"):
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def do_fsync(req):
+        fd = os.open(req["path"], os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def do_create_n_files(req):
+        abs_path = req["path"]
+        if not os.path.exists(os.path.dirname(abs_path)):
+            os.makedirs(os.path.dirname(abs_path))
+        for i in range(0, req["count"]):
+            h = open("{0}_{1}".format(abs_path, i), 'w')
+            h.write('content')
+            if req.get("sync"):
+                h.flush()
+                os.fsync(h.fileno())
+            h.close()
+
+    OPS = {
+        "stat": do_stat,
+        "lstat": do_lstat,
+        "walk": do_walk,
+        "listdir": do_listdir,
+        "getxattr": do_getxattr,
+        "setxattr": do_setxattr,
+        "open": do_open,
+        "write": do_write,
+        "fsync": do_fsync,
+        "create_n_files": do_create_n_files,
+    }
+
+    def handle(req):
+        try:
+            return {"result": OPS[req["op"]](req)}
+        except (IOError, OSError) as e:
+            return {"errno": e.errno}
+
+    def serve(requests, replies):
+        for line in iter(requests.readline, ''):
+            req = json.loads(line)
+            if "batch" in req:
+                reply = {"batch": [handle(r) for r in req["batch"]]}
+            else:
+                reply = handle(req)
+            replies.write(json.dumps(reply) + "\\n")
+            replies.flush()
+
+    class Worker(object):
+        def __init__(self):
+            request_r, self.request_w = os.pipe()
+            self.reply_r, reply_w = os.pipe()
+            self.pid = os.fork()
+            if self.pid == 0:
+                os.close(self.request_w)
+                os.close(self.reply_r)
+                serve(os.fdopen(request_r), os.fdopen(reply_w, "w"))
+                os._exit(0)
+            os.close(request_r)
+            os.close(reply_w)
+
+        def request(self, line, timeout):
+            deadline = time.time() + timeout
+            while line:
+                left = deadline - time.time()
+                if left <= 0 or not select.select([], [self.request_w], [],
+                                                  left)[1]:
+                    return None, errno.ETIMEDOUT
+                written = os.write(self.request_w, line[:select.PIPE_BUF])
+                line = line[written:]
+            reply = ""
+            while not reply.endswith("\\n"):
+                left = deadline - time.time()
+                ready = []
+                if left > 0:
+                    ready = select.select([self.reply_r, sys.stdin], [], [],
+                                          left)[0]
+                if sys.stdin in ready:
+                    # nothing else is sent before the reply, so this is
+                    # stdin closing
+                    return None, None
+                if not ready:
+                    return None, errno.ETIMEDOUT
+                data = os.read(self.reply_r, 65536)
+                if not data:
+                    return None, errno.EIO
+                reply += data
+            return reply, None
+
+        def kill(self):
+            os.kill(self.pid, signal.SIGKILL)
+            os.close(self.request_w)
+            os.close(self.reply_r)
+            # a worker stuck in the kernel may never exit, so don't wait
+            os.waitpid(self.pid, os.WNOHANG)
+
+    worker = None
+    for line in iter(sys.stdin.readline, ''):
+        req = json.loads(line)
+        if worker is None:
+            worker = Worker()
+        reply, err = worker.request(line, req.get("timeout", 300))
+        if reply is None:
+            worker.kill()
+            worker = None
+            if err is None:
+                break
+            if "batch" in req:
+                reply = {"batch": [{"errno": err}] * len(req["batch"])}
+            else:
+                reply = {"errno": err}
+            reply = json.dumps(reply) + "\\n"
+        sys.stdout.write(reply)
+        sys.stdout.flush()
+    if worker is not None:
+        worker.kill()
+    """)
+
+
+class MountAgent(object):
+    """
+    A long-lived python process on the client host that performs
+    filesystem syscalls on behalf of ZbkcFSMount, so that each of them
+    costs a round trip on an existing channel rather than a new remote
+    python process.
+    """
+    def __init__(self, proc):
+        self.proc = proc
+
+    def request(self, req):
+        """
+        Send one request (or {"batch": [...]}) and return the decoded reply.
+        """
+        self.proc.stdin.write(json.dumps(req) + "\n")
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise ConnectionLostError(command="mount agent")
+        return json.loads(line)
+
+    def close(self):
+        self.proc.stdin.close()
+        try:
+            self.proc.wait()
+        except (CommandFailedError, ConnectionLostError):
+            pass
+
+
 class ZbkcFSMount(object):
     def __init__(self, test_dir, client_id, client_remote):
         """
@@ -29,6 +272,14 @@ class ZbkcFSMount(object):
 
         self.background_procs = []
 
+        self._agent = None
+        # Seconds the agent gives each request before failing it with
+        # ETIMEDOUT, e.g. when a syscall hangs on a wedged mount
+        self.agent_timeout = 300
+
+        # The filesystem mount() mounts when not given one
+        self.default_fs_name = None
+
     @property
     def mountpoint(self):
         return os.path.join(
@@ -129,6 +380,66 @@ class ZbkcFSMount(object):
             'sudo', 'adjust-ulimits', 'daemon-helper', 'kill', 'python', '-c', pyscript
         ], wait=False, stdin=run.PIPE, stdout=StringIO())
 
+    def _start_agent(self):
+        """
+        Start the process behind MountAgent.  Override this where
+        remote.run cannot stream stdin/stdout.
+        """
+        return self.client_remote.run(args=[
+            'sudo', 'adjust-ulimits', 'python', '-u', '-c', AGENT_SCRIPT
+        ], wait=False, stdin=run.PIPE, stdout=run.PIPE)
+
+    def _stop_agent(self):
+        if self._agent is not None:
+            self._agent.close()
+            self._agent = None
+
+    def _agent_request(self, req):
+        """
+        Send a request to the mount agent, starting it if necessary.  If
+        the agent went away (e.g. the client host was rebooted) it is
+        restarted and the request is sent once more.
+        """
+        req = dict(req, timeout=self.agent_timeout)
+        for attempt in (0, 1):
+            if self._agent is None:
+                self._agent = MountAgent(self._start_agent())
+            try:
+                return self._agent.request(req)
+            except (ConnectionLostError, IOError, EOFError):
+                self._agent = None
+                if attempt:
+                    raise
+
+    def _agent_result(self, op, path, **kwargs):
+        """
+        Run a single agent operation on path.
+
+        :return: the result of the operation
+        :raises: CommandFailedError with exitstatus set to the errno
+                 if the operation failed, ETIMEDOUT if it did not
+                 finish within agent_timeout seconds
+        """
+        req = dict(op=op, path=path, **kwargs)
+        reply = self._agent_request(req)
+        if "errno" in reply:
+            raise CommandFailedError("{0} {1}".format(op, path),
+                                     reply["errno"],
+                                     self.client_remote.name)
+        return reply["result"]
+
+    def _agent_batch(self, op, paths, **kwargs):
+        """
+        Run the same agent operation on several paths in one round trip.
+
+        :return: a list of replies, in the order of paths, each holding
+                 either "result" or "errno"
+        """
+        reply = self._agent_request({"batch": [
+            dict(op=op, path=path, **kwargs) for path in paths
+        ]})
+        return reply["batch"]
+
     def run_python(self, pyscript):
         p = self._run_python(pyscript)
         p.wait()
@@ -146,12 +457,7 @@ class ZbkcFSMount(object):
 
         path = os.path.join(self.mountpoint, basename)
 
-        p = self._run_python(dedent(
-            """
-            f = open("{path}", 'w')
-            """.format(path=path)
-        ))
-        p.wait()
+        self._agent_result("open", path, mode="w")
 
     def open_background(self, basename="background_file"):
         """
@@ -380,30 +686,11 @@ class ZbkcFSMount(object):
 
         abs_path = os.path.join(self.mountpoint, fs_path)
 
-        pyscript = dedent("""
-            import sys
-            import time
-            import os
-
-            n = {count}
-            abs_path = "{abs_path}"
-
-            if not os.path.exists(os.path.dirname(abs_path)):
-                os.makedirs(os.path.dirname(abs_path))
-
-            for i in range(0, n):
-                fname = "{{0}}_{{1}}".format(abs_path, i)
-                h = open(fname, 'w')
-                h.write('content')
-                if {sync}:
-                    h.flush()
-                    os.fsync(h.fileno())
-                h.close()
-            """).format(abs_path=abs_path, count=count, sync=str(sync))
-
-        self.run_python(pyscript)
+        self._agent_result("create_n_files", abs_path, count=count, sync=sync)
 
     def teardown(self):
+        self._stop_agent()
+
         for p in self.background_procs:
             log.info("Terminating background process")
             self._kill_background(p)
@@ -482,6 +769,9 @@ class ZbkcFSMount(object):
         """
         abs_path = os.path.join(self.mountpoint, fs_path)
 
+        if wait:
+            return self._agent_result("stat", abs_path)
+
         pyscript = dedent("""
             import os
             import stat
@@ -498,12 +788,7 @@ class ZbkcFSMount(object):
                 dict([(a, getattr(s, a)) for a in attrs]),
                 indent=2)
             """).format(path=abs_path)
-        proc = self._run_python(pyscript)
-        if wait:
-            proc.wait()
-            return json.loads(proc.stdout.getvalue().strip())
-        else:
-            return proc
+        return self._run_python(pyscript)
 
     def touch(self, fs_path):
         """
@@ -515,80 +800,85 @@ class ZbkcFSMount(object):
         :return:
         """
         abs_path = os.path.join(self.mountpoint, fs_path)
-        pyscript = dedent("""
-            import sys
-            import errno
-
-            try:
-                f = open("{path}", "w")
-                f.close()
-            except IOError as e:
-                sys.exit(errno.EIO)
-            """).format(path=abs_path)
-        proc = self._run_python(pyscript)
-        proc.wait()
+        self._agent_result("open", abs_path, mode="w")
 
     def path_to_ino(self, fs_path, follow_symlinks=True):
         abs_path = os.path.join(self.mountpoint, fs_path)
 
-        if follow_symlinks:
-            pyscript = dedent("""
-                import os
-                import stat
+        op = "stat" if follow_symlinks else "lstat"
+        return self._agent_result(op, abs_path)["st_ino"]
 
-                print os.stat("{path}").st_ino
-                """).format(path=abs_path)
-        else:
-            pyscript = dedent("""
-                import os
-                import stat
+    def stat_many(self, fs_paths, follow_symlinks=True):
+        """
+        stat several files in one go.
 
-                print os.lstat("{path}").st_ino
-                """).format(path=abs_path)
+        :return: a dict of path to a dictionary like the one stat() returns,
+                 or to {"errno": <errno>} for paths that could not be
+                 stat'd
+        """
+        op = "stat" if follow_symlinks else "lstat"
+        replies = self._agent_batch(
+            op, [os.path.join(self.mountpoint, p) for p in fs_paths])
+        return dict([(path, reply.get("result", reply))
+                     for path, reply in zip(fs_paths, replies)])
 
-        proc = self._run_python(pyscript)
-        proc.wait()
-        return int(proc.stdout.getvalue().strip())
+    def path_to_ino_many(self, fs_paths, follow_symlinks=True):
+        """
+        Look up the inode numbers of several paths in one go.
 
-    def path_to_nlink(self, fs_path):
-        abs_path = os.path.join(self.mountpoint, fs_path)
+        :return: a dict of path to inode number
+        :raises: CommandFailedError, with the errno of the first failed path
+                 as exitstatus, if any path could not be stat'd
+        """
+        stats = self.stat_many(fs_paths, follow_symlinks)
+        failed = [p for p in fs_paths if "errno" in stats[p]]
+        if failed:
+            raise CommandFailedError("stat {0}".format(" ".join(failed)),
+                                     stats[failed[0]]["errno"],
+                                     self.client_remote.name)
+        return dict([(p, s["st_ino"]) for p, s in stats.items()])
 
-        pyscript = dedent("""
-            import os
-            import stat
+    def walk_stat(self, fs_path="", follow_symlinks=False):
+        """
+        stat everything under a directory, including the directory itself.
 
-            print os.stat("{path}").st_nlink
-            """).format(path=abs_path)
+        :return: a dict of path relative to fs_path ("." for fs_path
+                 itself) to a dictionary like the one stat() returns, or
+                 to {"errno": <errno>} for entries that could not be stat'd
+        """
+        abs_path = os.path.join(self.mountpoint, fs_path)
+        return self._agent_result("walk", abs_path,
+                                  follow_symlinks=follow_symlinks)
+
+    def path_to_nlink(self, fs_path):
+        abs_path = os.path.join(self.mountpoint, fs_path)
 
-        proc = self._run_python(pyscript)
-        proc.wait()
-        return int(proc.stdout.getvalue().strip())
+        return self._agent_result("stat", abs_path)["st_nlink"]
 
     def ls(self, path=None):
         """
-        Wrap ls: return a list of strings
+        Like ls: return a sorted list of the names in a directory, without
+        the hidden ones, or just the path if it is not a directory.
         """
-        cmd = ["ls"]
-        if path:
-            cmd.append(path)
-
-        ls_text = self.run_shell(cmd).stdout.getvalue().strip()
+        abs_path = os.path.join(self.mountpoint, path or "")
+        try:
+            names = self._agent_result("listdir", abs_path)
+        except CommandFailedError as e:
+            if e.exitstatus != errno.ENOTDIR:
+                raise
+            return [path]
 
-        if ls_text:
-            return ls_text.split("\n")
-        else:
-            # Special case because otherwise split on empty string
-            # gives you [''] instead of []
-            return []
+        return [n for n in names if not n.startswith(".")]
 
     def getfattr(self, path, attr):
         """
-        Wrap getfattr: return the values of a named xattr on one file.
+        Like getfattr: return the values of a named xattr on one file.
 
         :return: a string
         """
-        p = self.run_shell(["getfattr", "--only-values", "-n", attr, path])
-        return p.stdout.getvalue()
+        abs_path = os.path.join(self.mountpoint, path)
+        return base64.b64decode(
+            self._agent_result("getxattr", abs_path, name=attr))
 
     def df(self):
         """
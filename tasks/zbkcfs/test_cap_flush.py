@@ -7,6 +7,8 @@ from tasks.zbkcfs.fuse_mount import FuseMount
 from tasks.zbkcfs.zbkcfs_test_case import ZbkcFSTestCase, for_teuthology
 
 class TestCapFlush(ZbkcFSTestCase):
+    PARALLEL_SAFE = True
+
     @for_teuthology
     def test_replay_create(self):
         """
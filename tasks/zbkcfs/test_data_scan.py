@@ -59,9 +59,7 @@ class Workload(object):
         default just wipe everything in the metadata pool
         """
         # Delete every object in the metadata pool
-        objects = self._filesystem.rados(["ls"]).split("\n")
-        for o in objects:
-            self._filesystem.rados(["rm", o])
+        self._filesystem.remove_objects(self._filesystem.list_objects())
 
     def flush(self):
         """
@@ -3,6 +3,8 @@ import random
 import os
 
 class TestDumpTree(ZbkcFSTestCase):
+    PARALLEL_SAFE = True
+
     def get_paths_to_ino(self):
         inos = {}
         p = self.mount_a.run_shell(["find", "./"])
@@ -5,6 +5,8 @@ from tasks.zbkcfs.filesystem import ObjectNotFound, ROOT_INO
 
 
 class TestFlush(ZbkcFSTestCase):
+    PARALLEL_SAFE = True
+
     def test_flush(self):
         self.mount_a.run_shell(["mkdir", "mydir"])
         self.mount_a.run_shell(["touch", "mydir/alpha"])
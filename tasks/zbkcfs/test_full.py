@@ -15,6 +15,7 @@ log = logging.getLogger(__name__)
 
 class FullnessTestCase(ZbkcFSTestCase):
     CLIENTS_REQUIRED = 2
+    REQUIRE_PRISTINE_FS = True
 
     # Subclasses define whether they're filling whole cluster or just data pool
     data_only = False
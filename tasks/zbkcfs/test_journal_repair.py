@@ -58,11 +58,14 @@ class TestJournalRepair(ZbkcFSTestCase):
 
         # Before we unmount, make a note of the inode numbers, later we will
         # check that they match what we recover from the journal
-        rootfile_ino = self.mount_a.path_to_ino("rootfile")
-        subdir_ino = self.mount_a.path_to_ino("subdir")
-        linkdir_ino = self.mount_a.path_to_ino("linkdir")
-        subdirfile_ino = self.mount_a.path_to_ino("subdir/subdirfile")
-        subsubdir_ino = self.mount_a.path_to_ino("subdir/subsubdir")
+        inos = self.mount_a.path_to_ino_many([
+            "rootfile", "subdir", "linkdir", "subdir/subdirfile",
+            "subdir/subsubdir"])
+        rootfile_ino = inos["rootfile"]
+        subdir_ino = inos["subdir"]
+        linkdir_ino = inos["linkdir"]
+        subdirfile_ino = inos["subdir/subdirfile"]
+        subsubdir_ino = inos["subdir/subsubdir"]
 
         self.mount_a.umount_wait()
 
@@ -127,16 +130,20 @@ class TestJournalRepair(ZbkcFSTestCase):
                          """).strip())
 
         # Check the correct inos were preserved by path
-        self.assertEqual(rootfile_ino, self.mount_a.path_to_ino("rootfile"))
-        self.assertEqual(subdir_ino, self.mount_a.path_to_ino("subdir"))
-        self.assertEqual(subdirfile_ino, self.mount_a.path_to_ino("subdir/subdirfile"))
-        self.assertEqual(subsubdir_ino, self.mount_a.path_to_ino("subdir/subsubdir"))
+        inos = self.mount_a.path_to_ino_many([
+            "rootfile", "subdir", "subdir/subdirfile", "subdir/subsubdir",
+            "linkdir/link0", "linkdir/link1", "linkdir/link2",
+            "linkdir/link3"])
+        self.assertEqual(rootfile_ino, inos["rootfile"])
+        self.assertEqual(subdir_ino, inos["subdir"])
+        self.assertEqual(subdirfile_ino, inos["subdir/subdirfile"])
+        self.assertEqual(subsubdir_ino, inos["subdir/subsubdir"])
 
         # Check that the hard link handling came out correctly
-        self.assertEqual(self.mount_a.path_to_ino("linkdir/link0"), subdirfile_ino)
-        self.assertEqual(self.mount_a.path_to_ino("linkdir/link1"), subdirfile_ino)
-        self.assertNotEqual(self.mount_a.path_to_ino("linkdir/link2"), subdirfile_ino)
-        self.assertEqual(self.mount_a.path_to_ino("linkdir/link3"), rootfile_ino)
+        self.assertEqual(inos["linkdir/link0"], subdirfile_ino)
+        self.assertEqual(inos["linkdir/link1"], subdirfile_ino)
+        self.assertNotEqual(inos["linkdir/link2"], subdirfile_ino)
+        self.assertEqual(inos["linkdir/link3"], rootfile_ino)
 
         # Create a new file, ensure it is not issued the same ino as one of the
         # recovered ones
@@ -6,6 +6,8 @@ log = logging.getLogger(__name__)
 
 
 class TestReadahead(ZbkcFSTestCase):
+    PARALLEL_SAFE = True
+
     def test_flush(self):
         if not isinstance(self.mount_a, FuseMount):
             self.skipTest("FUSE needed for measuring op counts")
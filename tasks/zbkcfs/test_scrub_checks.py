@@ -34,6 +34,7 @@ class TestScrubChecks(ZbkcFSTestCase):
 
     MDSS_REQUIRED = 1
     CLIENTS_REQUIRED = 1
+    PARALLEL_SAFE = True
 
     def test_scrub_checks(self):
         self._checks(0)
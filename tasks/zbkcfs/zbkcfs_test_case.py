@@ -1,5 +1,6 @@
 import json
 import logging
+import threading
 from unittest import case
 from tasks.zbkc_test_case import ZbkcTestCase
 import os
@@ -55,6 +56,28 @@ class ZbkcFSTestCase(ZbkcTestCase):
     # Whether to create the default filesystem during setUp
     REQUIRE_FILESYSTEM = True
 
+    # Whether the filesystem must be created from scratch, on new pools,
+    # rather than reset in place on the pools of the previous test's
+    # filesystem.  Set this for tests that modify pools (quotas, fullness)
+    # or that expect a freshly created OSD map.
+    REQUIRE_PRISTINE_FS = False
+
+    # Whether the test only touches its own filesystem, MDS daemons and
+    # mounts, so that it may run alongside other tests on a scoped()
+    # MDSCluster (see zbkcfs_test_runner's `workers` option).  Tests that
+    # change shared state (config, pools, OSDs, the firewall or the
+    # blacklist), or that wait on cluster-wide health, must leave this
+    # unset.
+    PARALLEL_SAFE = False
+
+    # Names of the filesystems left behind by setUp that may be reset in
+    # place.  Tests with REQUIRE_PRISTINE_FS remove theirs, so that the
+    # test after them does a full recreate too.
+    _reusable_fs_names = set()
+
+    # Serializes zbkc.conf updates made by concurrent setUps
+    _conf_lock = threading.Lock()
+
     LOAD_SETTINGS = []
 
     def setUp(self):
@@ -98,7 +121,13 @@ class ZbkcFSTestCase(ZbkcTestCase):
         for i in range(0, self.CLIENTS_REQUIRED):
             setattr(self, "mount_{0}".format(chr(ord('a') + i)), self.mounts[i])
 
-        self.mds_cluster.clear_firewall()
+        # On a scoped MDSCluster we share the cluster with other tests, so
+        # leave cluster-wide state alone and manage only our filesystem
+        fs_name = self.mds_cluster.fs_name
+        shared_cluster = fs_name is not None
+
+        if not shared_cluster:
+            self.mds_cluster.clear_firewall()
 
         # Unmount in order to start each test on a fresh mount, such
         # that test_barrier can have a firm expectation of what OSD
@@ -111,28 +140,30 @@ class ZbkcFSTestCase(ZbkcTestCase):
                 self.mount_b.umount_wait()
 
         # To avoid any issues with e.g. unlink bugs, we destroy and recreate
-        # the filesystem rather than just doing a rm -rf of files
+        # the filesystem rather than just doing a rm -rf of files.  Where
+        # possible the previous filesystem's pools are purged and reused,
+        # which spares us creating new pools.
         self.mds_cluster.mds_stop()
-        self.mds_cluster.delete_all_filesystems()
+        reusable_fs = None
+        if self.REQUIRE_FILESYSTEM and not self.REQUIRE_PRISTINE_FS:
+            reusable_fs = self._get_reusable_fs()
+        if reusable_fs is None:
+            self.mds_cluster.delete_all_filesystems()
         self.fs = None # is now invalid!
+        if self.REQUIRE_PRISTINE_FS:
+            ZbkcFSTestCase._reusable_fs_names.discard(fs_name or "zbkcfs")
+        else:
+            ZbkcFSTestCase._reusable_fs_names.add(fs_name or "zbkcfs")
 
-        # In case the previous filesystem had filled up the RADOS cluster, wait for that
-        # flag to pass.
-        osd_mon_report_interval_max = int(self.mds_cluster.get_config("osd_mon_report_interval_max", service_type='osd'))
-        self.wait_until_true(lambda: not self.mds_cluster.is_full(),
-                             timeout=osd_mon_report_interval_max * 5)
+        if reusable_fs is None and not shared_cluster:
+            # In case the previous filesystem had filled up the RADOS cluster, wait for that
+            # flag to pass.
+            osd_mon_report_interval_max = int(self.mds_cluster.get_config("osd_mon_report_interval_max", service_type='osd'))
+            self.wait_until_true(lambda: not self.mds_cluster.is_full(),
+                                 timeout=osd_mon_report_interval_max * 5)
 
-        # In case anything is in the OSD blacklist list, clear it out.  This is to avoid
-        # the OSD map changing in the background (due to blacklist expiry) while tests run.
-        try:
-            self.mds_cluster.mon_manager.raw_cluster_cmd("osd", "blacklist", "clear")
-        except CommandFailedError:
-            # Fallback for older Zbkc cluster
-            blacklist = json.loads(self.mds_cluster.mon_manager.raw_cluster_cmd("osd",
-                                  "dump", "--format=json-pretty"))['blacklist']
-            log.info("Removing {0} blacklist entries".format(len(blacklist)))
-            for addr, blacklisted_at in blacklist.items():
-                self.mds_cluster.mon_manager.raw_cluster_cmd("osd", "blacklist", "rm", addr)
+        if not shared_cluster:
+            self._clear_blacklist()
 
         client_mount_ids = [m.client_id for m in self.mounts]
         # In case the test changes the IDs of clients, stash them so that we can
@@ -141,14 +172,34 @@ class ZbkcFSTestCase(ZbkcTestCase):
         log.info(client_mount_ids)
 
         # In case there were any extra auth identities around from a previous
-        # test, delete them
-        for entry in self.auth_list():
-            ent_type, ent_id = entry['entity'].split(".")
-            if ent_type == "client" and ent_id not in client_mount_ids and ent_id != "admin":
-                self.mds_cluster.mon_manager.raw_cluster_cmd("auth", "del", entry['entity'])
+        # test, delete them (other tests' clients look just the same when
+        # we share the cluster)
+        if not shared_cluster:
+            for entry in self.auth_list():
+                ent_type, ent_id = entry['entity'].split(".")
+                if ent_type == "client" and ent_id not in client_mount_ids and ent_id != "admin":
+                    self.mds_cluster.mon_manager.raw_cluster_cmd("auth", "del", entry['entity'])
+
+        for mount in self.mounts:
+            mount.default_fs_name = fs_name
 
         if self.REQUIRE_FILESYSTEM:
-            self.fs = self.mds_cluster.newfs(True)
+            if reusable_fs is not None:
+                reusable_fs.reset()
+                self.fs = reusable_fs
+            else:
+                self.fs = self.mds_cluster.newfs(fs_name or True)
+
+            if shared_cluster:
+                # Keep our MDS daemons from being picked up by other tests'
+                # filesystems, and theirs from ours.  Until now ours were
+                # stopped, and so were those of workers that have not
+                # pinned theirs yet (see make_workers)
+                with self._conf_lock:
+                    for mds_id in self.mds_cluster.mds_ids:
+                        self.mds_cluster.set_zbkc_conf("mds.{0}".format(mds_id),
+                                                       "mds_standby_for_fscid",
+                                                       self.fs.id.__str__())
             self.fs.mds_restart()
 
             # In case some test messed with auth caps, reset them
@@ -178,10 +229,54 @@ class ZbkcFSTestCase(ZbkcTestCase):
 
         self.configs_set = set()
 
+    def _clear_blacklist(self):
+        # In case anything is in the OSD blacklist list, clear it out.  This is to avoid
+        # the OSD map changing in the background (due to blacklist expiry) while tests run.
+        try:
+            self.mds_cluster.mon_manager.raw_cluster_cmd("osd", "blacklist", "clear")
+        except CommandFailedError:
+            # Fallback for older Zbkc cluster
+            blacklist = json.loads(self.mds_cluster.mon_manager.raw_cluster_cmd("osd",
+                                  "dump", "--format=json-pretty"))['blacklist']
+            log.info("Removing {0} blacklist entries".format(len(blacklist)))
+            for addr, blacklisted_at in blacklist.items():
+                self.mds_cluster.mon_manager.raw_cluster_cmd("osd", "blacklist", "rm", addr)
+
+    def _get_reusable_fs(self):
+        """
+        Get the filesystem left by the previous test if it can be reset in
+        place (see Filesystem.reset): it must be the only filesystem (or on
+        a scoped MDSCluster, the only one of its name), be on its usual
+        pools, and the cluster must not be full.
+
+        :return: a Filesystem, or None if a full recreate is needed
+        """
+        fs_name = self.mds_cluster.fs_name or "zbkcfs"
+        if fs_name not in ZbkcFSTestCase._reusable_fs_names:
+            return None
+
+        fss = list(self.mds_cluster.status().get_filesystems())
+        if self.mds_cluster.fs_name is not None:
+            fss = [fs for fs in fss if fs['mdsmap']['fs_name'] == fs_name]
+        if len(fss) != 1:
+            return None
+        mds_map = fss[0]['mdsmap']
+        if mds_map['fs_name'] != fs_name or len(mds_map['data_pools']) != 1:
+            return None
+        if self.mds_cluster.is_full():
+            return None
+
+        fs = self.mds_cluster.get_filesystem(fss[0]['id'])
+        if fs.metadata_pool_name != "{0}_metadata".format(fs_name) or \
+                fs.get_data_pool_name() != "{0}_data".format(fs_name):
+            return None
+        return fs
+
     def tearDown(self):
         super(ZbkcFSTestCase, self).tearDown()
 
-        self.mds_cluster.clear_firewall()
+        if self.mds_cluster.fs_name is None:
+            self.mds_cluster.clear_firewall()
         for m in self.mounts:
             m.teardown()
 
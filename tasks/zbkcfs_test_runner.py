@@ -1,12 +1,17 @@
 import contextlib
+import json
 import logging
 import os
+import time
 import unittest
+from collections import OrderedDict
 from unittest import suite, loader, case
 from teuthology.task import interactive
 from teuthology import misc
+from teuthology.parallel import parallel
 from tasks.zbkcfs.filesystem import Filesystem, MDSCluster, ZbkcCluster
 from tasks.mgr.mgr_test_case import MgrCluster
+from tasks.util.wait import report_wait_stats
 
 log = logging.getLogger(__name__)
 
@@ -56,6 +61,263 @@ class LogStream(object):
         pass
 
 
+class TestHistory(object):
+    """
+    Duration and outcome of the last run of each test, kept in a small
+    JSON file, so that later runs can choose a useful order: tests that
+    failed last time first (so that failfast runs surface regressions
+    early), then tests never run before, then the rest shortest first.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.tests = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.tests = json.load(f)
+            except ValueError:
+                log.warning("Ignoring unreadable test history {0}".format(path))
+
+    def record(self, test_id, duration, passed):
+        self.tests[test_id] = {"duration": duration, "passed": passed}
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.tests, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def expected_duration(self, test_suite):
+        """
+        :return: seconds the tests of a suite took last time, counting 0
+                 for tests without history
+        """
+        return sum(self.tests.get(t.id(), {}).get("duration", 0)
+                   for t in test_suite)
+
+    def sort_key(self, test_id):
+        entry = self.tests.get(test_id)
+        if entry is None:
+            return 1, 0
+        elif not entry["passed"]:
+            return 0, entry["duration"]
+        else:
+            return 2, entry["duration"]
+
+    def order(self, test_suite):
+        """
+        Reorder a suite according to the history.  Tests stay grouped by
+        class; each class goes where its most urgent test would.
+
+        :return: a new TestSuite
+        """
+        class_tests = []
+        for cls, class_suite in split_by_class(test_suite):
+            class_tests_sorted = sorted(
+                class_suite, key=lambda t: self.sort_key(t.id()))
+            class_tests.append(class_tests_sorted)
+        class_tests.sort(key=lambda group: (self.sort_key(group[0].id())[0],
+                                            self.expected_duration(group)))
+        return suite.TestSuite([suite.TestSuite(group)
+                                for group in class_tests])
+
+
+class TimingResultMixin(object):
+    """
+    Mixin for TestResult classes that records each test's duration and
+    outcome in a TestHistory (if the `history` class attribute is set).
+    """
+    history = None
+
+    def startTest(self, test):
+        self._started_at = time.time()
+        self._bad_before = len(self.failures) + len(self.errors)
+        self._skipped_before = len(self.skipped)
+        return super(TimingResultMixin, self).startTest(test)
+
+    def stopTest(self, test):
+        duration = time.time() - self._started_at
+        if self.history is not None and len(self.skipped) == self._skipped_before:
+            passed = len(self.failures) + len(self.errors) == self._bad_before
+            self.history.record(test.id(), duration, passed)
+        return super(TimingResultMixin, self).stopTest(test)
+
+
+class TestWorker(object):
+    """
+    One worker's share of the cluster for running tests concurrently with
+    other workers: a scoped MDSCluster (so its own filesystem and MDS
+    daemons) and its own mounts.
+    """
+    def __init__(self, name, mds_cluster, mounts):
+        self.name = name
+        self.mds_cluster = mds_cluster
+        self.mounts = mounts
+
+    def can_run(self, test_class):
+        return (getattr(test_class, "PARALLEL_SAFE", False) and
+                test_class.REQUIRE_FILESYSTEM and
+                test_class.MDSS_REQUIRED <= len(self.mds_cluster.mds_ids) and
+                test_class.CLIENTS_REQUIRED <= len(self.mounts))
+
+    def adopt(self, test_class):
+        """
+        Point a test class at this worker's share of the cluster.
+        """
+        test_class.mds_cluster = self.mds_cluster
+        test_class.mounts = self.mounts
+        test_class.fs = None
+
+
+def make_workers(mds_cluster, mounts, count):
+    """
+    Divide the MDS daemons and mounts between up to `count` workers, each
+    of which will get its own filesystem.
+
+    The MDS daemons are stopped and any filesystem removed: a worker
+    starts its own daemons again only once it has pinned them to its
+    filesystem, so that daemons of a worker that has not got that far
+    cannot take over another worker's new filesystem.
+
+    :return: list of TestWorker, empty if there are not enough MDS daemons
+             and mounts for at least two workers
+    """
+    count = min(count, len(mds_cluster.mds_ids), len(mounts))
+    if count < 2:
+        return []
+
+    mds_cluster.mon_manager.raw_cluster_cmd("fs", "flag", "set",
+                                            "enable_multiple", "true",
+                                            "--yes-i-really-mean-it")
+    mds_cluster.mds_stop()
+    mds_cluster.delete_all_filesystems()
+
+    mds_ids = sorted(mds_cluster.mds_ids)
+    mounts_each = len(mounts) / count
+    workers = []
+    for i in range(0, count):
+        name = "zbkcfs_w{0}".format(i)
+        workers.append(TestWorker(
+            name,
+            mds_cluster.scoped(mds_ids[i::count], name),
+            mounts[i * mounts_each:(i + 1) * mounts_each]))
+    return workers
+
+
+def finish_workers(mds_cluster, workers):
+    """
+    Remove the workers' filesystems and MDS pinning, and turn
+    enable_multiple off again, leaving all the MDS daemons running as
+    standbys for whatever runs next.
+    """
+    for worker in workers:
+        for mount in worker.mounts:
+            if mount.is_mounted():
+                mount.umount_wait()
+            mount.default_fs_name = None
+        worker.mds_cluster.mds_stop()
+        worker.mds_cluster.delete_all_filesystems()
+        for mds_id in worker.mds_cluster.mds_ids:
+            try:
+                mds_cluster.clear_zbkc_conf("mds.{0}".format(mds_id), "mds_standby_for_fscid")
+            except KeyError:
+                # Never pinned: the worker did not get to run a test
+                pass
+    mds_cluster.mon_manager.raw_cluster_cmd("fs", "flag", "set",
+                                            "enable_multiple", "false")
+    mds_cluster.mds_restart()
+
+
+def split_by_class(test_suite):
+    """
+    :return: list of (test class, suite of its tests), in the order the
+             classes first appear in test_suite
+    """
+    by_class = OrderedDict()
+
+    def walk(s):
+        for test in s:
+            if isinstance(test, suite.BaseTestSuite):
+                walk(test)
+            else:
+                by_class.setdefault(test.__class__, []).append(test)
+
+    walk(test_suite)
+    return [(cls, suite.TestSuite(tests)) for cls, tests in by_class.items()]
+
+
+def run_tests(overall_suite, run_suite, mds_cluster, workers, history=None):
+    """
+    Run a suite, spreading the test classes that the workers can run over
+    the workers concurrently, then (once the workers are finished with,
+    see finish_workers) running the remaining classes one after the other
+    on the whole cluster.  As with failfast, nothing new is started once
+    a class has failed.
+
+    :param run_suite: callable that runs a suite and returns its TestResult
+    :param workers: list of TestWorker
+    :param history: optional TestHistory; the workers then take the
+                    longest classes first, which balances their load best
+    :return: list of TestResult, one per class run
+    """
+    classes = split_by_class(overall_suite)
+    results = []
+
+    def failed():
+        return any(not r.wasSuccessful() for r in results)
+
+    parallel_classes = [(cls, s) for cls, s in classes
+                        if any(w.can_run(cls) for w in workers)]
+    if history is not None:
+        parallel_classes.sort(key=lambda c: history.expected_duration(c[1]),
+                              reverse=True)
+    serial_classes = [(cls, s) for cls, s in classes
+                      if not any(w.can_run(cls) for w in workers)]
+
+    def worker_loop(worker):
+        while not failed():
+            runnable = [c for c in parallel_classes if worker.can_run(c[0])]
+            if not runnable:
+                return
+            cls, class_suite = runnable[0]
+            parallel_classes.remove(runnable[0])
+            log.info("Worker {0} running {1}".format(worker.name, cls.__name__))
+            worker.adopt(cls)
+            results.append(run_suite(class_suite))
+
+    try:
+        if parallel_classes:
+            log.info("Running {0} test classes on {1} workers".format(
+                len(parallel_classes), len(workers)))
+            with parallel() as p:
+                for worker in workers:
+                    p.spawn(worker_loop, worker)
+    finally:
+        finish_workers(mds_cluster, workers)
+
+    for cls, class_suite in serial_classes:
+        if failed():
+            break
+        results.append(run_suite(class_suite))
+
+    return results
+
+
+def merge_results(results, merged):
+    """
+    Gather the outcome of several TestResults into `merged`, so that they
+    can be reported as one run.
+    """
+    for result in results:
+        merged.testsRun += result.testsRun
+        merged.failures.extend(result.failures)
+        merged.errors.extend(result.errors)
+        merged.skipped.extend(result.skipped)
+        merged.expectedFailures.extend(result.expectedFailures)
+        merged.unexpectedSuccesses.extend(result.unexpectedSuccesses)
+    return merged
+
+
 class InteractiveFailureResult(unittest.TextTestResult):
     """
     Specialization that implements interactive-on-error style
@@ -104,6 +366,18 @@ def task(ctx, config):
                 - tasks.zbkcfs.test_sessionmap
                 - tasks.zbkcfs.test_auto_repair
 
+    `history` names a JSON file on the teuthology host where each test's
+    duration and outcome are recorded.  When it is set, tests that failed last
+    time run first, then new tests, then the rest shortest first, and the
+    parallel workers (see below) are balanced using the recorded durations:
+
+    ::
+
+        tasks:
+            ...
+          - zbkcfs_test_runner:
+              history: /home/teuthworker/zbkcfs_test_history.json
+
     By default, any cases that can't be run on the current cluster configuration
     will generate a failure.  When the optional `fail_on_skip` argument is set
     to false, any tests that can't be run on the current configuration will
@@ -115,6 +389,17 @@ def task(ctx, config):
          - zbkcfs_test_runner:
            fail_on_skip: false
 
+    When the cluster has spare MDS and client roles, `workers` divides them
+    between that many workers, each with its own filesystem, and runs the
+    test classes marked PARALLEL_SAFE on the workers concurrently.  The
+    other classes then run one after the other on the whole cluster:
+
+    ::
+        tasks:
+            ...
+         - zbkcfs_test_runner:
+           workers: 2
+
     """
 
     zbkc_cluster = ZbkcCluster(ctx)
@@ -170,13 +455,18 @@ def task(ctx, config):
             )
         )
 
+    history = None
+    if config and config.get('history'):
+        history = TestHistory(config['history'])
+        overall_suite = history.order(overall_suite)
+
     if ctx.config.get("interactive-on-error", False):
         InteractiveFailureResult.ctx = ctx
         result_class = InteractiveFailureResult
     else:
         result_class = unittest.TextTestResult
 
-    class LoggingResult(result_class):
+    class LoggingResult(TimingResultMixin, result_class):
         def startTest(self, test):
             log.info("Starting test: {0}".format(self.getDescription(test)))
             return super(LoggingResult, self).startTest(test)
@@ -188,12 +478,32 @@ def task(ctx, config):
             else:
                 super(LoggingResult, self).addSkip(test, reason)
 
+    def run_suite(test_suite):
+        return unittest.TextTestRunner(
+            stream=LogStream(),
+            resultclass=LoggingResult,
+            verbosity=2,
+            failfast=True).run(test_suite)
+
+    LoggingResult.history = history
+
     # Execute!
-    result = unittest.TextTestRunner(
-        stream=LogStream(),
-        resultclass=LoggingResult,
-        verbosity=2,
-        failfast=True).run(overall_suite)
+    workers = []
+    if mds_cluster is not None:
+        workers = make_workers(mds_cluster, mounts, config.get('workers', 1))
+    try:
+        if workers:
+            results = run_tests(overall_suite, run_suite, mds_cluster, workers,
+                                history=history)
+            result = merge_results(results, LoggingResult(
+                unittest.runner._WritelnDecorator(LogStream()), True, 2))
+        else:
+            result = run_suite(overall_suite)
+    finally:
+        zbkc_cluster.mon_manager.stop_watching()
+        if history is not None:
+            history.save()
+        report_wait_stats(ctx.summary)
 
     if not result.wasSuccessful():
         result.printErrors()  # duplicate output at end for convenience